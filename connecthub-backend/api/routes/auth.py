@@ -1,113 +1,131 @@
-from fastapi import APIRouter, HTTPException, Depends, Response, status
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
 from fastapi.security import HTTPBearer
 from typing import Dict, Any
 from schemas.user import UserLogin, UserRegister, UserCreate
-from auth.session import hash_password, verify_password, create_session, delete_session
+from auth.session import create_session, delete_session
+from auth.passwords import hash_password, verify_password, needs_rehash
 from auth.middleware import get_current_user
 from database import get_db
+from profile_cache import invalidate_profile
 from datetime import datetime
+import asyncpg
 
 router = APIRouter()
 security = HTTPBearer()
 
-def get_user_by_username(username: str):
+async def get_user_by_username(username: str):
     """Get user by username"""
-    with get_db() as cursor:
-        cursor.execute("""
+    async with get_db() as conn:
+        return await conn.fetchrow("""
             SELECT id, username, password_hash, first_name, last_name, email, birthday, 
                    gender, age, bio, interests, photos, photo_url, distance, 
                    latitude, longitude, city, is_active, last_seen, created_at, 
                    updated_at, is_verified, report_count, is_premium
-            FROM users WHERE username = %s
-        """, (username,))
-        return cursor.fetchone()
+            FROM users WHERE username = $1
+        """, username)
 
 @router.post("/register")
 async def register(user_data: UserRegister, response: Response):
     """Register a new user"""
-    with get_db() as cursor:
-        # Check if username or email already exists
-        cursor.execute("SELECT id FROM users WHERE username = %s OR email = %s", 
-                      (user_data.username, user_data.email))
-        if cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Username or email already exists"
-            )
-        
-        # Calculate age from birthday
-        if isinstance(user_data.birthday, str):
-            birth_date = datetime.fromisoformat(user_data.birthday.replace('Z', '+00:00'))
-        else:
-            birth_date = user_data.birthday
-        age = datetime.now().year - birth_date.year
-        
-        # Hash password
-        password_hash = hash_password(user_data.password)
-        
-        # Handle location data
-        location_data = {}
-        if user_data.location:
-            location_data = {
-                'latitude': user_data.location.latitude,
-                'longitude': user_data.location.longitude,
-                'city': user_data.location.city
-            }
-        
-        # Insert user
-        cursor.execute("""
-            INSERT INTO users (username, password_hash, first_name, last_name, email, 
-                             birthday, gender, age, bio, interests, photos, latitude, longitude, city)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id
-        """, (
-            user_data.username, password_hash, user_data.first_name, user_data.last_name,
-            user_data.email, user_data.birthday, user_data.gender,
-            age, user_data.bio, user_data.interests, user_data.photos,
-            location_data.get('latitude'), location_data.get('longitude'), location_data.get('city')
-        ))
-        
-        user_id = cursor.fetchone()['id']
-        
-        # Create default settings
-        cursor.execute("""
-            INSERT INTO user_settings (user_id, max_distance, age_min, age_max)
-            VALUES (%s, %s, %s, %s)
-        """, (user_id, 50, 18, 35))
-        
-        # Create session
-        session_token = create_session(user_id)
-        
-        # Set cookie
-        response.set_cookie(
-            key="session_token",
-            value=session_token,
-            httponly=True,
-            secure=True,
-            samesite="none",
-            max_age=7 * 24 * 60 * 60,
-            path="/"
+    # Check if username or email already exists
+    async with get_db() as conn:
+        existing = await conn.fetchval("SELECT id FROM users WHERE username = $1 OR email = $2", 
+                                       user_data.username, user_data.email)
+    if existing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username or email already exists"
         )
-        
-        return {
-            "success": True, 
-            "message": "User registered successfully",
-            "session_token": session_token
+    
+    # Calculate age from birthday
+    if isinstance(user_data.birthday, str):
+        birth_date = datetime.fromisoformat(user_data.birthday.replace('Z', '+00:00'))
+    else:
+        birth_date = user_data.birthday
+    age = datetime.now().year - birth_date.year
+    
+    # Hash password before taking a connection, so the bcrypt work doesn't
+    # hold one (and an open transaction) out of the pool
+    password_hash = await hash_password(user_data.password)
+    
+    # Handle location data
+    location_data = {}
+    if user_data.location:
+        location_data = {
+            'latitude': user_data.location.latitude,
+            'longitude': user_data.location.longitude,
+            'city': user_data.location.city
         }
+    
+    try:
+        async with get_db() as conn:
+            # Insert user
+            user_id = await conn.fetchval("""
+                INSERT INTO users (username, password_hash, first_name, last_name, email, 
+                                 birthday, gender, age, bio, interests, photos, latitude, longitude, city)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)
+                RETURNING id
+            """,
+                user_data.username, password_hash, user_data.first_name, user_data.last_name,
+                user_data.email, user_data.birthday, user_data.gender,
+                age, user_data.bio, user_data.interests, user_data.photos,
+                location_data.get('latitude'), location_data.get('longitude'), location_data.get('city')
+            )
+            
+            # Create default settings
+            await conn.execute("""
+                INSERT INTO user_settings (user_id, max_distance, age_min, age_max)
+                VALUES ($1, $2, $3, $4)
+            """, user_id, 50, 18, 35)
+    except asyncpg.UniqueViolationError:
+        # Taken by a concurrent registration while the password was hashing
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username or email already exists"
+        )
+    
+    # Make sure no stale profile is cached under the new id
+    await invalidate_profile(user_id)
+    
+    # Create session
+    session_token = await create_session(user_id)
+    
+    # Set cookie
+    response.set_cookie(
+        key="session_token",
+        value=session_token,
+        httponly=True,
+        secure=True,
+        samesite="none",
+        max_age=7 * 24 * 60 * 60,
+        path="/"
+    )
+    
+    return {
+        "success": True, 
+        "message": "User registered successfully",
+        "session_token": session_token
+    }
 
 @router.post("/login")
 async def login(credentials: UserLogin, response: Response):
     """Login user"""
-    user = get_user_by_username(credentials.username)
+    user = await get_user_by_username(credentials.username)
     
-    if not user or not verify_password(credentials.password, user['password_hash']):
+    if not user or not await verify_password(credentials.password, user['password_hash']):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
         )
     
+    # Upgrade the stored hash if the configured work factor changed
+    if needs_rehash(user['password_hash']):
+        password_hash = await hash_password(credentials.password)
+        async with get_db() as conn:
+            await conn.execute("UPDATE users SET password_hash = $1 WHERE id = $2", password_hash, user['id'])
+    
     # Create session
-    session_token = create_session(user['id'])
+    session_token = await create_session(user['id'])
     
     # Set cookie
     response.set_cookie(
@@ -128,12 +146,12 @@ async def login(credentials: UserLogin, response: Response):
 
 @router.post("/logout")
 async def logout(
+    request: Request,
     response: Response,
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
     """Logout user"""
-    # Get session token from request (this would need to be extracted from the middleware)
-    # For now, we'll clear the cookie
+    await delete_session(request.state.session_token)
     response.delete_cookie("session_token")
     
     return {"success": True, "message": "Logout successful"}
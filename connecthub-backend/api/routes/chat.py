@@ -1,63 +1,170 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional, Dict, Any
-from schemas.chat import ChatMessage, ChatMessageCreate
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Literal, Optional, Dict, Any
+from schemas.chat import ChatMessage, ChatMessageCreate, ReadReceipt
 from auth.middleware import get_current_user
 from database import get_db
+from pagination import encode_cursor, decode_cursor
+from fast_json import json_array, json_page, json_success
+from inbox import apply_messages_sql
+from read_receipts import advance_cursors, get_cursor
+from message_archive import rehydrate
+from recent_messages import CHAT_RECENT_SIZE, RecentMessage, cache_cursors, load_recent, push_recent, read_recent
 from datetime import datetime
+import json
 import uuid
 
 router = APIRouter()
 
-def get_chat_messages(match_id: str, limit: int = None, before: str = None):
-    with get_db() as cursor:
-        query = "SELECT * FROM messages WHERE match_id = %s"
-        params = [match_id]
-        
-        if before:
-            query += " AND sent_at < (SELECT sent_at FROM messages WHERE id = %s)"
-            params.append(before)
-        
-        query += " ORDER BY sent_at DESC"
-        
-        if limit:
-            query += f" LIMIT {limit}"
-        
-        cursor.execute(query, params)
-        messages = []
-        for row in cursor.fetchall():
-            msg_dict = dict(row)
-            messages.append(ChatMessage(**msg_dict))
-        return list(reversed(messages))
-
-def create_message(match_id: str, from_user_id: int, text: str):
-    with get_db() as cursor:
-        cursor.execute("""
-            INSERT INTO messages (match_id, from_user_id, text) 
-            VALUES (%s, %s, %s) RETURNING *
-        """, (match_id, from_user_id, text))
-        row = cursor.fetchone()
+CHAT_HISTORY_MAX_LIMIT = 100
+
+# Renders a messages row m like schemas.chat.ChatMessage; $1 is the viewing
+# user. Status comes from the recipient's inbox cursors r (read_receipts.py).
+MESSAGE_JSON_SQL = """json_build_object(
+    'text', m.text, 'id', m.id, 'match_id', m.match_id, 'from_user_id', m.from_user_id,
+    'is_from_current_user', m.from_user_id = $1, 'sent_at', m.sent_at,
+    'status', CASE WHEN (m.sent_at, m.id) <= (r.read_through_at, r.read_through_id) THEN 'read'
+                   WHEN (m.sent_at, m.id) <= (r.delivered_through_at, r.delivered_through_id) THEN 'delivered'
+                   ELSE m.status END
+)"""
+
+# The recipients' cursors MESSAGE_JSON_SQL reads, for rendering cached messages
+RECEIPT_CURSORS_SQL = """
+    SELECT user_id, delivered_through_at, delivered_through_id, read_through_at, read_through_id
+    FROM inbox WHERE match_id = $1
+"""
+
+def message_json(message: RecentMessage, match_id: str, current_user_id: int, cursors) -> str:
+    """A cached message rendered like MESSAGE_JSON_SQL"""
+    message_id, from_user_id, sent_at, text, status = message
+    position = (sent_at, message_id)
+    for r in cursors:
+        if r["user_id"] == from_user_id:
+            continue
+        if r["read_through_at"] is not None and position <= (r["read_through_at"], r["read_through_id"]):
+            status = "read"
+        elif r["delivered_through_at"] is not None and position <= (r["delivered_through_at"], r["delivered_through_id"]):
+            status = "delivered"
+    return json.dumps({
+        "text": text, "id": message_id, "match_id": match_id, "from_user_id": from_user_id,
+        "is_from_current_user": from_user_id == current_user_id, "sent_at": sent_at.isoformat(),
+        "status": status,
+    })
+
+async def get_chat_messages(match_id: str, current_user_id: int, limit: int = 50, cursor: str = None, direction: str = "older", conn=None):
+    """Page through a match's messages by (sent_at, id).
+
+    ``older`` walks back from the cursor (the newest messages when there is
+    none), ``newer`` walks forward from it (the start of the conversation when
+    there is none). Returns the page in chronological order as a JSON array,
+    plus the cursor to continue in the same direction. Both directions are a
+    single range scan on idx_messages_match_sent_at, so deep pages cost the
+    same as the first.
+    """
+    newer = direction == "newer"
+    params = [current_user_id, match_id]
+    query = f"""
+        SELECT m.id, m.sent_at, {MESSAGE_JSON_SQL} AS message
+        FROM messages m LEFT JOIN inbox r ON r.match_id = $2 AND r.user_id <> m.from_user_id
+        WHERE m.match_id = $2
+    """
+    if cursor:
+        sent_at, message_id = decode_cursor(cursor)
+        params += [sent_at, str(uuid.UUID(message_id))]
+        query += f" AND (m.sent_at, m.id) {'>' if newer else '<'} ($3, $4::uuid)"
+    order = "ASC" if newer else "DESC"
+    params.append(limit + 1)
+    query += f" ORDER BY m.sent_at {order}, m.id {order} LIMIT ${len(params)}"
+
+    async with get_db(conn) as conn:
+        rows = await conn.fetch(query, *params)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if rows and (has_more or newer):
+        # Newer pages always hand back a cursor so clients can poll for new messages
+        last = rows[-1]
+        next_cursor = encode_cursor(last['sent_at'], last['id'])
+    if not newer:
+        rows.reverse()
+    return json_array(row['message'] for row in rows), next_cursor, has_more
+
+async def get_latest_messages(match_id: str, current_user_id: int, limit: int = 50, conn=None):
+    """The newest page of a match, from the recent message cache when it can.
+
+    Returns what get_chat_messages does. On a cache miss the newest messages and the receipt cursors
+    are read once and cached for the next reader, so a hit on both needs no
+    query.
+
+    Archiving drops the cached page, so only a miss or an empty page (cached
+    after the messages were archived) checks for an archive to rehydrate.
+    """
+    cached = await read_recent(match_id, limit)
+    if (cached is None or not cached[0]) and await rehydrate(match_id):
+        cached = None
+    if cached is None and limit > CHAT_RECENT_SIZE:
+        return await get_chat_messages(match_id, current_user_id, limit, conn=conn)
+    recent, has_more, cursors = cached or (None, False, None)
+    if cursors is None:
+        async with get_db(conn) as conn:
+            if recent is None:
+                loaded, has_more = await load_recent(match_id, conn)
+                recent, has_more = loaded[:limit], has_more or len(loaded) > limit
+            cursors = await conn.fetch(RECEIPT_CURSORS_SQL, match_id)
+        await cache_cursors(match_id, cursors)
+    next_cursor = None
+    if has_more:
+        oldest = recent[-1]
+        next_cursor = encode_cursor(oldest[2], oldest[0])
+    messages = json_array(message_json(m, match_id, current_user_id, cursors) for m in reversed(recent))
+    return messages, next_cursor, has_more
+
+async def create_message(match_id: str, from_user_id: int, text: str, conn=None):
+    async with get_db(conn) as conn:
+        row = await conn.fetchrow(f"""
+            WITH inserted AS (
+                INSERT INTO messages (match_id, from_user_id, text) 
+                VALUES ($1, $2, $3) RETURNING *
+            ), inbox_update AS (
+                {apply_messages_sql("inserted")}
+            )
+            SELECT * FROM inserted
+        """, match_id, from_user_id, text)
         msg_dict = dict(row)
         return ChatMessage(**msg_dict)
 
-def update_match_last_message(match_id: str, message_id: str):
-    with get_db() as cursor:
-        cursor.execute("""
-            UPDATE matches SET last_message_id = %s WHERE id = %s
-        """, (message_id, match_id))
+async def update_match_last_message(match_id: str, message_id: str, conn=None):
+    async with get_db(conn) as conn:
+        await conn.execute("""
+            UPDATE matches SET last_message_id = $1 WHERE id = $2
+        """, message_id, match_id)
 
 @router.get("/{match_id}/messages")
 async def get_chat_history(
     match_id: str,
-    limit: Optional[int] = 50,
-    before: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=CHAT_HISTORY_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    direction: Literal["older", "newer"] = "older",
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
-    """Get chat history for a match"""
-    messages = get_chat_messages(match_id, limit, before)
-    # Set is_from_current_user for each message
-    for message in messages:
-        message.is_from_current_user = message.from_user_id == current_user["id"]
-    return {"success": True, "data": messages}
+    """Get chat history for a match.
+
+    Reading history doesn't mark anything read; clients report that with
+    POST /{match_id}/read or the socket ``mark_read`` event.
+    """
+    try:
+        match_id = str(uuid.UUID(match_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid match id")
+    if cursor is None and direction == "older":
+        messages, next_cursor, has_more = await get_latest_messages(match_id, current_user["id"], limit)
+        return json_success(json_page(messages, next_cursor, has_more))
+    await rehydrate(match_id)
+    try:
+        messages, next_cursor, has_more = await get_chat_messages(match_id, current_user["id"], limit, cursor, direction)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return json_success(json_page(messages, next_cursor, has_more))
 
 @router.post("/{match_id}/messages")
 async def send_message(
@@ -67,13 +174,32 @@ async def send_message(
 ):
     """Send a message in a chat"""
     
-    # Create message
-    new_message = create_message(match_id, current_user["id"], message_data.text)
+    async with get_db() as conn:
+        # Create message
+        new_message = await create_message(match_id, current_user["id"], message_data.text, conn)
+        
+        # Update match last_message_id
+        await update_match_last_message(match_id, new_message.id, conn)
+    await push_recent([new_message.model_dump()])
     
     # Set is_from_current_user for the new message
     new_message.is_from_current_user = True
     
-    # Update match last_message_id
-    update_match_last_message(match_id, new_message.id)
-    
-    return {"success": True, "data": new_message}
\ No newline at end of file
+    return {"success": True, "data": new_message}
+
+@router.post("/{match_id}/read")
+async def mark_read(
+    match_id: str,
+    receipt: ReadReceipt,
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    """Mark a conversation delivered or read up to a message"""
+    try:
+        match_id, message_id = str(uuid.UUID(match_id)), str(uuid.UUID(receipt.message_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid match or message id")
+    rows = await advance_cursors([(match_id, current_user["id"], message_id, receipt.status == "read")])
+    cursor = rows[0] if rows else await get_cursor(current_user["id"], match_id)
+    if cursor is None:
+        raise HTTPException(status_code=404, detail="Match not found")
+    return {"success": True, "data": dict(cursor)}
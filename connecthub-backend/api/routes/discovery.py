@@ -1,76 +1,219 @@
 from fastapi import APIRouter, Query, Depends
-from typing import List, Optional, Dict, Any
-from schemas.user import User
+from typing import List, Optional, Dict, Any, Tuple
+from redis.exceptions import RedisError
 from auth.middleware import get_current_user
 from database import get_db
+from fast_json import user_json_sql, json_success
+from presence import get_online_users
+from swipe_exclusions import EXCLUSION_FILTER_SQL, exclusion_join
+from discovery_deck import (
+    DISCOVERY_DECK_SIZE, DISCOVERY_DECK_REFILL_THRESHOLD, deck_signature, pop_candidates,
+    store_deck, acquire_refill_lock, release_refill_lock
+)
 from datetime import datetime
+import asyncio
+import json
+import logging
 import math
+import os
+
+try:
+    import ranking
+except ImportError:
+    # NumPy is the optional "ranking" extra
+    ranking = None
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-def get_discovery_users(current_user_id: int, age_min: int, age_max: int, max_distance: int, current_lat: float, current_lon: float, limit: int = None):
-    with get_db() as cursor:
-        # Get matched user IDs
-        cursor.execute("""
-            SELECT CASE WHEN user_id = %s THEN matched_user_id ELSE user_id END as matched_id
-            FROM matches WHERE user_id = %s OR matched_user_id = %s
-        """, (current_user_id, current_user_id, current_user_id))
-        matched_ids = [row['matched_id'] for row in cursor.fetchall()]
-        
-        # Get liked user IDs
-        cursor.execute("""
-            SELECT to_user_id FROM likes WHERE from_user_id = %s
-        """, (current_user_id,))
-        liked_ids = [row['to_user_id'] for row in cursor.fetchall()]
-        
-        # Get users for discovery
-        excluded_ids = matched_ids + liked_ids + [current_user_id]
-        cursor.execute("""
-            SELECT * FROM (
-                SELECT u.*, 
-                       6371 * acos(cos(radians(%s)) * cos(radians(u.latitude)) * 
-                       cos(radians(u.longitude) - radians(%s)) + sin(radians(%s)) * 
-                       sin(radians(u.latitude))) as calculated_distance
-                FROM users u
-                JOIN user_settings us ON u.id = us.user_id
-                WHERE u.id != ALL(%s) AND u.age BETWEEN %s AND %s 
-                      AND u.latitude IS NOT NULL AND u.longitude IS NOT NULL
-                      AND us.is_paused = false
-            ) u WHERE u.calculated_distance <= %s
-            ORDER BY u.calculated_distance
-        """ + (f" LIMIT {limit}" if limit else ""), 
-        (current_lat, current_lon, current_lat, excluded_ids, age_min, age_max, max_distance))
-        
-        users = []
-        for row in cursor.fetchall():
-            user_dict = dict(row)
-            # Update distance with calculated value
-            user_dict['distance'] = user_dict['calculated_distance']
-            if user_dict['latitude'] and user_dict['longitude']:
-                user_dict['location'] = {
-                    'latitude': user_dict['latitude'],
-                    'longitude': user_dict['longitude'],
-                    'city': user_dict['city']
-                }
-            users.append(User(**user_dict))
-        return users
-
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points using Haversine formula"""
-    R = 6371  # Earth's radius in kilometers
-    
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-    
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-    
-    a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    return R * c
+# Keeps background deck refills referenced until they finish
+_refill_tasks = set()
+
+EARTH_RADIUS_KM = 6371
+
+# "bbox" prefilters on the (latitude, longitude) btree index; "earthdistance"
+# uses a GiST index on ll_to_earth() and needs the cube/earthdistance extensions
+DISCOVERY_GEO_MODE = os.getenv("DISCOVERY_GEO_MODE", "bbox")
+
+# "score" ranks candidates on distance, shared interests, recency, verification
+# and whether they already liked the user (see ranking.py); "distance" is
+# nearest first, and what "score" falls back to if numpy can't be imported
+DISCOVERY_RANKING = os.getenv("DISCOVERY_RANKING", "score")
+if DISCOVERY_RANKING == "score" and ranking is None:
+    logger.warning("DISCOVERY_RANKING=score needs numpy (the 'ranking' extra); ranking by distance")
+    DISCOVERY_RANKING = "distance"
+# Candidates scored per ranking, the most recently active when more match
+DISCOVERY_RANKING_POOL = int(os.getenv("DISCOVERY_RANKING_POOL", 5000))
+
+# Haversine great-circle distance to ($1, $2); unlike the spherical law of
+# cosines it stays inside asin's domain for identical coordinates
+DISTANCE_SQL = f"""
+    2 * {EARTH_RADIUS_KM} * asin(least(1.0, sqrt(
+        power(sin(radians(u.latitude - $1) / 2), 2) +
+        cos(radians($1)) * cos(radians(u.latitude)) *
+        power(sin(radians(u.longitude - $2) / 2), 2)
+    )))
+"""
+
+BBOX_FILTER_SQL = "u.latitude BETWEEN $8 AND $9 AND u.longitude BETWEEN $10 AND $11"
+EARTH_BOX_FILTER_SQL = "earth_box(ll_to_earth($1, $2), $6 * 1000) @> ll_to_earth(u.latitude, u.longitude)"
+
+def bounding_box(lat: float, lon: float, radius_km: float):
+    """Lat/lon box enclosing the circle of radius_km around (lat, lon).
+
+    Longitude is left unbounded when the box would reach a pole or wrap
+    across the antimeridian.
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+    dlon = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if min_lon < -180 or max_lon > 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, min_lon, max_lon
+
+async def _fetch_discovery_rows(conn, columns: str, current_user_id: int, age_min: int, age_max: int, max_distance: int, current_lat: float, current_lon: float, limit: int = None):
+    # An indexable box prefilter narrows the candidates, already swiped users
+    # are dropped by the swipe_exclusions bitmap, and exact distance is only
+    # computed for the survivors
+    params = [float(current_lat), float(current_lon), current_user_id, age_min, age_max, float(max_distance), limit]
+    if DISCOVERY_GEO_MODE == "earthdistance":
+        geo_filter = EARTH_BOX_FILTER_SQL
+    else:
+        geo_filter = BBOX_FILTER_SQL
+        params.extend(bounding_box(current_lat, current_lon, max_distance))
+    return await conn.fetch(f"""
+        SELECT * FROM (
+            SELECT {columns}, {DISTANCE_SQL} as calculated_distance
+            FROM users u
+            JOIN user_settings us ON u.id = us.user_id
+            {exclusion_join("$3")}
+            WHERE {geo_filter}
+                  AND u.id != $3 AND {EXCLUSION_FILTER_SQL}
+                  AND u.age BETWEEN $4 AND $5 
+                  AND us.is_paused = false
+        ) u WHERE u.calculated_distance <= $6
+        ORDER BY u.calculated_distance
+        LIMIT $7
+    """, *params)
+
+async def _fetch_ranking_block(conn, current_user_id: int, age_min: int, age_max: int, max_distance: int, current_lat: float, current_lon: float):
+    # Same filters and parameters as _fetch_discovery_rows. When more than
+    # DISCOVERY_RANKING_POOL candidates are in range, the pool keeps the best
+    # by every score term but interest overlap (distance, recency, verified,
+    # liked_me, weighted as in ranking.py), so nearby users aren't cut for
+    # being less recently active; a candidate left out could only have
+    # overtaken one kept on shared interests. The recency exponent is capped
+    # at 100 half-lives: float8 power() raises on underflow (never-seen users
+    # have infinite hours), and 2^-100 is as good as 0 here
+    weights = ranking.RankingWeights()
+    params = [float(current_lat), float(current_lon), current_user_id, age_min, age_max, float(max_distance), DISCOVERY_RANKING_POOL]
+    if DISCOVERY_GEO_MODE == "earthdistance":
+        geo_filter = EARTH_BOX_FILTER_SQL
+    else:
+        geo_filter = BBOX_FILTER_SQL
+        params.extend(bounding_box(current_lat, current_lon, max_distance))
+    return await conn.fetch(f"""
+        SELECT * FROM (
+            SELECT u.id, u.latitude, u.longitude, u.interests, u.is_verified,
+                   coalesce(extract(epoch FROM LOCALTIMESTAMP - u.last_seen) / 3600, 'Infinity')::float8 AS hours_since_seen,
+                   EXISTS (
+                       SELECT 1 FROM likes l WHERE l.from_user_id = u.id AND l.to_user_id = $3
+                   ) AS liked_me,
+                   {DISTANCE_SQL} AS calculated_distance
+            FROM users u
+            JOIN user_settings us ON u.id = us.user_id
+            {exclusion_join("$3")}
+            WHERE {geo_filter}
+                  AND u.id != $3 AND {EXCLUSION_FILTER_SQL}
+                  AND u.age BETWEEN $4 AND $5
+                  AND us.is_paused = false
+        ) u WHERE u.calculated_distance <= $6
+        ORDER BY {weights.distance!r} * (1 - u.calculated_distance / $6)
+                 + {weights.recency!r} * power(2, -least(greatest(u.hours_since_seen, 0) / {ranking.DISCOVERY_RECENCY_HALF_LIFE_HOURS!r}, 100))
+                 + {weights.verified!r} * coalesce(u.is_verified, false)::int
+                 + {weights.liked_me!r} * u.liked_me::int DESC, u.id
+        LIMIT $7
+    """, *params)
+
+async def get_discovery_candidates(current_user_id: int, age_min: int, age_max: int, max_distance: int, current_lat: float, current_lon: float, limit: int = None, conn=None):
+    """Ranked (user_id, distance) pairs for building a discovery deck"""
+    async with get_db(conn) as conn:
+        if DISCOVERY_RANKING == "distance":
+            rows = await _fetch_discovery_rows(conn, "u.id", current_user_id, age_min, age_max, max_distance, current_lat, current_lon, limit)
+            return [(row['id'], row['calculated_distance']) for row in rows]
+        viewer_interests = await conn.fetchval("SELECT interests FROM users WHERE id = $1", current_user_id)
+        rows = await _fetch_ranking_block(conn, current_user_id, age_min, age_max, max_distance, current_lat, current_lon)
+    return ranking.rank_candidates(
+        ranking.candidate_block(rows), current_lat, current_lon, max_distance, viewer_interests, limit
+    )
+
+async def get_candidate_profiles(current_user_id: int, candidates: List[Tuple[int, float]], conn=None) -> str:
+    """Profiles for ranked (user_id, distance) candidates as a JSON array, in order.
+
+    Candidates that paused or were liked since they were ranked are dropped.
+    """
+    if not candidates:
+        return "[]"
+    async with get_db(conn) as conn:
+        return await conn.fetchval(f"""
+            SELECT coalesce(json_agg({user_json_sql("u", "c.distance")} ORDER BY c.position), '[]')
+            FROM unnest($1::int[], $2::float8[]) WITH ORDINALITY AS c(id, distance, position)
+            JOIN users u ON u.id = c.id
+            JOIN user_settings us ON u.id = us.user_id
+            WHERE us.is_paused = false
+                  AND NOT EXISTS (
+                      SELECT 1 FROM likes l WHERE l.from_user_id = $3 AND l.to_user_id = u.id
+                  )
+        """, [candidate_id for candidate_id, _ in candidates],
+             [float(distance) for _, distance in candidates], current_user_id)
+
+async def get_discovery_users(current_user_id: int, age_min: int, age_max: int, max_distance: int, current_lat: float, current_lon: float, limit: int = None, conn=None) -> str:
+    """Discovery page straight from Postgres (no deck), as a JSON array"""
+    async with get_db(conn) as conn:
+        candidates = await get_discovery_candidates(current_user_id, age_min, age_max, max_distance, current_lat, current_lon, limit, conn)
+        return await get_candidate_profiles(current_user_id, candidates, conn)
+
+async def rebuild_deck(user_id: int, signature: str, *filters):
+    candidates = await get_discovery_candidates(user_id, *filters, limit=DISCOVERY_DECK_SIZE)
+    await store_deck(user_id, signature, candidates)
+
+async def _refill_deck_in_background(user_id: int, signature: str, *filters):
+    if not await acquire_refill_lock(user_id):
+        return
+    try:
+        await rebuild_deck(user_id, signature, *filters)
+    except Exception as e:
+        logger.error(f"Discovery deck refill failed for user {user_id}: {e}")
+    finally:
+        await release_refill_lock(user_id)
+
+def schedule_deck_refill(user_id: int, signature: str, *filters):
+    task = asyncio.create_task(_refill_deck_in_background(user_id, signature, *filters))
+    _refill_tasks.add(task)
+    task.add_done_callback(_refill_tasks.discard)
+
+async def get_users_from_deck(user_id: int, age_min: int, age_max: int, max_distance: int, current_lat: float, current_lon: float, limit: int) -> Tuple[str, List[int]]:
+    """Serve a discovery page by popping the user's precomputed deck.
+
+    Returns the profiles as a JSON array and the candidate ids behind them.
+    """
+    filters = (age_min, age_max, max_distance, current_lat, current_lon)
+    signature = deck_signature(DISCOVERY_RANKING, *filters)
+    candidates, remaining = await pop_candidates(user_id, signature, limit)
+    if candidates is None or len(candidates) < limit:
+        # Missing, stale or exhausted deck: rebuild inline and top up
+        candidates = candidates or []
+        await rebuild_deck(user_id, signature, *filters)
+        more, remaining = await pop_candidates(user_id, signature, limit - len(candidates))
+        seen = {candidate_id for candidate_id, _ in candidates}
+        candidates += [c for c in more or [] if c[0] not in seen]
+    elif remaining < DISCOVERY_DECK_REFILL_THRESHOLD:
+        schedule_deck_refill(user_id, signature, *filters)
+    profiles = await get_candidate_profiles(user_id, candidates)
+    return profiles, [candidate_id for candidate_id, _ in candidates]
 
 @router.get("/")
 async def discover_users(
@@ -87,15 +230,22 @@ async def discover_users(
     if not current_user_location:
         return {"success": False, "error": "User location required"}
     
-    # Get discovery users from database
-    filtered_users = get_discovery_users(
-        current_user["id"],
+    filters = (
         age_min,
         age_max, 
         max_distance,
         current_user_location["latitude"],
-        current_user_location["longitude"],
-        limit
+        current_user_location["longitude"]
     )
     
-    return {"success": True, "data": {"users": filtered_users}}
\ No newline at end of file
+    # Serve from the precomputed deck, falling back to a direct query
+    try:
+        filtered_users, candidate_ids = await get_users_from_deck(current_user["id"], *filters, limit)
+        online = await get_online_users(candidate_ids)
+    except RedisError as e:
+        # Presence lives in Redis too, so nobody shows as online here
+        logger.warning(f"Discovery deck unavailable, querying directly: {e}")
+        filtered_users = await get_discovery_users(current_user["id"], *filters, limit)
+        online = set()
+    
+    return json_success(f'{{"users":{filtered_users},"online_user_ids":{json.dumps(sorted(online))}}}')
\ No newline at end of file
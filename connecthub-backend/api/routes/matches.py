@@ -1,79 +1,256 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Dict, Any
-from schemas.user import User
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional, Dict, Any, Tuple
+from pydantic import ValidationError
+from schemas.like import SwipeDecision, SwipeBatch
 from auth.middleware import get_current_user
 from database import get_db
-from datetime import datetime
+from discovery_deck import remove_from_deck
+from swipe_exclusions import add_exclusion_pairs
+from inbox import create_inbox_rows
+from pagination import encode_cursor, decode_cursor
+from fast_json import user_json_sql, json_array, json_page, json_success
+from presence import get_online_users
+from swipe_quotas import QuotaGrant, consume_swipes, refund_swipes
 import uuid
 
 router = APIRouter()
 
-def create_like(from_user_id: int, to_user_id: int, like_type: str):
-    with get_db() as cursor:
-        cursor.execute("""
-            INSERT INTO likes (from_user_id, to_user_id, type) 
-            VALUES (%s, %s, %s) RETURNING id
-        """, (from_user_id, to_user_id, like_type))
-        return cursor.fetchone()['id']
-
-def check_mutual_like(from_user_id: int, to_user_id: int):
-    with get_db() as cursor:
-        cursor.execute("""
-            SELECT id FROM likes 
-            WHERE from_user_id = %s AND to_user_id = %s
-        """, (to_user_id, from_user_id))
-        return cursor.fetchone() is not None
-
-def create_match(user_id: int, matched_user_id: int):
-    with get_db() as cursor:
-        cursor.execute("""
-            INSERT INTO matches (user_id, matched_user_id) 
-            VALUES (%s, %s) RETURNING id
-        """, (user_id, matched_user_id))
-        return cursor.fetchone()['id']
-
-def get_user_matches(user_id: int):
-    with get_db() as cursor:
-        cursor.execute("""
-            SELECT m.*, u.*, m.id as match_id, msg.text as last_message_text, 
-                   msg.sent_at as last_message_sent_at, msg.from_user_id as last_message_from_user_id,
-                   CASE WHEN m.user_id = %s THEN m.matched_user_id ELSE m.user_id END as other_user_id
-            FROM matches m
-            JOIN users u ON (CASE WHEN m.user_id = %s THEN m.matched_user_id ELSE m.user_id END) = u.id
-            LEFT JOIN messages msg ON m.last_message_id = msg.id
-            WHERE m.user_id = %s OR m.matched_user_id = %s
-            ORDER BY msg.sent_at DESC NULLS LAST, m.matched_at DESC
-        """, (user_id, user_id, user_id, user_id))
-        
-        matches = []
-        for row in cursor.fetchall():
-            match_dict = dict(row)
-            user_dict = {k: v for k, v in match_dict.items() if k not in ['match_id', 'other_user_id', 'matched_at', 'is_new_match', 'last_message_id', 'last_message_text', 'last_message_sent_at', 'last_message_from_user_id']}
-            if user_dict['latitude'] and user_dict['longitude']:
-                user_dict['location'] = {
-                    'latitude': user_dict['latitude'],
-                    'longitude': user_dict['longitude'],
-                    'city': user_dict['city']
-                }
-            
-            last_message = None
-            if match_dict['last_message_text']:
-                last_message = {
-                    'text': match_dict['last_message_text'],
-                    'sent_at': match_dict['last_message_sent_at'],
-                    'is_from_current_user': match_dict['last_message_from_user_id'] == user_id
-                }
-            
-            matches.append({
-                'id': match_dict['match_id'],
-                'user_id': match_dict['user_id'],
-                'matched_user_id': match_dict['matched_user_id'],
-                'user': User(**user_dict),
-                'matched_at': match_dict['matched_at'],
-                'is_new_match': match_dict['is_new_match'],
-                'last_message': last_message
-            })
-        return matches
+MATCHES_MAX_LIMIT = 100
+
+# Serialize swipes on the same pair so two users liking each other at the
+# same moment can't both miss the reciprocal like. Keys are locked in sorted
+# order so overlapping batches can't deadlock.
+LOCK_PAIRS_SQL = """
+    SELECT pg_advisory_xact_lock(k)
+    FROM (
+        SELECT (least($1, t)::bigint << 32) | greatest($1, t) AS k
+        FROM unnest($2::int[]) AS t
+        ORDER BY 1
+    ) keys
+"""
+
+# Insert every like and pass in one statement and report, per existing
+# target, whether the like is new and whether the target already liked us back
+RECORD_SWIPES_SQL = """
+    WITH targets AS (
+        SELECT d.to_user_id, d.type
+        FROM unnest($2::int[], $3::text[]) AS d(to_user_id, type)
+        JOIN users u ON u.id = d.to_user_id
+    ), inserted AS (
+        INSERT INTO likes (from_user_id, to_user_id, type)
+        SELECT $1, to_user_id, type FROM targets WHERE type <> 'nope'
+        ON CONFLICT (from_user_id, to_user_id) DO NOTHING
+        RETURNING to_user_id
+    ), passed AS (
+        INSERT INTO passes (from_user_id, to_user_id)
+        SELECT $1, to_user_id FROM targets WHERE type = 'nope'
+        ON CONFLICT (from_user_id, to_user_id) DO NOTHING
+    )
+    SELECT t.to_user_id,
+           t.to_user_id IN (SELECT to_user_id FROM inserted) AS created,
+           t.type <> 'nope' AND r.id IS NOT NULL AS reciprocated
+    FROM targets t
+    LEFT JOIN likes r ON r.from_user_id = t.to_user_id AND r.to_user_id = $1
+"""
+
+# Matches are unique per unordered pair, so repeats return the existing row
+CREATE_MATCHES_SQL = """
+    WITH created AS (
+        INSERT INTO matches (user_id, matched_user_id)
+        SELECT $1, t FROM unnest($2::int[]) AS t
+        ON CONFLICT ((least(user_id, matched_user_id)), (greatest(user_id, matched_user_id))) DO NOTHING
+        RETURNING id, user_id, matched_user_id, matched_at, is_new_match
+    )
+    SELECT *, true AS created FROM created
+    UNION ALL
+    SELECT m.id, m.user_id, m.matched_user_id, m.matched_at, m.is_new_match, false
+    FROM unnest($2::int[]) AS t
+    JOIN matches m ON least(m.user_id, m.matched_user_id) = least($1, t)
+                  AND greatest(m.user_id, m.matched_user_id) = greatest($1, t)
+"""
+
+async def apply_swipes(from_user_id: int, decisions: List[SwipeDecision], is_premium: bool = False,
+                       conn=None) -> Tuple[List[Dict[str, Any]], Optional[QuotaGrant]]:
+    """Record swipe decisions in one transaction and return a result per decision.
+
+    The round trips are fixed per batch, not per swipe: lock the pairs, insert
+    likes and find reciprocal ones, create matches, then update exclusions
+    and inboxes.
+
+    Likes and super likes are taken from the daily quota first, in decision
+    order; those past it get "quota_exceeded" and aren't recorded. Also
+    returns the quota left afterwards, or None if quotas are unavailable.
+    """
+    results = []
+    valid = []
+    seen = set()
+    for decision in decisions:
+        result = {
+            "target_user_id": decision.target_user_id,
+            "like_type": decision.like_type,
+            "status": None,
+            "is_match": False,
+            "match": None
+        }
+        if decision.target_user_id == from_user_id:
+            result["status"] = "invalid"
+        elif decision.target_user_id in seen:
+            result["status"] = "duplicate"
+        else:
+            seen.add(decision.target_user_id)
+            valid.append(decision)
+        results.append(result)
+
+    grant = await consume_swipes(
+        from_user_id, is_premium,
+        sum(1 for d in valid if d.like_type == "like"),
+        sum(1 for d in valid if d.like_type == "super"),
+    )
+    if grant is not None:
+        allowed = {"like": grant.likes, "super": grant.super_likes}
+        over_quota = set()
+        for decision in valid:
+            if decision.like_type == "nope":
+                continue
+            if allowed[decision.like_type]:
+                allowed[decision.like_type] -= 1
+            else:
+                over_quota.add(decision.target_user_id)
+        if over_quota:
+            valid = [d for d in valid if d.target_user_id not in over_quota]
+            for result in results:
+                if result["status"] is None and result["target_user_id"] in over_quota:
+                    result["status"] = "quota_exceeded"
+    if not valid:
+        return results, grant
+
+    recorded = {}
+    matches_by_user = {}
+    new_matches = []
+    try:
+        async with get_db(conn) as conn:
+            liked_ids = [d.target_user_id for d in valid if d.like_type != "nope"]
+            if liked_ids:
+                await conn.execute(LOCK_PAIRS_SQL, from_user_id, liked_ids)
+            rows = await conn.fetch(
+                RECORD_SWIPES_SQL, from_user_id,
+                [d.target_user_id for d in valid], [d.like_type for d in valid]
+            )
+            recorded = {row["to_user_id"]: row for row in rows}
+
+            mutual_ids = [row["to_user_id"] for row in rows if row["reciprocated"]]
+            if mutual_ids:
+                for row in await conn.fetch(CREATE_MATCHES_SQL, from_user_id, mutual_ids):
+                    other_id = row["matched_user_id"] if row["user_id"] == from_user_id else row["user_id"]
+                    matches_by_user[other_id] = row
+                    if row["created"]:
+                        new_matches.append((other_id, row["id"]))
+
+            await add_exclusion_pairs(
+                conn,
+                [(from_user_id, target_id) for target_id in recorded] +
+                [(other_id, from_user_id) for other_id, _ in new_matches]
+            )
+            if new_matches:
+                await create_inbox_rows(conn, [match_id for _, match_id in new_matches])
+    except BaseException:
+        # Nothing was recorded, so nothing was used
+        if grant is not None:
+            await refund_swipes(from_user_id, grant, grant.likes, grant.super_likes)
+        raise
+
+    if recorded:
+        await remove_from_deck(from_user_id, *recorded)
+    for other_id, _ in new_matches:
+        await remove_from_deck(other_id, from_user_id)
+
+    for result in results:
+        if result["status"] is not None:
+            continue
+        row = recorded.get(result["target_user_id"])
+        if row is None:
+            result["status"] = "not_found"
+        elif result["like_type"] == "nope":
+            result["status"] = "passed"
+        else:
+            result["status"] = "liked" if row["created"] else "already_liked"
+        match = matches_by_user.get(result["target_user_id"])
+        if match is not None:
+            result["is_match"] = True
+            result["match"] = {
+                "id": match["id"],
+                "user_id": match["user_id"],
+                "matched_user_id": match["matched_user_id"],
+                "matched_at": match["matched_at"],
+                "is_new_match": match["is_new_match"]
+            }
+
+    if grant is not None:
+        # Likes that changed nothing don't count against the quota
+        unused = {"like": 0, "super": 0}
+        for result in results:
+            if result["status"] in ("already_liked", "not_found") and result["like_type"] != "nope":
+                unused[result["like_type"]] += 1
+        await refund_swipes(from_user_id, grant, unused["like"], unused["super"])
+        grant = grant._replace(
+            likes=grant.likes - unused["like"],
+            super_likes=grant.super_likes - unused["super"],
+            likes_remaining=grant.likes_remaining + unused["like"],
+            super_likes_remaining=grant.super_likes_remaining + unused["super"],
+        )
+    return results, grant
+
+def quota_json(grant: Optional[QuotaGrant]) -> Dict[str, Optional[int]]:
+    """Remaining counts for responses; null when quotas are unavailable"""
+    return {
+        "likes_remaining": grant.likes_remaining if grant else None,
+        "super_likes_remaining": grant.super_likes_remaining if grant else None,
+    }
+
+async def get_user_matches(user_id: int, limit: int = 50, cursor: str = None, conn=None):
+    """A page of the user's conversations, most recently active first.
+
+    Returns (items as a JSON array, next_cursor, has_more, the other
+    participants' ids).
+    """
+    params = [user_id]
+    query = f"""
+        SELECT i.match_id, i.last_activity_at, i.other_user_id, json_build_object(
+                   'id', i.match_id,
+                   'user_id', m.user_id,
+                   'matched_user_id', m.matched_user_id,
+                   'user', {user_json_sql("u")},
+                   'matched_at', m.matched_at,
+                   'is_new_match', m.is_new_match,
+                   'last_message', CASE WHEN i.last_message_text IS NOT NULL THEN json_build_object(
+                       'text', i.last_message_text,
+                       'sent_at', i.last_message_at,
+                       'is_from_current_user', i.last_message_from_user_id = $1
+                   ) END,
+                   'unread_count', i.unread_count
+               ) AS item
+        FROM inbox i
+        JOIN matches m ON m.id = i.match_id
+        JOIN users u ON u.id = i.other_user_id
+        WHERE i.user_id = $1
+    """
+    if cursor:
+        last_activity_at, match_id = decode_cursor(cursor)
+        params += [last_activity_at, str(uuid.UUID(match_id))]
+        query += " AND (i.last_activity_at, i.match_id) < ($2, $3::uuid)"
+    params.append(limit + 1)
+    query += f" ORDER BY i.last_activity_at DESC, i.match_id DESC LIMIT ${len(params)}"
+
+    async with get_db(conn) as conn:
+        rows = await conn.fetch(query, *params)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(last['last_activity_at'], last['match_id'])
+    return json_array(row['item'] for row in rows), next_cursor, has_more, [row['other_user_id'] for row in rows]
 
 @router.post("/like")
 async def send_like(like_data: dict, current_user: Dict[str, Any] = Depends(get_current_user)):
@@ -81,27 +258,41 @@ async def send_like(like_data: dict, current_user: Dict[str, Any] = Depends(get_
     
     target_user_id = like_data.get("target_user_id") or like_data.get("to_user_id")
     like_type = like_data.get("like_type") or like_data.get("type", "like")
+    try:
+        decision = SwipeDecision(target_user_id=target_user_id, like_type=like_type)
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="Invalid like")
     
-    # Create the like
-    create_like(current_user["id"], target_user_id, like_type)
+    results, grant = await apply_swipes(current_user["id"], [decision], bool(current_user.get("is_premium")))
+    result = results[0]
+    if result["status"] == "invalid":
+        raise HTTPException(status_code=400, detail="Cannot like yourself")
+    if result["status"] == "not_found":
+        raise HTTPException(status_code=404, detail="User not found")
+    if result["status"] == "quota_exceeded":
+        raise HTTPException(status_code=429, detail="Daily like limit reached")
     
-    # Check if it's a mutual like (match)
-    if check_mutual_like(current_user["id"], target_user_id):
-        # Create match
-        match_id = create_match(current_user["id"], target_user_id)
-        new_match = {
-            "id": match_id,
-            "user_id": current_user["id"],
-            "matched_user_id": target_user_id,
-            "matched_at": datetime.now().isoformat(),
-            "is_new_match": True
-        }
-        return {"success": True, "data": {"is_match": True, "match": new_match}}
+    if result["is_match"]:
+        return {"success": True, "data": {"is_match": True, "match": result["match"], **quota_json(grant)}}
     
-    return {"success": True, "data": {"is_match": False, "likes_remaining": 10, "super_likes_remaining": 1}}
+    return {"success": True, "data": {"is_match": False, **quota_json(grant)}}
+
+@router.post("/likes:batch")
+async def send_likes_batch(batch: SwipeBatch, current_user: Dict[str, Any] = Depends(get_current_user)):
+    """Apply many swipe decisions at once"""
+    results, grant = await apply_swipes(current_user["id"], batch.decisions, bool(current_user.get("is_premium")))
+    return {"success": True, "data": {"results": results, "quota": quota_json(grant)}}
 
 @router.get("/")
-async def get_matches(current_user: Dict[str, Any] = Depends(get_current_user)):
+async def get_matches(
+    limit: int = Query(50, ge=1, le=MATCHES_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
     """Get user's matches"""
-    user_matches = get_user_matches(current_user["id"])
-    return {"success": True, "data": user_matches}
\ No newline at end of file
+    try:
+        user_matches, next_cursor, has_more, other_user_ids = await get_user_matches(current_user["id"], limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    online = await get_online_users(other_user_ids)
+    return json_success(json_page(user_matches, next_cursor, has_more, {"online_user_ids": sorted(online)}))
\ No newline at end of file
@@ -2,18 +2,18 @@ from fastapi import APIRouter, HTTPException, Depends
 from schemas.settings import UserSettings, UserSettingsUpdate, AgeRange
 from auth.middleware import get_current_user
 from database import get_db
+from discovery_deck import clear_deck, set_paused
 from typing import Dict, Any
 
 router = APIRouter()
 
-def get_user_settings_from_db(user_id: int):
-    with get_db() as cursor:
-        cursor.execute("""
+async def get_user_settings_from_db(user_id: int, conn=None):
+    async with get_db(conn) as conn:
+        row = await conn.fetchrow("""
             SELECT id, user_id, max_distance, age_min, age_max, 
                    show_me_in_discovery, is_paused
-            FROM user_settings WHERE user_id = %s
-        """, (user_id,))
-        row = cursor.fetchone()
+            FROM user_settings WHERE user_id = $1
+        """, user_id)
         if row:
             return UserSettings(
                 id=row['id'],
@@ -28,15 +28,14 @@ def get_user_settings_from_db(user_id: int):
 @router.get("/{user_id}")
 async def get_user_settings(user_id: int, current_user: Dict[str, Any] = Depends(get_current_user)):
     """Get user settings"""
-    settings = get_user_settings_from_db(user_id)
+    settings = await get_user_settings_from_db(user_id)
     if not settings:
         # Create default settings
-        with get_db() as cursor:
-            cursor.execute("""
+        async with get_db() as conn:
+            settings_id = await conn.fetchval("""
                 INSERT INTO user_settings (user_id, max_distance, age_min, age_max)
-                VALUES (%s, %s, %s, %s) RETURNING id
-            """, (user_id, 50, 18, 35))
-            settings_id = cursor.fetchone()['id']
+                VALUES ($1, $2, $3, $4) RETURNING id
+            """, user_id, 50, 18, 35)
             settings = UserSettings(
                 id=settings_id,
                 user_id=user_id,
@@ -51,7 +50,7 @@ async def get_user_settings(user_id: int, current_user: Dict[str, Any] = Depends
 @router.put("/{user_id}")
 async def update_user_settings(user_id: int, settings_data: UserSettingsUpdate, current_user: Dict[str, Any] = Depends(get_current_user)):
     """Update user settings"""
-    with get_db() as cursor:
+    async with get_db() as conn:
         update_data = settings_data.dict(exclude_unset=True)
         if 'age_range' in update_data:
             age_range = update_data.pop('age_range')
@@ -59,30 +58,34 @@ async def update_user_settings(user_id: int, settings_data: UserSettingsUpdate,
             update_data['age_max'] = age_range['max']
         
         if update_data:
-            set_clause = ', '.join([f"{k} = %s" for k in update_data.keys()])
+            set_clause = ', '.join([f"{k} = ${i}" for i, k in enumerate(update_data.keys(), start=1)])
             values = list(update_data.values()) + [user_id]
-            cursor.execute(f"""
+            await conn.execute(f"""
                 UPDATE user_settings SET {set_clause}
-                WHERE user_id = %s
-            """, values)
-    
-    settings = get_user_settings_from_db(user_id)
+                WHERE user_id = ${len(values)}
+            """, *values)
+        
+        settings = await get_user_settings_from_db(user_id, conn)
     return {"success": True, "data": settings}
 
 @router.post("/{user_id}/pause")
 async def pause_account(user_id: int, current_user: Dict[str, Any] = Depends(get_current_user)):
     """Pause user account"""
-    with get_db() as cursor:
-        cursor.execute("""
-            UPDATE user_settings SET is_paused = %s WHERE user_id = %s
-        """, (True, user_id))
+    async with get_db() as conn:
+        await conn.execute("""
+            UPDATE user_settings SET is_paused = $1 WHERE user_id = $2
+        """, True, user_id)
+    # Paused users stop discovering, and drop out of other users' decks
+    await set_paused(user_id, True)
+    await clear_deck(user_id)
     return {"message": "Account paused"}
 
 @router.post("/{user_id}/reactivate")
 async def reactivate_account(user_id: int, current_user: Dict[str, Any] = Depends(get_current_user)):
     """Reactivate user account"""
-    with get_db() as cursor:
-        cursor.execute("""
-            UPDATE user_settings SET is_paused = %s WHERE user_id = %s
-        """, (False, user_id))
+    async with get_db() as conn:
+        await conn.execute("""
+            UPDATE user_settings SET is_paused = $1 WHERE user_id = $2
+        """, False, user_id)
+    await set_paused(user_id, False)
     return {"message": "Account reactivated"}
\ No newline at end of file
@@ -4,21 +4,32 @@ from schemas.user import User, UserCreate, UserUpdate
 from schemas.settings import UserSettings, AgeRange
 from auth.middleware import get_current_user
 from database import get_db
+from discovery_deck import clear_deck
+from profile_cache import get_profile, invalidate_profile
 from datetime import datetime
 
 router = APIRouter()
 
 # Database functions
-def get_user_by_id_internal(user_id: int):
-    with get_db() as cursor:
-        cursor.execute("""
+async def get_user_by_id_internal(user_id: int, conn=None):
+    """Load a profile through the profile cache.
+
+    Passing a connection bypasses the cache so a transaction reads its own
+    uncommitted writes.
+    """
+    if conn is None:
+        return await get_profile(user_id, load_user_from_db)
+    return await load_user_from_db(user_id, conn)
+
+async def load_user_from_db(user_id: int, conn=None):
+    async with get_db(conn) as conn:
+        row = await conn.fetchrow("""
             SELECT id, username, first_name, last_name, email, birthday, 
                    gender, age, bio, interests, photos, photo_url, distance, 
                    latitude, longitude, city, is_active, last_seen, created_at, 
                    updated_at, is_verified, report_count, is_premium
-            FROM users WHERE id = %s
-        """, (user_id,))
-        row = cursor.fetchone()
+            FROM users WHERE id = $1
+        """, user_id)
         if row:
             user_dict = dict(row)
             if user_dict['latitude'] and user_dict['longitude']:
@@ -33,7 +44,7 @@ def get_user_by_id_internal(user_id: int):
 @router.get("/{user_id}")
 async def get_user(user_id: int, current_user: Dict[str, Any] = Depends(get_current_user)):
     """Get user by ID"""
-    user = get_user_by_id_internal(user_id)
+    user = await get_user_by_id_internal(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return {"success": True, "data": user}
@@ -45,7 +56,7 @@ async def update_user(user_id: int, user_data: UserUpdate, current_user: Dict[st
     if user_id != current_user["id"]:
         raise HTTPException(status_code=403, detail="Can only update your own profile")
     
-    with get_db() as cursor:
+    async with get_db() as conn:
         # Build update query
         update_data = user_data.dict(exclude_unset=True)
         if 'location' in update_data:
@@ -57,14 +68,17 @@ async def update_user(user_id: int, user_data: UserUpdate, current_user: Dict[st
             })
         
         if update_data:
-            set_clause = ', '.join([f"{k} = %s" for k in update_data.keys()])
+            set_clause = ', '.join([f"{k} = ${i}" for i, k in enumerate(update_data.keys(), start=1)])
             values = list(update_data.values()) + [user_id]
-            cursor.execute(f"""
+            await conn.execute(f"""
                 UPDATE users SET {set_clause}, updated_at = CURRENT_TIMESTAMP 
-                WHERE id = %s
-            """, values)
+                WHERE id = ${len(values)}
+            """, *values)
+        
+        user = await get_user_by_id_internal(user_id, conn)
     
-    return {"success": True, "data": get_user_by_id_internal(user_id)}
+    await invalidate_profile(user_id)
+    return {"success": True, "data": user}
 
 @router.delete("/{user_id}")
 async def delete_user(user_id: int, current_user: Dict[str, Any] = Depends(get_current_user)):
@@ -73,8 +87,10 @@ async def delete_user(user_id: int, current_user: Dict[str, Any] = Depends(get_c
     if user_id != current_user["id"]:
         raise HTTPException(status_code=403, detail="Can only delete your own account")
     
-    with get_db() as cursor:
-        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-        if cursor.rowcount == 0:
+    async with get_db() as conn:
+        result = await conn.execute("DELETE FROM users WHERE id = $1", user_id)
+        if result == "DELETE 0":
             raise HTTPException(status_code=404, detail="User not found")
+    await clear_deck(user_id)
+    await invalidate_profile(user_id)
     return {"message": "User deleted successfully"}
\ No newline at end of file
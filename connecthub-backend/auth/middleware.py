@@ -2,14 +2,14 @@ from fastapi import Request, HTTPException, status, Depends, Cookie
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional, Dict, Any
 import os
-from .session import get_session, refresh_session
+from .session import get_session
 
 security = HTTPBearer(auto_error=False)
 
-def load_user_by_id(user_id: int):
+async def load_user_by_id(user_id: int):
     """Load user from database by ID"""
     from api.routes.users import get_user_by_id_internal
-    return get_user_by_id_internal(user_id)
+    return await get_user_by_id_internal(user_id)
 
 async def get_current_user(
     request: Request,
@@ -34,8 +34,8 @@ async def get_current_user(
             detail="Missing session token"
         )
     
-    # Validate session
-    session_data = get_session(token)
+    # Validate session (also slides its expiry)
+    session_data = await get_session(token)
     
     if not session_data:
         raise HTTPException(
@@ -44,12 +44,10 @@ async def get_current_user(
         )
     
     user_id = session_data["user_id"]
-    
-    # Refresh session
-    refresh_session(token)
+    request.state.session_token = token
     
     # Load full user data
-    user = load_user_by_id(user_id)
+    user = await load_user_by_id(user_id)
     if user:
         return user.dict()
     else:
@@ -0,0 +1,82 @@
+import asyncio
+import bcrypt
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+from fastapi import HTTPException, status
+from metrics import Counter, Gauge, HistogramFamily
+
+# bcrypt releases the GIL while hashing, so a thread pool runs hashes in
+# parallel without blocking the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 4))
+# Requests allowed to wait for a worker before new ones get a 503
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 32))
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", 12))
+
+HASH_LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_in_flight = 0
+_rejected = 0
+PASSWORD_HASH_DURATION = HistogramFamily(
+    "connecthub_password_hash_duration_milliseconds", "bcrypt latency including queueing, by operation",
+    ["operation"], HASH_LATENCY_BUCKETS_MS
+)
+PASSWORD_HASH_REJECTED = Counter("connecthub_password_hash_rejected_total", "Hash requests turned away with a 503")
+PASSWORD_HASH_IN_FLIGHT = Gauge("connecthub_password_hash_in_flight", "Hash requests running or queued")
+PASSWORD_HASH_IN_FLIGHT.set_function(lambda: _in_flight)
+_latency_ms = {operation: PASSWORD_HASH_DURATION.labels(operation) for operation in ("hash", "verify")}
+
+def _hash(password: str, rounds: int) -> str:
+    salt = bcrypt.gensalt(rounds=rounds)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+def _verify(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+async def _run(operation: str, fn, *args):
+    global _in_flight, _rejected
+    if _in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+        _rejected += 1
+        PASSWORD_HASH_REJECTED.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, please retry",
+            headers={"Retry-After": "1"}
+        )
+    _in_flight += 1
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _in_flight -= 1
+        # Includes time spent queued for a worker
+        _latency_ms[operation].observe((time.perf_counter() - start) * 1000)
+
+async def hash_password(password: str) -> str:
+    """Hash a password using bcrypt at the configured work factor"""
+    return await _run("hash", _hash, password, PASSWORD_HASH_ROUNDS)
+
+async def verify_password(password: str, hashed: str) -> bool:
+    """Verify a password against its hash"""
+    return await _run("verify", _verify, password, hashed)
+
+def get_hash_rounds(hashed: str) -> Optional[int]:
+    """Work factor of a bcrypt hash ($2b$<rounds>$...)"""
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def needs_rehash(hashed: str) -> bool:
+    return get_hash_rounds(hashed) != PASSWORD_HASH_ROUNDS
+
+def get_password_hashing_stats() -> Dict[str, Any]:
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "rounds": PASSWORD_HASH_ROUNDS,
+        "in_flight": _in_flight,
+        "rejected": _rejected,
+        "latency_ms": {operation: histogram.snapshot() for operation, histogram in _latency_ms.items()},
+    }
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark discovery candidate scoring: the vectorized NumPy stage in
+ranking.py (including encoding the block's interests as bitmasks) against the
+same score computed candidate by candidate in Python followed by a full sort.
+
+Uses synthetic candidate blocks around one viewer; no database needed:
+
+    uv run --extra ranking python benchmarks/bench_ranking.py --candidates 1000 10000 100000
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ranking import (
+    EARTH_RADIUS_KM, DISCOVERY_RECENCY_HALF_LIFE_HOURS, CandidateBlock, RankingWeights, encode_interests, rank_candidates
+)
+
+CENTER = (25.03, 121.56)
+MAX_DISTANCE = 100
+TOP_K = 200
+INTERESTS = [f"interest_{i}" for i in range(60)]
+
+def make_block(count: int, rng: random.Random) -> CandidateBlock:
+    """A block whose ``interests`` are still the raw tag lists"""
+    # Candidates spread over the bounding box, as the SQL prefilter returns them
+    dlat = math.degrees(MAX_DISTANCE / EARTH_RADIUS_KM)
+    dlon = dlat / math.cos(math.radians(CENTER[0]))
+    return CandidateBlock(
+        ids=np.arange(1, count + 1, dtype=np.int64),
+        latitude=np.array([CENTER[0] + rng.uniform(-dlat, dlat) for _ in range(count)]),
+        longitude=np.array([CENTER[1] + rng.uniform(-dlon, dlon) for _ in range(count)]),
+        interests=[rng.sample(INTERESTS, rng.randint(0, 8)) for _ in range(count)],
+        hours_since_seen=np.array([rng.expovariate(1 / 96) if rng.random() < 0.95 else math.inf for _ in range(count)]),
+        verified=np.array([rng.random() < 0.3 for _ in range(count)]),
+        liked_me=np.array([rng.random() < 0.05 for _ in range(count)]),
+    )
+
+def rank_python(block: CandidateBlock, lat: float, lon: float, radius_km: float, viewer_interests, k: int):
+    """The per-candidate loop the NumPy stage replaces"""
+    w = RankingWeights()
+    viewer = set(viewer_interests)
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    ranked = []
+    for i in range(len(block.ids)):
+        lat2, lon2 = math.radians(block.latitude[i]), math.radians(block.longitude[i])
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        distance = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+        if distance > radius_km:
+            continue
+        tags = set(block.interests[i])
+        union = len(tags | viewer)
+        overlap = len(tags & viewer) / union if union else 0.0
+        recency = 2 ** (-max(block.hours_since_seen[i], 0) / DISCOVERY_RECENCY_HALF_LIFE_HOURS)
+        score = (w.distance * (1 - distance / radius_km) + w.interests * overlap + w.recency * recency
+                 + w.verified * block.verified[i] + w.liked_me * block.liked_me[i])
+        ranked.append((score, int(block.ids[i]), distance))
+    ranked.sort(key=lambda r: -r[0])
+    return [(candidate_id, distance) for _, candidate_id, distance in ranked[:k]]
+
+def timed(fn, repeat: int):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--top", type=int, default=TOP_K)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    viewer_interests = rng.sample(INTERESTS, 6)
+    print(f"{'candidates':>10} {'numpy p50':>10} {'python p50':>11} {'speedup':>8} {'same top-k':>11}")
+    for count in args.candidates:
+        block = make_block(count, rng)
+        numpy_ms, ranked = timed(lambda: rank_candidates(block._replace(interests=encode_interests(block.interests)),
+                                                         *CENTER, MAX_DISTANCE, viewer_interests, args.top), args.repeat)
+        python_ms, expected = timed(lambda: rank_python(block, *CENTER, MAX_DISTANCE, viewer_interests, args.top), args.repeat)
+        same = [c for c, _ in ranked] == [c for c, _ in expected]
+        print(f"{count:>10} {numpy_ms:>8.2f}ms {python_ms:>9.2f}ms {python_ms / numpy_ms:>7.1f}x {str(same):>11}", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Benchmark the list endpoints' response building: the previous path (a
+Pydantic model per row, then FastAPI's jsonable_encoder + JSONResponse)
+against rows rendered by Postgres with json_build_object (fast_json.py).
+
+Each route is measured from the query to the encoded response body, for
+wall-clock and process CPU time, and both payloads are checked to decode to
+the same data. Runs in a throwaway schema of the (migrated) database at
+DATABASE_URL:
+
+    uv run python benchmarks/bench_serialization.py --page-size 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import asyncpg
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DATABASE_URL, _init_connection
+from api.routes.chat import create_message, get_chat_messages
+from api.routes.discovery import get_candidate_profiles
+from api.routes.matches import get_user_matches
+from fast_json import json_page, json_success
+from inbox import create_inbox_rows
+from schemas.chat import ChatMessage
+from schemas.user import User
+
+SCHEMA = "bench_serialization"
+TABLES = ["users", "user_settings", "likes", "matches", "messages", "inbox"]
+CENTER = (25.03, 121.56)
+TIMESTAMP = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}")
+
+def old_response(content) -> bytes:
+    # What FastAPI does with a returned dict when there is no response_model
+    return JSONResponse(jsonable_encoder(content)).body
+
+def row_to_user(row, distance=None) -> User:
+    user_dict = dict(row)
+    if distance is not None:
+        user_dict['distance'] = distance
+    if user_dict['latitude'] and user_dict['longitude']:
+        user_dict['location'] = {
+            'latitude': user_dict['latitude'],
+            'longitude': user_dict['longitude'],
+            'city': user_dict['city']
+        }
+    return User(**user_dict)
+
+async def old_discovery(conn, user_id, candidates, _):
+    rows = await conn.fetch("""
+        SELECT u.* FROM users u
+        JOIN user_settings us ON u.id = us.user_id
+        WHERE u.id = ANY($1::int[]) AND us.is_paused = false
+              AND NOT EXISTS (
+                  SELECT 1 FROM likes l WHERE l.from_user_id = $2 AND l.to_user_id = u.id
+              )
+    """, [candidate_id for candidate_id, _ in candidates], user_id)
+    rows_by_id = {row['id']: row for row in rows}
+    users = [row_to_user(rows_by_id[c], d) for c, d in candidates if c in rows_by_id]
+    return old_response({"success": True, "data": {"users": users}})
+
+async def new_discovery(conn, user_id, candidates, _):
+    users = await get_candidate_profiles(user_id, candidates, conn)
+    return json_success(f'{{"users":{users}}}').body
+
+async def old_matches(conn, user_id, _, limit):
+    rows = await conn.fetch("""
+        SELECT i.match_id, i.last_message_text, i.last_message_at, i.last_message_from_user_id,
+               i.last_activity_at, i.unread_count,
+               m.user_id AS match_user_id, m.matched_user_id, m.matched_at, m.is_new_match,
+               u.id, u.username, u.first_name, u.last_name, u.email, u.birthday,
+               u.gender, u.age, u.bio, u.interests, u.photos, u.photo_url, u.distance,
+               u.latitude, u.longitude, u.city, u.is_active, u.last_seen, u.created_at,
+               u.updated_at, u.is_verified, u.report_count, u.is_premium
+        FROM inbox i
+        JOIN matches m ON m.id = i.match_id
+        JOIN users u ON u.id = i.other_user_id
+        WHERE i.user_id = $1
+        ORDER BY i.last_activity_at DESC, i.match_id DESC LIMIT $2
+    """, user_id, limit + 1)
+    has_more = len(rows) > limit
+    items = []
+    for row in rows[:limit]:
+        user_row = {k: v for k, v in dict(row).items() if k in User.model_fields or k in ('latitude', 'longitude', 'city')}
+        last_message = None
+        if row['last_message_text'] is not None:
+            last_message = {
+                'text': row['last_message_text'],
+                'sent_at': row['last_message_at'],
+                'is_from_current_user': row['last_message_from_user_id'] == user_id
+            }
+        items.append({
+            'id': row['match_id'],
+            'user_id': row['match_user_id'],
+            'matched_user_id': row['matched_user_id'],
+            'user': row_to_user(user_row),
+            'matched_at': row['matched_at'],
+            'is_new_match': row['is_new_match'],
+            'last_message': last_message,
+            'unread_count': row['unread_count']
+        })
+    return old_response({"success": True, "data": {"items": items, "next_cursor": None, "has_more": has_more}})
+
+async def new_matches(conn, user_id, _, limit):
+    items, _, has_more, _ = await get_user_matches(user_id, limit, conn=conn)
+    return json_success(json_page(items, None, has_more)).body
+
+async def old_chat(conn, user_id, match_id, limit):
+    rows = await conn.fetch("""
+        SELECT id, match_id, from_user_id, text, sent_at, status FROM messages
+        WHERE match_id = $1 ORDER BY sent_at DESC, id DESC LIMIT $2
+    """, match_id, limit + 1)
+    has_more = len(rows) > limit
+    messages = [ChatMessage(**dict(row)) for row in rows[:limit]]
+    messages.reverse()
+    for message in messages:
+        message.is_from_current_user = message.from_user_id == user_id
+    return old_response({"success": True, "data": {"items": messages, "next_cursor": None, "has_more": has_more}})
+
+async def new_chat(conn, user_id, match_id, limit):
+    items, _, has_more = await get_chat_messages(match_id, user_id, limit, conn=conn)
+    return json_success(json_page(items, None, has_more)).body
+
+def normalize(value):
+    """Decode timestamps so '...:00.120000' and '...:00.12' compare equal"""
+    if isinstance(value, dict):
+        return {k: normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [normalize(v) for v in value]
+    if isinstance(value, str) and TIMESTAMP.match(value):
+        return datetime.fromisoformat(value)
+    return value
+
+async def setup_schema(conn, user_count: int, page_size: int):
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    for table in TABLES:
+        await conn.execute(f"CREATE TABLE {SCHEMA}.{table} (LIKE public.{table} INCLUDING ALL)")
+    await conn.execute(f"SET search_path TO {SCHEMA}")
+    user_ids = [row["id"] for row in await conn.fetch("""
+        INSERT INTO users (username, password_hash, first_name, last_name, email, birthday, gender, age,
+                           bio, interests, photos, latitude, longitude, city)
+        SELECT 'bench_' || g, 'x', 'First' || g, 'Last' || g, 'bench_' || g || '@example.com',
+               '1995-06-15', 'female', 20 + g % 20, 'Coffee, hiking and bad puns. ' || g,
+               ARRAY['music', 'travel', 'food', 'photography'],
+               ARRAY['https://cdn.example.com/p/' || g || '/1.jpg', 'https://cdn.example.com/p/' || g || '/2.jpg'],
+               $1 + (random() - 0.5) * 0.5, $2 + (random() - 0.5) * 0.5, 'Taipei'
+        FROM generate_series(1, $3) g
+        RETURNING id
+    """, CENTER[0], CENTER[1], user_count)]
+    await conn.execute("INSERT INTO user_settings (user_id) SELECT unnest($1::int[])", user_ids)
+
+    me, others = user_ids[0], user_ids[1:page_size + 1]
+    match_ids = [row["id"] for row in await conn.fetch("""
+        INSERT INTO matches (user_id, matched_user_id) SELECT $1, unnest($2::int[]) RETURNING id
+    """, me, others)]
+    await create_inbox_rows(conn, match_ids)
+    for i, match_id in enumerate(match_ids):
+        await create_message(match_id, others[i], f"Hey! Message {i}", conn)
+    for i in range(page_size):
+        await create_message(match_ids[0], me if i % 2 else others[0], f"Chat line {i} with some text in it", conn)
+    await conn.execute("ANALYZE")
+    candidates = [(user_id, round(0.37 * i, 3)) for i, user_id in enumerate(others)]
+    return me, candidates, match_ids[0]
+
+async def measure(fn, conn, args, repeat: int):
+    body = await fn(conn, *args)  # warm-up
+    wall, cpu = [], []
+    for _ in range(repeat):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        await fn(conn, *args)
+        cpu.append((time.process_time() - cpu_start) * 1000)
+        wall.append((time.perf_counter() - wall_start) * 1000)
+    return body, statistics.median(wall), statistics.median(cpu)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark schema afterwards")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(DATABASE_URL)
+    await _init_connection(conn)
+    try:
+        print(f"Seeding {args.users} users in schema {SCHEMA}...", flush=True)
+        me, candidates, match_id = await setup_schema(conn, args.users, args.page_size)
+        routes = [
+            ("discovery", old_discovery, new_discovery, (me, candidates, args.page_size)),
+            ("matches", old_matches, new_matches, (me, None, args.page_size)),
+            ("chat history", old_chat, new_chat, (me, match_id, args.page_size)),
+        ]
+        print(f"{'route':<14} {'old wall':>9} {'new wall':>9} {'old cpu':>9} {'new cpu':>9} {'cpu speedup':>12} {'bytes':>8}")
+        for name, old_fn, new_fn, fn_args in routes:
+            old_body, old_wall, old_cpu = await measure(old_fn, conn, fn_args, args.repeat)
+            new_body, new_wall, new_cpu = await measure(new_fn, conn, fn_args, args.repeat)
+            if normalize(json.loads(old_body)) != normalize(json.loads(new_body)):
+                raise SystemExit(f"{name}: responses differ\nold: {old_body[:500]}\nnew: {new_body[:500]}")
+            print(f"{name:<14} {old_wall:>7.2f}ms {new_wall:>7.2f}ms {old_cpu:>7.2f}ms {new_cpu:>7.2f}ms "
+                  f"{old_cpu / new_cpu if new_cpu else float('inf'):>11.1f}x {len(new_body):>8}", flush=True)
+    finally:
+        if not args.keep:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark discovery candidate generation with the old "ship every swiped id
+as an array" exclusion against the swipe_exclusions bitmap join.
+
+Runs in a throwaway schema of the database at DATABASE_URL:
+
+    uv run python benchmarks/bench_swipe_exclusion.py --users 150000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DATABASE_URL
+from api.routes.discovery import DISTANCE_SQL, BBOX_FILTER_SQL, bounding_box, _fetch_discovery_rows
+from swipe_exclusions import REBUILD_SQL, EXCLUSION_CHUNK_SIZE
+
+SCHEMA = "bench_swipe_exclusion"
+CENTER = (25.03, 121.56)
+MAX_DISTANCE = 100
+LIMIT = 10
+
+# The pre-bitmap query: liked/matched ids travel to Postgres as an array
+ARRAY_QUERY = f"""
+    SELECT * FROM (
+        SELECT u.id, {DISTANCE_SQL} as calculated_distance
+        FROM users u
+        JOIN user_settings us ON u.id = us.user_id
+        WHERE {BBOX_FILTER_SQL}
+              AND u.id != ALL($3::int[]) AND u.age BETWEEN $4 AND $5
+              AND us.is_paused = false
+    ) u WHERE u.calculated_distance <= $6
+    ORDER BY u.calculated_distance
+    LIMIT $7
+"""
+
+async def setup_schema(conn, user_count: int):
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    await conn.execute(f"SET search_path TO {SCHEMA}")
+    await conn.execute("""
+        CREATE TABLE users (id SERIAL PRIMARY KEY, age INTEGER NOT NULL, latitude FLOAT, longitude FLOAT);
+        CREATE TABLE user_settings (user_id INTEGER PRIMARY KEY, is_paused BOOLEAN DEFAULT FALSE);
+        CREATE TABLE likes (from_user_id INTEGER, to_user_id INTEGER);
+        CREATE TABLE passes (from_user_id INTEGER, to_user_id INTEGER);
+        CREATE TABLE matches (user_id INTEGER, matched_user_id INTEGER);
+    """)
+    await conn.execute(f"""
+        CREATE TABLE swipe_exclusions (
+            user_id INTEGER, chunk INTEGER NOT NULL, bits BIT({EXCLUSION_CHUNK_SIZE}) NOT NULL,
+            PRIMARY KEY (user_id, chunk)
+        )
+    """)
+    await conn.execute("""
+        INSERT INTO users (age, latitude, longitude)
+        SELECT 18 + (g % 30), $1 + (random() - 0.5) * 1.2, $2 + (random() - 0.5) * 1.2
+        FROM generate_series(1, $3) g
+    """, CENTER[0], CENTER[1], user_count)
+    await conn.execute("INSERT INTO user_settings (user_id) SELECT id FROM users")
+    await conn.execute("CREATE INDEX ON users (latitude, longitude)")
+    await conn.execute("CREATE INDEX ON likes (from_user_id)")
+    await conn.execute("ANALYZE")
+
+async def seed_swipes(conn, user_id: int, swipe_count: int, user_count: int):
+    await conn.execute("TRUNCATE likes, swipe_exclusions")
+    targets = random.sample(range(2, user_count + 1), swipe_count)
+    await conn.copy_records_to_table("likes", records=[(user_id, t) for t in targets], columns=["from_user_id", "to_user_id"])
+    await conn.execute(REBUILD_SQL, user_id)
+    await conn.execute("ANALYZE likes, swipe_exclusions")
+
+async def run_array(conn, user_id: int):
+    liked = await conn.fetch("SELECT to_user_id FROM likes WHERE from_user_id = $1", user_id)
+    excluded_ids = [row["to_user_id"] for row in liked] + [user_id]
+    rows = await conn.fetch(
+        ARRAY_QUERY, CENTER[0], CENTER[1], excluded_ids, 18, 60, float(MAX_DISTANCE), LIMIT,
+        *bounding_box(CENTER[0], CENTER[1], MAX_DISTANCE)
+    )
+    return [row["id"] for row in rows]
+
+async def run_bitmap(conn, user_id: int):
+    rows = await _fetch_discovery_rows(conn, "u.id", user_id, 18, 60, MAX_DISTANCE, CENTER[0], CENTER[1], LIMIT)
+    return [row["id"] for row in rows]
+
+async def measure(fn, conn, user_id: int, repeat: int):
+    result = await fn(conn, user_id)  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn(conn, user_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(timings), max(timings)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=150000)
+    parser.add_argument("--swipes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark schema afterwards")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        print(f"Seeding {args.users} users in schema {SCHEMA}...", flush=True)
+        await setup_schema(conn, args.users)
+        user_id = 1
+
+        print(f"{'swipes':>8} {'array p50':>10} {'array max':>10} {'bitmap p50':>11} {'bitmap max':>11} {'array bytes':>12} {'bitmap rows':>12}")
+        for swipe_count in args.swipes:
+            if swipe_count >= args.users:
+                print(f"{swipe_count:>8} skipped (needs more than {args.users} users)")
+                continue
+            await seed_swipes(conn, user_id, swipe_count, args.users)
+            array_ids, array_p50, array_max = await measure(run_array, conn, user_id, args.repeat)
+            bitmap_ids, bitmap_p50, bitmap_max = await measure(run_bitmap, conn, user_id, args.repeat)
+            if array_ids != bitmap_ids:
+                raise SystemExit(f"Result mismatch at {swipe_count} swipes: {array_ids} != {bitmap_ids}")
+            bitmap_rows = await conn.fetchval("SELECT count(*) FROM swipe_exclusions WHERE user_id = $1", user_id)
+            # asyncpg sends int4[] in binary: 4-byte length + 4-byte value per element
+            array_bytes = (swipe_count + 1) * 8
+            print(f"{swipe_count:>8} {array_p50:>9.2f}ms {array_max:>9.2f}ms {bitmap_p50:>10.2f}ms {bitmap_max:>10.2f}ms {array_bytes:>12} {bitmap_rows:>12}", flush=True)
+    finally:
+        if not args.keep:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Check that chat messages cross chat server replicas.
+
+Starts two chatserver.py processes with CHAT_MULTI_NODE=true against the
+Redis at REDIS_HOST/REDIS_PORT and the database at DATABASE_URL, connects one
+participant of a throwaway match to each, and sends a message from each side.
+Both messages must reach the client on the other node as ``new_message``.
+The seeded users (and with them the match and its messages) are deleted
+afterwards; the script exits non-zero if a message went missing:
+
+    uv run python benchmarks/check_multi_node.py
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import asyncpg
+import socketio
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database import DATABASE_URL
+from auth.session import create_session, delete_session
+
+USERNAME_PREFIX = "multinode_"
+
+async def seed(conn):
+    """Two users with a match between them; returns (user ids, match id)"""
+    ids = [row["id"] for row in await conn.fetch(f"""
+        INSERT INTO users (username, password_hash, first_name, email, birthday, gender, age,
+                           bio, interests, photos, latitude, longitude, city)
+        SELECT '{USERNAME_PREFIX}' || g || '_' || $1, 'x', 'Node', '{USERNAME_PREFIX}' || g || '_' || $1 || '@example.com',
+               '2000-01-01', 'female', 25, '', ARRAY[]::text[], ARRAY[]::text[], 25.03, 121.56, 'Taipei'
+        FROM generate_series(1, 2) g
+        RETURNING id
+    """, str(os.getpid()))]
+    match_id = await conn.fetchval(
+        "INSERT INTO matches (user_id, matched_user_id) VALUES ($1, $2) RETURNING id::text", *ids
+    )
+    return ids, match_id
+
+def start_node(port: int) -> subprocess.Popen:
+    env = dict(os.environ, CHAT_PORT=str(port), CHAT_MULTI_NODE="true")
+    return subprocess.Popen([sys.executable, "chatserver.py"], cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+async def wait_for_node(port: int, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Chat server on port {port} exited with {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Chat server on port {port} did not start")
+
+async def connect_participant(port: int, user_id: int, match_id: str):
+    """A client of the node on ``port``, joined to the match room, and its inbox"""
+    token = await create_session(user_id)
+    client = socketio.AsyncClient()
+    received = asyncio.Queue()
+    client.on("new_message", received.put)
+    await client.connect(f"http://127.0.0.1:{port}", transports=["websocket"], auth={"token": token})
+    # Acknowledged once the server has handled the join
+    await client.call("join_room", {"match_id": match_id})
+    return client, received, token
+
+async def expect_message(received: asyncio.Queue, text: str, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while (remaining := deadline - time.monotonic()) > 0:
+        try:
+            message = await asyncio.wait_for(received.get(), remaining)
+        except asyncio.TimeoutError:
+            break
+        if message["text"] == text:
+            return True
+    return False
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ports", type=int, nargs=2, default=[8766, 8767], metavar=("NODE_A", "NODE_B"))
+    parser.add_argument("--timeout", type=float, default=5, help="seconds to wait for each delivery")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(DATABASE_URL)
+    ids, match_id = await seed(conn)
+    processes = [start_node(port) for port in args.ports]
+    clients, tokens = [], []
+    failures = 0
+    try:
+        for port, process in zip(args.ports, processes):
+            await wait_for_node(port, process)
+        participants = []
+        for port, user_id in zip(args.ports, ids):
+            client, received, token = await connect_participant(port, user_id, match_id)
+            clients.append(client)
+            tokens.append(token)
+            participants.append((port, client, received))
+
+        for (from_port, sender, _), (to_port, _, received) in (participants, participants[::-1]):
+            text = f"multi-node check {from_port} -> {to_port}"
+            await sender.emit("send_message", {"match_id": match_id, "text": text})
+            delivered = await expect_message(received, text, args.timeout)
+            failures += not delivered
+            print(f"{'ok' if delivered else 'MISSING':<8} node :{from_port} -> node :{to_port}", flush=True)
+    finally:
+        for client in clients:
+            await client.disconnect()
+        for process in processes:
+            process.terminate()
+            process.wait()
+        for token in tokens:
+            await delete_session(token)
+        await conn.execute("DELETE FROM users WHERE id = ANY($1::int[])", ids)
+        await conn.close()
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Check that pausing an account takes it out of decks other users already have.
+
+Seeds a viewer and a handful of candidates in an empty spot of the Pacific,
+builds the viewer's discovery deck, then pauses the closest candidate (the
+top card) through the settings route. The next page must still be full, must
+not include the paused candidate, and the deck must no longer hold it. Runs
+against DATABASE_URL and the Redis at REDIS_HOST/REDIS_PORT; the seeded users
+and the viewer's deck are removed afterwards, and the script exits non-zero
+on failure:
+
+    uv run python benchmarks/check_paused_deck.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database import get_db, init_db_pool, close_db_pool
+from redis_pool import redis_client
+from discovery_deck import deck_key, deck_served_key, deck_signature, clear_deck, set_paused
+from api.routes import discovery
+from api.routes.settings import pause_account
+
+USERNAME_PREFIX = "pausedeck_"
+CENTER = (-41.0, -151.0)
+RADIUS_KM = 50
+
+SEED_SQL = f"""
+    WITH seeded AS (
+        INSERT INTO users (username, password_hash, first_name, email, birthday, gender, age,
+                           bio, interests, photos, latitude, longitude, city, last_seen)
+        SELECT '{USERNAME_PREFIX}' || g, 'x', 'Paused', '{USERNAME_PREFIX}' || g || '@example.com',
+               '1998-01-01', 'female', 28, '', ARRAY[]::text[], ARRAY[]::text[],
+               -- 0: the viewer, then candidates 1 km further out each
+               $1 + g * 0.009, $2, 'Nowhere', LOCALTIMESTAMP
+        FROM generate_series(0, $3) g
+        RETURNING id, username
+    ), settings AS (
+        INSERT INTO user_settings (user_id, max_distance, age_min, age_max)
+        SELECT id, {RADIUS_KM}, 18, 60 FROM seeded
+    )
+    SELECT id FROM seeded ORDER BY substr(username, {len(USERNAME_PREFIX) + 1})::int
+"""
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page", type=int, default=5, help="discovery page size")
+    args = parser.parse_args()
+    filters = (18, 60, RADIUS_KM, *CENTER)
+
+    await init_db_pool()
+    try:
+        async with get_db() as conn:
+            await conn.execute(f"DELETE FROM users WHERE username LIKE '{USERNAME_PREFIX}%'")
+            ids = [row["id"] for row in await conn.fetch(SEED_SQL, *CENTER, args.page * 2)]
+        viewer, paused = ids[0], ids[1]
+        try:
+            await clear_deck(viewer)
+            await discovery.rebuild_deck(viewer, deck_signature(discovery.DISCOVERY_RANKING, *filters), *filters)
+            dealt_before = await redis_client.zscore(deck_key(viewer), paused) is not None
+            await pause_account(paused, {"id": paused})
+            profiles, served = await discovery.get_users_from_deck(viewer, *filters, args.page)
+            still_in_deck = await redis_client.zscore(deck_key(viewer), paused) is not None
+        finally:
+            await set_paused(paused, False)
+            await clear_deck(viewer)
+            await redis_client.delete(deck_served_key(viewer))
+            async with get_db() as conn:
+                await conn.execute("DELETE FROM users WHERE id = ANY($1::int[])", ids)
+    finally:
+        await close_db_pool()
+
+    print(f"paused candidate in the deck before pausing: {dealt_before}, after serving: {still_in_deck}")
+    print(f"served {len(served)} of {args.page}, paused candidate {'included' if paused in served else 'left out'}")
+    ok = dealt_before and not still_in_deck and paused not in served and len(served) == args.page
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
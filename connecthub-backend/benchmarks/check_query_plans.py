@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Check that every query the route helpers issue is served by an index.
+
+Seeds a handful of users, drives the route helpers and handlers against the
+database at DATABASE_URL while recording each statement they send, then runs
+EXPLAIN on every recorded statement with sequential scans disabled. The
+planner still picks a Seq Scan when no index can serve a predicate, so any
+Seq Scan on an application table is reported and the script exits non-zero.
+
+Nothing runs this automatically; run it by hand after a schema or query
+change. It needs Redis at REDIS_HOST/REDIS_PORT as well, for the chat and
+discovery caches. Everything runs in one transaction that is rolled back, so
+it is safe to point at a migrated development database:
+
+    uv run alembic upgrade head
+    uv run python benchmarks/check_query_plans.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import uuid
+
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import DATABASE_URL, _init_connection
+from api.routes import auth, chat, discovery, matches, settings, users
+from read_receipts import advance_cursors
+from recent_messages import drop_recent
+from message_batcher import MessageBatcher
+from schemas.chat import ChatMessageCreate
+from schemas.like import SwipeDecision
+from schemas.settings import UserSettingsUpdate
+from schemas.user import UserUpdate
+
+APP_TABLES = {"users", "user_settings", "likes", "matches", "messages", "swipe_exclusions", "inbox", "message_archives", "passes"}
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+CENTER = (25.03, 121.56)
+
+class RecordingConnection(asyncpg.Connection):
+    """Connection that remembers every statement (and its arguments) it runs"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recorded = []
+        self.recording = False
+
+    def _record(self, query, args):
+        if self.recording:
+            self.recorded.append((query, args))
+
+    async def execute(self, query, *args, timeout=None):
+        self._record(query, args)
+        return await super().execute(query, *args, timeout=timeout)
+
+    async def executemany(self, command, args, *, timeout=None):
+        args = list(args)
+        if args:
+            self._record(command, tuple(args[0]))
+        return await super().executemany(command, args, timeout=timeout)
+
+    async def fetch(self, query, *args, timeout=None, record_class=None):
+        self._record(query, args)
+        return await super().fetch(query, *args, timeout=timeout, record_class=record_class)
+
+    async def fetchrow(self, query, *args, timeout=None, record_class=None):
+        self._record(query, args)
+        return await super().fetchrow(query, *args, timeout=timeout, record_class=record_class)
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        self._record(query, args)
+        return await super().fetchval(query, *args, column=column, timeout=timeout)
+
+class SingleConnectionPool:
+    """Stands in for the app pool so every helper shares one transaction.
+
+    Helpers open their own transactions through get_db(); on a connection
+    that is already in one, asyncpg turns those into savepoints.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        return self._conn
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+async def seed(conn, count: int):
+    ids = [row["id"] for row in await conn.fetch("""
+        INSERT INTO users (username, password_hash, first_name, email, birthday, gender, age,
+                           bio, interests, photos, latitude, longitude, city)
+        SELECT 'plancheck_' || g, 'x', 'Plan', 'plancheck_' || g || '@example.com', '2000-01-01', 'female', 25,
+               '', ARRAY[]::text[], ARRAY[]::text[], $1 + g * 0.001, $2, 'Taipei'
+        FROM generate_series(1, $3) g
+        RETURNING id
+    """, CENTER[0], CENTER[1], count)]
+    await conn.execute("""
+        INSERT INTO user_settings (user_id, max_distance, age_min, age_max)
+        SELECT unnest($1::int[]), 50, 18, 60
+    """, ids)
+    return ids
+
+async def exercise(conn, ids):
+    """Drive the route helpers; every statement they run gets recorded"""
+    me, a, b, c = ids[:4]
+    current = {"id": me}
+    lat, lon = CENTER
+
+    await auth.get_user_by_username("plancheck_1")
+    await users.load_user_from_db(me)
+    await users.update_user(me, UserUpdate(bio="plan check"), current_user=current)
+    await settings.get_user_settings(me, current_user=current)
+    await settings.update_user_settings(me, UserSettingsUpdate(max_distance=40), current_user=current)
+    await settings.pause_account(me, current_user=current)
+    await settings.reactivate_account(me, current_user=current)
+
+    await discovery.get_discovery_users(me, 18, 60, 50, lat, lon, 10)
+    if discovery.ranking is not None:
+        # The scored ranking's queries too, whichever DISCOVERY_RANKING is set
+        configured, discovery.DISCOVERY_RANKING = discovery.DISCOVERY_RANKING, "score"
+        try:
+            await discovery.get_discovery_candidates(me, 18, 60, 50, lat, lon, 10)
+        finally:
+            discovery.DISCOVERY_RANKING = configured
+
+    await matches.apply_swipes(a, [SwipeDecision(target_user_id=me)])
+    await matches.apply_swipes(b, [SwipeDecision(target_user_id=me, like_type="super")])
+    results, _ = await matches.apply_swipes(me, [
+        SwipeDecision(target_user_id=a),
+        SwipeDecision(target_user_id=b),
+        SwipeDecision(target_user_id=c, like_type="nope"),
+    ])
+    match_id = results[0]["match"]["id"]
+    _, next_cursor, _, _ = await matches.get_user_matches(me, limit=1)
+    await matches.get_user_matches(me, limit=1, cursor=next_cursor)
+
+    for i in range(3):
+        await chat.send_message(match_id, ChatMessageCreate(match_id=match_id, text=f"plan check {i}"), current_user=current)
+    await MessageBatcher._write([{
+        "id": str(uuid.uuid4()), "match_id": match_id,
+        "from_user_id": a, "text": "batched",
+    }])
+    _, older_cursor, _ = await chat.get_chat_messages(match_id, me, limit=2)
+    await chat.get_chat_messages(match_id, me, limit=2, cursor=older_cursor)
+    await chat.get_chat_messages(match_id, me, limit=2, cursor=older_cursor, direction="newer")
+    latest, _, _ = await chat.get_chat_messages(match_id, me, limit=1)
+    # A cache miss on the latest page checks for an archive before loading it
+    await drop_recent(match_id)
+    await chat.get_latest_messages(match_id, me, limit=2)
+    await advance_cursors([(match_id, me, json.loads(latest)[0]["id"], False)])
+    await advance_cursors([(match_id, me, json.loads(latest)[0]["id"], True)])
+
+    await users.delete_user(c, current_user={"id": c})
+
+def seq_scans(plan):
+    """Application tables read by a Seq Scan anywhere in a plan tree"""
+    found = []
+    # Partitions of messages are named messages_p00, messages_p01, ...
+    relation = re.sub(r"_p\d+$", "", plan.get("Relation Name", ""))
+    if plan.get("Node Type") == "Seq Scan" and relation in APP_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found += seq_scans(child)
+    return found
+
+def describe(query: str) -> str:
+    return " ".join(query.split())[:110]
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="users to seed")
+    parser.add_argument("--verbose", action="store_true", help="print the plan of every statement")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(DATABASE_URL, connection_class=RecordingConnection)
+    await _init_connection(conn)
+    database._pool = SingleConnectionPool(conn)
+    transaction = conn.transaction()
+    await transaction.start()
+    failures = 0
+    try:
+        ids = await seed(conn, args.users)
+        conn.recording = True
+        await exercise(conn, ids)
+        conn.recording = False
+
+        statements = {}
+        for query, query_args in conn.recorded:
+            if query.lstrip().upper().startswith(EXPLAINABLE):
+                statements.setdefault(query, query_args)
+
+        await conn.execute("SET LOCAL enable_seqscan = off")
+        for query, query_args in statements.items():
+            plan = json.loads(await conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *query_args))[0]["Plan"]
+            tables = seq_scans(plan)
+            if tables:
+                failures += 1
+            print(f"{'SEQ SCAN ' + ','.join(sorted(set(tables))) if tables else 'ok':<24} {describe(query)}")
+            if args.verbose:
+                print(json.dumps(plan, indent=2))
+        print(f"\n{len(statements)} statements checked, {failures} with sequential scans")
+    finally:
+        await transaction.rollback()
+        database._pool = None
+        await conn.close()
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Check that the scored discovery ranking sees nearby users however long ago
+they were last active.
+
+Seeds a viewer, DISCOVERY_RANKING_POOL recently active candidates near the
+edge of the viewer's radius who share none of the viewer's interests, and one
+candidate a few hundred metres away with the same interests who was last seen
+a month ago, so it is outside the newest DISCOVERY_RANKING_POOL. That
+candidate must still be ranked, and first. Runs against DATABASE_URL (the
+seeded users are deleted afterwards, in an empty spot of the Pacific so other
+data can't interfere) and exits non-zero on failure:
+
+    uv run --extra ranking python benchmarks/check_ranking_pool.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database import get_db, init_db_pool, close_db_pool
+from api.routes import discovery
+
+USERNAME_PREFIX = "rankpool_"
+CENTER = (-40.0, -150.0)
+RADIUS_KM = 50
+INTERESTS = ["Hiking", "Coffee", "Travel"]
+
+SEED_SQL = f"""
+    WITH seeded AS (
+        INSERT INTO users (username, password_hash, first_name, email, birthday, gender, age,
+                           bio, interests, photos, latitude, longitude, city, last_seen)
+        SELECT '{USERNAME_PREFIX}' || g, 'x', 'Pool', '{USERNAME_PREFIX}' || g || '@example.com',
+               '1998-01-01', 'female', 28, '',
+               CASE WHEN g <= 1 THEN $3::text[] ELSE ARRAY['Knitting'] END, ARRAY[]::text[],
+               -- 0: the viewer, 1: the nearby inactive match, the rest 40-49 km away
+               $1 + CASE WHEN g = 0 THEN 0 WHEN g = 1 THEN 0.003 ELSE 0.36 + (g % 9) * 0.009 END,
+               $2, 'Nowhere',
+               LOCALTIMESTAMP - CASE WHEN g = 1 THEN interval '30 days' ELSE g * interval '1 second' END
+        FROM generate_series(0, $4) g
+        RETURNING id, username
+    ), settings AS (
+        INSERT INTO user_settings (user_id, max_distance, age_min, age_max)
+        SELECT id, {RADIUS_KM}, 18, 60 FROM seeded
+    )
+    SELECT id FROM seeded ORDER BY substr(username, {len(USERNAME_PREFIX) + 1})::int
+"""
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=10, help="candidates to rank")
+    args = parser.parse_args()
+    if discovery.ranking is None:
+        sys.exit("numpy is not installed (the 'ranking' extra)")
+
+    await init_db_pool()
+    try:
+        async with get_db() as conn:
+            await conn.execute(f"DELETE FROM users WHERE username LIKE '{USERNAME_PREFIX}%'")
+            ids = [row["id"] for row in await conn.fetch(SEED_SQL, *CENTER, INTERESTS, discovery.DISCOVERY_RANKING_POOL + 1)]
+            await conn.execute("ANALYZE users, user_settings")
+        viewer, nearby = ids[0], ids[1]
+        try:
+            async with get_db() as conn:
+                newer = await conn.fetchval("""
+                    SELECT count(*) FROM users
+                    WHERE username LIKE $1 AND id <> $2 AND last_seen > (SELECT last_seen FROM users WHERE id = $3)
+                """, USERNAME_PREFIX + "%", viewer, nearby)
+            ranked = await discovery.get_discovery_candidates(viewer, 18, 60, RADIUS_KM, *CENTER, args.top)
+        finally:
+            async with get_db() as conn:
+                await conn.execute("DELETE FROM users WHERE id = ANY($1::int[])", ids)
+    finally:
+        await close_db_pool()
+
+    position = next((i for i, (user_id, _) in enumerate(ranked) if user_id == nearby), None)
+    print(f"{newer} candidates seen more recently than the nearby one, pool of {discovery.DISCOVERY_RANKING_POOL}")
+    print(f"nearby candidate ranked {'#' + str(position + 1) if position is not None else 'MISSING'} of {len(ranked)}")
+    sys.exit(0 if position == 0 and newer >= discovery.DISCOVERY_RANKING_POOL else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
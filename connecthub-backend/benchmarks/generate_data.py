@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic population at production scale.
+
+Users are clustered around cities (weighted by a Zipf-like city size), with
+skewed age and gender distributions; swipes, matches and messages follow
+power-law activity, so a few users do most of the swiping, a few profiles get
+most of the likes and a few conversations have most of the messages.
+
+Rows are generated lazily and streamed into Postgres with COPY from several
+connections at once, one id range at a time, so memory stays flat whatever
+the size. Likes, passes, matches, the swipe bitmaps and inbox rows are derived
+set-based in the database. New users get ids above the current maximum, so
+the generator can also top up an existing database:
+
+    uv run python benchmarks/generate_data.py --users 5000000
+    uv run python benchmarks/generate_data.py --users 100000 --truncate --seed 7
+
+Stages are not atomic; if a run fails, start over with --truncate.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DATABASE_URL
+from inbox import REBUILD_SQL as REBUILD_INBOX_SQL
+from swipe_exclusions import EXCLUSION_CHUNK_BITS, EXCLUSION_CHUNK_SIZE, EXCLUSION_OFFSET_MASK
+
+PASSWORD = "password"
+USERNAME_PREFIX = "gen_"
+UNIT_USERS = 20_000  # users per unit of parallel work
+
+# (city, latitude, longitude); populations fall off as 1/rank
+CITIES = [
+    ("Taipei", 25.033, 121.565), ("New York", 40.713, -74.006), ("London", 51.507, -0.128),
+    ("Tokyo", 35.690, 139.692), ("Los Angeles", 34.052, -118.244), ("Paris", 48.857, 2.352),
+    ("Singapore", 1.352, 103.820), ("Berlin", 52.520, 13.405), ("Sydney", -33.869, 151.209),
+    ("Chicago", 41.878, -87.630), ("Toronto", 43.653, -79.383), ("Seoul", 37.567, 126.978),
+    ("Madrid", 40.417, -3.704), ("Miami", 25.762, -80.192), ("Kaohsiung", 22.627, 120.301),
+    ("Amsterdam", 52.368, 4.904), ("Austin", 30.267, -97.743), ("Melbourne", -37.814, 144.963),
+    ("Taichung", 24.148, 120.674), ("Lisbon", 38.722, -9.139),
+]
+GENDER_NAMES = ["female", "male", "non-binary"]
+GENDER_WEIGHTS = [0.48, 0.48, 0.04]
+FIRST_NAMES = {
+    "female": ["Emma", "Sofia", "Olivia", "Mia", "Yu-Ting", "Hana", "Chloe", "Ava", "Lucia", "Mei"],
+    "male": ["James", "Mike", "Liam", "Noah", "Wei", "Kenji", "Lucas", "Ethan", "Mateo", "Jun"],
+    "non-binary": ["Alex", "Sam", "Jordan", "Robin", "Kai", "Riley"],
+}
+LAST_NAMES = ["Wilson", "Rodriguez", "Chen", "Kim", "Smith", "Lin", "Garcia", "Tanaka", "Müller", "Wang", "Brown", "Lee"]
+INTERESTS = ["Photography", "Travel", "Coffee", "Hiking", "Music", "Cooking", "Fitness", "Art", "Movies",
+             "Reading", "Gaming", "Yoga", "Dogs", "Cats", "Wine", "Running", "Dancing", "Tech", "Food", "Beach"]
+BIOS = [
+    "Love traveling and photography. Always up for new adventures!",
+    "Coffee first, then we talk.",
+    "Weekend hiker, weekday coder.",
+    "Looking for someone to try every ramen place in town with.",
+    "Gym, books and bad puns.",
+    "",
+]
+MESSAGES = [
+    "Hi there! Nice to match with you 😊", "Hey! How's your day going?", "Haha that's amazing",
+    "What are you up to this weekend?", "I love that place too!", "Coffee sometime?",
+    "Sorry, just saw this!", "That photo is great, where was it taken?", "Sounds good 👍",
+    "Have you been to the night market?", "I'm more of a dog person tbh", "Good morning!",
+]
+
+def power_law(rng: random.Random, mean: float, alpha: float, cap: int) -> int:
+    """Pareto-distributed count with the given mean (alpha > 1), capped"""
+    if mean <= 0:
+        return 0
+    scale = mean * (alpha - 1) / alpha
+    return min(int(scale * rng.paretovariate(alpha)), cap)
+
+def city_blocks(user_count: int, first_id: int):
+    """Contiguous id range per city, sized by 1/rank; [(city, lat, lon, start, end)]"""
+    weights = [1 / rank for rank in range(1, len(CITIES) + 1)]
+    total = sum(weights)
+    blocks, start = [], first_id
+    for i, (city, lat, lon) in enumerate(CITIES):
+        size = user_count - (start - first_id) if i == len(CITIES) - 1 else round(user_count * weights[i] / total)
+        blocks.append((city, lat, lon, start, start + size))
+        start += size
+    return [block for block in blocks if block[4] > block[3]]
+
+def work_units(blocks):
+    """Split the city blocks into (block, start, end) units of at most UNIT_USERS ids"""
+    for block in blocks:
+        for start in range(block[3], block[4], UNIT_USERS):
+            yield block, start, min(start + UNIT_USERS, block[4])
+
+def unit_rng(seed: int, stage: str, start: int) -> random.Random:
+    """Independent, reproducible stream per stage and unit, whatever the job order"""
+    return random.Random(f"{seed}:{stage}:{start}")
+
+def generate_users(rng: random.Random, block, start: int, end: int, largest: int, password_hash: str, now: datetime):
+    city, lat, lon, block_start, block_end = block
+    today = now.date()
+    # Bigger cities sprawl further
+    spread = 0.05 + 0.25 * (block_end - block_start) / largest
+    for user_id in range(start, end):
+        gender = rng.choices(GENDER_NAMES, weights=GENDER_WEIGHTS)[0]
+        age = min(18 + int(rng.gammavariate(2.0, 5.0)), 70)
+        created_at = now - timedelta(seconds=rng.random() * 2 * 365 * 86400)
+        photo = f"https://cdn.example.com/u/{user_id}/"
+        yield (
+            user_id, f"{USERNAME_PREFIX}{user_id}", password_hash,
+            rng.choice(FIRST_NAMES[gender]), rng.choice(LAST_NAMES), f"{USERNAME_PREFIX}{user_id}@example.com",
+            date(today.year - age, rng.randint(1, 12), rng.randint(1, 28)), gender, age,
+            rng.choice(BIOS), rng.sample(INTERESTS, rng.randint(2, 5)),
+            [photo + f"{i}.jpg" for i in range(rng.randint(1, 4))], photo + "0.jpg",
+            lat + rng.gauss(0, spread), lon + rng.gauss(0, spread), city,
+            rng.random() < 0.9, now - timedelta(seconds=rng.expovariate(1 / 86400) * 7),
+            created_at, created_at, rng.random() < 0.3, rng.random() < 0.08,
+        )
+
+USER_COLUMNS = [
+    "id", "username", "password_hash", "first_name", "last_name", "email", "birthday", "gender", "age",
+    "bio", "interests", "photos", "photo_url", "latitude", "longitude", "city",
+    "is_active", "last_seen", "created_at", "updated_at", "is_verified", "is_premium",
+]
+
+def generate_settings(rng: random.Random, start: int, end: int):
+    for user_id in range(start, end):
+        age_min = rng.choice([18, 18, 21, 25, 28])
+        yield (user_id, rng.choice([10, 25, 50, 50, 100]), age_min, age_min + rng.choice([10, 15, 20, 30]),
+               True, rng.random() < 0.03)
+
+SETTINGS_COLUMNS = ["user_id", "max_distance", "age_min", "age_max", "show_me_in_discovery", "is_paused"]
+
+def generate_swipes(rng: random.Random, block, start: int, end: int, args, now: datetime):
+    """(from, to, type, created_at) swipes within the user's city.
+
+    Swipe counts per user are power-law, and targets are skewed toward the
+    start of the city's id range so a few profiles collect most likes. A
+    share of likes is answered with a like back, which becomes a match.
+    """
+    block_start, block_end = block[3], block[4]
+    size = block_end - block_start
+    for user_id in range(start, end):
+        targets = set()
+        for _ in range(power_law(rng, args.swipes_mean, args.activity_alpha, min(size - 1, args.max_swipes))):
+            target = block_start + int(size * rng.random() ** args.popularity_skew)
+            if target == user_id or target in targets:
+                continue
+            targets.add(target)
+            swiped_at = now - timedelta(seconds=rng.random() * 90 * 86400)
+            roll = rng.random()
+            if roll < args.nope_rate:
+                yield (user_id, target, "nope", swiped_at)
+                continue
+            yield (user_id, target, "super" if roll > 0.98 else "like", swiped_at)
+            if rng.random() < args.match_rate:
+                yield (target, user_id, "like", swiped_at + timedelta(seconds=rng.expovariate(1 / 3600)))
+
+SWIPE_COLUMNS = ["from_user_id", "to_user_id", "type", "created_at"]
+
+def generate_messages(rng: random.Random, matches, args, now: datetime):
+    for match in matches:
+        sent_at = match["matched_at"]
+        senders = (match["user_id"], match["matched_user_id"])
+        sender = rng.randrange(2)
+        for _ in range(power_law(rng, args.messages_mean, args.activity_alpha, args.max_messages)):
+            sent_at += timedelta(seconds=rng.expovariate(1 / 1800))
+            if sent_at > now:
+                break
+            if rng.random() < 0.6:
+                sender = 1 - sender
+            yield (match["id"], senders[sender], rng.choice(MESSAGES), sent_at, "read")
+
+MESSAGE_COLUMNS = ["match_id", "from_user_id", "text", "sent_at", "status"]
+
+# Likes from the staged swipes. A generated like back can collide with an
+# independent like between the same pair; DO NOTHING keeps one of them.
+INSERT_LIKES_SQL = """
+    INSERT INTO likes (from_user_id, to_user_id, type, created_at)
+    SELECT from_user_id, to_user_id, type, created_at FROM generated_swipes
+    WHERE from_user_id BETWEEN $1 AND $2 AND type <> 'nope'
+    ON CONFLICT DO NOTHING
+"""
+
+INSERT_PASSES_SQL = """
+    INSERT INTO passes (from_user_id, to_user_id, created_at)
+    SELECT from_user_id, to_user_id, created_at FROM generated_swipes
+    WHERE from_user_id BETWEEN $1 AND $2 AND type = 'nope'
+    ON CONFLICT DO NOTHING
+"""
+
+# Mutual likes become matches, owned by the lower user id
+INSERT_MATCHES_SQL = """
+    INSERT INTO matches (user_id, matched_user_id, matched_at, is_new_match)
+    SELECT l.from_user_id, l.to_user_id, greatest(l.created_at, r.created_at), false
+    FROM likes l
+    JOIN likes r ON r.from_user_id = l.to_user_id AND r.to_user_id = l.from_user_id
+    WHERE l.from_user_id BETWEEN $1 AND $2 AND l.from_user_id < l.to_user_id
+    ON CONFLICT DO NOTHING
+"""
+
+INSERT_EXCLUSIONS_SQL = f"""
+    INSERT INTO swipe_exclusions (user_id, chunk, bits)
+    SELECT from_user_id, to_user_id >> {EXCLUSION_CHUNK_BITS},
+           bit_or(set_bit(0::bit({EXCLUSION_CHUNK_SIZE}), to_user_id & {EXCLUSION_OFFSET_MASK}, 1))
+    FROM generated_swipes
+    WHERE from_user_id BETWEEN $1 AND $2
+    GROUP BY 1, 2
+    ON CONFLICT (user_id, chunk) DO UPDATE SET bits = swipe_exclusions.bits | EXCLUDED.bits
+"""
+
+SET_LAST_MESSAGE_SQL = """
+    UPDATE matches m SET last_message_id = (
+        SELECT id FROM messages WHERE match_id = m.id ORDER BY sent_at DESC, id DESC LIMIT 1
+    )
+    WHERE m.user_id BETWEEN $1 AND $2
+"""
+
+async def run_stage(pool, label: str, units, jobs: int, work):
+    """Run work(conn, unit) -> row count over all units on `jobs` connections.
+
+    Each job generates rows for one unit while Postgres ingests another's, so
+    index maintenance, the usual bottleneck, runs on several backends.
+    """
+    start = time.perf_counter()
+    pending = iter(units)
+    total = 0
+
+    async def job():
+        nonlocal total
+        for unit in pending:
+            async with pool.acquire() as conn:
+                count = await work(conn, unit)
+            total += count
+
+    await asyncio.gather(*(job() for _ in range(jobs)))
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {total:,} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f}/s)", flush=True)
+
+def row_count(status: str) -> int:
+    """Rows affected from a command tag like 'COPY 10' or 'INSERT 0 10'"""
+    return int(status.split()[-1])
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--swipes-mean", type=float, default=12, help="mean swipes per user")
+    parser.add_argument("--max-swipes", type=int, default=2000)
+    parser.add_argument("--nope-rate", type=float, default=0.6, help="share of swipes that are passes")
+    parser.add_argument("--match-rate", type=float, default=0.15, help="share of likes that are liked back")
+    parser.add_argument("--messages-mean", type=float, default=8, help="mean messages per match")
+    parser.add_argument("--max-messages", type=int, default=5000)
+    parser.add_argument("--activity-alpha", type=float, default=1.6, help="Pareto shape for activity (lower is more skewed)")
+    parser.add_argument("--popularity-skew", type=float, default=2.5, help="how strongly likes concentrate on popular profiles")
+    parser.add_argument("--jobs", type=int, default=4, help="parallel database connections")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--truncate", action="store_true", help="delete ALL existing users and their data first")
+    args = parser.parse_args()
+    if args.activity_alpha <= 1:
+        parser.error("--activity-alpha must be greater than 1")
+
+    from auth.passwords import hash_password
+    password_hash = await hash_password(PASSWORD)
+    now = datetime.now()
+    started = time.perf_counter()
+
+    # Generated data can be regenerated, so don't wait for WAL flushes
+    pool = await asyncpg.create_pool(DATABASE_URL, min_size=args.jobs, max_size=args.jobs,
+                                     server_settings={"synchronous_commit": "off"})
+    try:
+        async with pool.acquire() as conn:
+            if args.truncate:
+                await conn.execute("TRUNCATE users, user_settings, user_sessions, likes, passes, matches, messages, inbox, swipe_exclusions, message_archives")
+            # Reserve an id block above the current maximum
+            async with conn.transaction():
+                await conn.execute("LOCK TABLE users IN SHARE ROW EXCLUSIVE MODE")
+                first_id = await conn.fetchval("SELECT coalesce(max(id), 0) + 1 FROM users")
+                last_id = first_id + args.users - 1
+                await conn.execute("SELECT setval(pg_get_serial_sequence('users', 'id'), $1)", last_id)
+            await conn.execute("DROP TABLE IF EXISTS generated_swipes")
+            await conn.execute("""
+                CREATE UNLOGGED TABLE generated_swipes (
+                    from_user_id INTEGER, to_user_id INTEGER, type VARCHAR(20), created_at TIMESTAMP
+                )
+            """)
+
+        blocks = city_blocks(args.users, first_id)
+        units = list(work_units(blocks))
+        largest = max(block[4] - block[3] for block in blocks)
+
+        async def copy_users(conn, unit):
+            block, start, end = unit
+            rows = generate_users(unit_rng(args.seed, "users", start), block, start, end, largest, password_hash, now)
+            return row_count(await conn.copy_records_to_table("users", records=rows, columns=USER_COLUMNS))
+
+        async def copy_settings(conn, unit):
+            _, start, end = unit
+            rows = generate_settings(unit_rng(args.seed, "settings", start), start, end)
+            return row_count(await conn.copy_records_to_table("user_settings", records=rows, columns=SETTINGS_COLUMNS))
+
+        async def copy_swipes(conn, unit):
+            block, start, end = unit
+            rows = generate_swipes(unit_rng(args.seed, "swipes", start), block, start, end, args, now)
+            return row_count(await conn.copy_records_to_table("generated_swipes", records=rows, columns=SWIPE_COLUMNS))
+
+        async def copy_messages(conn, unit):
+            _, start, end = unit
+            matches = await conn.fetch("""
+                SELECT id, user_id, matched_user_id, matched_at FROM matches
+                WHERE user_id BETWEEN $1 AND $2
+            """, start, end - 1)
+            rows = generate_messages(unit_rng(args.seed, "messages", start), matches, args, now)
+            return row_count(await conn.copy_records_to_table("messages", records=rows, columns=MESSAGE_COLUMNS))
+
+        def range_statement(query):
+            async def work(conn, unit):
+                _, start, end = unit
+                return row_count(await conn.execute(query, start, end - 1))
+            return work
+
+        await run_stage(pool, "users", units, args.jobs, copy_users)
+        await run_stage(pool, "user_settings", units, args.jobs, copy_settings)
+        await run_stage(pool, "swipes", units, args.jobs, copy_swipes)
+        async with pool.acquire() as conn:
+            await conn.execute("CREATE INDEX ON generated_swipes (from_user_id)")
+        await run_stage(pool, "likes", units, args.jobs, range_statement(INSERT_LIKES_SQL))
+        await run_stage(pool, "passes", units, args.jobs, range_statement(INSERT_PASSES_SQL))
+        await run_stage(pool, "swipe_exclusions", units, args.jobs, range_statement(INSERT_EXCLUSIONS_SQL))
+        await run_stage(pool, "matches", units, args.jobs, range_statement(INSERT_MATCHES_SQL))
+        await run_stage(pool, "messages", units, args.jobs, copy_messages)
+        await run_stage(pool, "last messages", units, args.jobs, range_statement(SET_LAST_MESSAGE_SQL))
+        await run_stage(pool, "inbox", units, args.jobs, range_statement(REBUILD_INBOX_SQL))
+
+        async with pool.acquire() as conn:
+            await conn.execute("DROP TABLE generated_swipes")
+            await conn.execute("ANALYZE users, user_settings, likes, passes, matches, messages, inbox, swipe_exclusions")
+        print(f"Generated users {first_id}..{last_id} in {time.perf_counter() - started:.1f}s "
+              f"(log in as {USERNAME_PREFIX}<id> / {PASSWORD})")
+    finally:
+        await pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
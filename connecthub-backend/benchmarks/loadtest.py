@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+Load test for the HTTP API.
+
+Seeds the database at DATABASE_URL with users scaled up from mock_data/*.json
+(plus matches, likes and chat history between them), starts the app from
+main.py on a local port, and drives it with a mix of login, discovery, like,
+match list, chat history and settings requests. Reports throughput,
+p50/p95/p99 latency and database queries per request for each route, and
+writes the numbers to a JSON file so runs can be compared:
+
+    uv run python benchmarks/loadtest.py --users 2000 --duration 60 --concurrency 32
+    uv run python benchmarks/loadtest.py --no-seed --compare benchmarks/results/<earlier run>.json
+
+Redis is used from REDIS_URL as usual. Seeded users are named ``loadtest_*``
+and are replaced on every seeding run.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import asyncpg
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database import DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_STATEMENT_CACHE_SIZE, DB_COMMAND_TIMEOUT, InstrumentedConnection, _init_connection
+from sql_profiler import is_bookkeeping
+
+MOCK_DATA_DIR = os.path.join(BACKEND_DIR, "mock_data")
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+USERNAME_PREFIX = "loadtest_"
+PASSWORD = "loadtest-password"
+QUERY_COUNT_HEADER = "x-db-queries"
+
+# Relative weight of each action in the traffic mix
+TRAFFIC_MIX = {
+    "discovery": 30,
+    "like": 20,
+    "matches": 20,
+    "chat_history": 20,
+    "settings": 5,
+    "login": 5,
+}
+
+# -- server side: the app with a per-request query counter ------------------
+
+_request_queries: contextvars.ContextVar = contextvars.ContextVar("request_queries", default=None)
+
+class CountingConnection(InstrumentedConnection):
+    """Counts statements against the current request (transaction control and
+    the pool's reset on release excluded, as in sql_profiler)"""
+
+    def _count(self, query):
+        counter = _request_queries.get()
+        if counter is not None and not is_bookkeeping(query):
+            counter[0] += 1
+
+    async def execute(self, query, *args, timeout=None):
+        self._count(query)
+        return await super().execute(query, *args, timeout=timeout)
+
+    async def executemany(self, command, args, *, timeout=None):
+        self._count(command)
+        return await super().executemany(command, args, timeout=timeout)
+
+    async def fetch(self, query, *args, timeout=None, record_class=None):
+        self._count(query)
+        return await super().fetch(query, *args, timeout=timeout, record_class=record_class)
+
+    async def fetchrow(self, query, *args, timeout=None, record_class=None):
+        self._count(query)
+        return await super().fetchrow(query, *args, timeout=timeout, record_class=record_class)
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        self._count(query)
+        return await super().fetchval(query, *args, column=column, timeout=timeout)
+
+class QueryCountMiddleware:
+    """Reports the statements a request ran in a response header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        counter = [0]
+        token = _request_queries.set(counter)
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (QUERY_COUNT_HEADER.encode(), str(counter[0]).encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _request_queries.reset(token)
+
+async def serve(port: int):
+    import uvicorn
+    import database
+    from main import app
+
+    # Created before startup, so the lifespan's init_db_pool() keeps this pool
+    database._pool = await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        init=_init_connection,
+        connection_class=CountingConnection,
+    )
+    app.add_middleware(QueryCountMiddleware)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    await server.serve()
+
+# -- seeding ----------------------------------------------------------------
+
+def load_mock(name: str):
+    with open(os.path.join(MOCK_DATA_DIR, f"{name}.json")) as f:
+        return json.load(f)
+
+async def seed(conn, user_count: int, matches_per_user: int, messages_per_match: int, rng: random.Random):
+    """Replace the loadtest_* users with user_count copies of the mock users"""
+    from auth.passwords import hash_password
+    from inbox import REBUILD_SQL
+    from swipe_exclusions import add_exclusion_pairs
+
+    templates = load_mock("users")
+    settings_by_user = {s["user_id"]: s for s in load_mock("settings")}
+    texts = [m["text"] for m in load_mock("messages")]
+    password_hash = await hash_password(PASSWORD)
+    now = datetime.now()
+
+    await conn.execute("DELETE FROM users WHERE username LIKE $1", USERNAME_PREFIX + "%")
+    users = []
+    for i in range(user_count):
+        t = templates[i % len(templates)]
+        loc = t["location"]
+        users.append((
+            f"{USERNAME_PREFIX}{i}", t["first_name"], t["last_name"], f"{USERNAME_PREFIX}{i}@example.com",
+            date.fromisoformat(t["birthday"]), t["gender"], min(max(t["age"] + rng.randint(-4, 4), 18), 60),
+            t["bio"], t["interests"], t["photos"], t["photo_url"],
+            loc["latitude"] + rng.uniform(-0.2, 0.2), loc["longitude"] + rng.uniform(-0.2, 0.2), loc["city"],
+            t["is_verified"], t["is_premium"],
+        ))
+    columns = list(zip(*users))
+    user_ids = [row["id"] for row in await conn.fetch("""
+        INSERT INTO users (username, password_hash, first_name, last_name, email, birthday, gender, age,
+                           bio, interests, photos, photo_url, latitude, longitude, city, is_verified, is_premium)
+        SELECT u.username, $1, u.first_name, u.last_name, u.email, u.birthday, u.gender, u.age,
+               u.bio, string_to_array(u.interests, '|'), string_to_array(u.photos, '|'), u.photo_url,
+               u.latitude, u.longitude, u.city, u.is_verified, u.is_premium
+        FROM unnest($2::text[], $3::text[], $4::text[], $5::text[], $6::date[], $7::text[], $8::int[],
+                    $9::text[], $10::text[], $11::text[], $12::text[], $13::float8[], $14::float8[], $15::text[],
+                    $16::bool[], $17::bool[])
+             WITH ORDINALITY AS u(username, first_name, last_name, email, birthday, gender, age, bio, interests,
+                                  photos, photo_url, latitude, longitude, city, is_verified, is_premium, position)
+        ORDER BY u.position
+        RETURNING id
+    """, password_hash, *columns[:8], ["|".join(v) for v in columns[8]], ["|".join(v) for v in columns[9]], *columns[10:])]
+
+    settings = [settings_by_user[templates[i % len(templates)]["id"]] for i in range(user_count)]
+    await conn.execute("""
+        INSERT INTO user_settings (user_id, max_distance, age_min, age_max, is_paused)
+        SELECT * FROM unnest($1::int[], $2::int[], $3::int[], $4::int[], $5::bool[])
+    """, user_ids, [s["max_distance"] for s in settings], [s["age_range"]["min"] for s in settings],
+        [s["age_range"]["max"] for s in settings], [s["is_paused"] for s in settings])
+
+    # Users only match others cloned from the same template, i.e. in the same city
+    step = len(templates)
+    pairs = [(user_ids[i], user_ids[i + step * k]) for i in range(user_count)
+             for k in range(1, matches_per_user + 1) if i + step * k < user_count]
+    if pairs:
+        await conn.execute("""
+            INSERT INTO likes (from_user_id, to_user_id, type)
+            SELECT a, b, 'like' FROM unnest($1::int[], $2::int[]) AS p(a, b)
+            UNION ALL
+            SELECT b, a, 'like' FROM unnest($1::int[], $2::int[]) AS p(a, b)
+        """, [a for a, _ in pairs], [b for _, b in pairs])
+        await add_exclusion_pairs(conn, pairs + [(b, a) for a, b in pairs])
+        match_rows = await conn.fetch("""
+            INSERT INTO matches (user_id, matched_user_id, matched_at, is_new_match)
+            SELECT a, b, $3::timestamp - random() * interval '30 days', false
+            FROM unnest($1::int[], $2::int[]) AS p(a, b)
+            RETURNING id, user_id, matched_user_id, matched_at
+        """, [a for a, _ in pairs], [b for _, b in pairs], now)
+
+        messages = []
+        for match in match_rows:
+            sent_at = match["matched_at"]
+            for j in range(messages_per_match):
+                sent_at += timedelta(minutes=rng.randint(1, 600))
+                sender = match["user_id"] if j % 2 == 0 else match["matched_user_id"]
+                messages.append((match["id"], sender, texts[j % len(texts)], min(sent_at, now)))
+        if messages:
+            await conn.execute("""
+                INSERT INTO messages (match_id, from_user_id, text, sent_at, status)
+                SELECT m, f, t, s, 'read' FROM unnest($1::uuid[], $2::int[], $3::text[], $4::timestamp[]) AS x(m, f, t, s)
+            """, *zip(*messages))
+            await conn.execute("""
+                UPDATE matches m SET last_message_id = last.id
+                FROM (
+                    SELECT DISTINCT ON (match_id) match_id, id FROM messages
+                    WHERE match_id = ANY($1::uuid[])
+                    ORDER BY match_id, sent_at DESC, id DESC
+                ) last
+                WHERE m.id = last.match_id
+            """, [match["id"] for match in match_rows])
+        await conn.execute(REBUILD_SQL, min(user_ids), max(user_ids))
+    await conn.execute("ANALYZE")
+    return len(user_ids), len(pairs)
+
+# -- client side ------------------------------------------------------------
+
+class HttpClient:
+    """Minimal keep-alive HTTP/1.1 client (JSON in, JSON out)"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method: str, path: str, body=None, token: str = None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Length: {len(payload)}\r\n"
+        if body is not None:
+            head += "Content-Type: application/json\r\n"
+        if token:
+            head += f"Authorization: Bearer {token}\r\n"
+        self.writer.write(head.encode() + b"\r\n" + payload)
+        try:
+            status = int((await self.reader.readline()).split()[1])
+            headers = {}
+            while (line := await self.reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode().partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if headers.get("transfer-encoding") == "chunked":
+                data = b""
+                while size := int((await self.reader.readline()).strip(), 16):
+                    data += await self.reader.readexactly(size)
+                    await self.reader.readline()
+                await self.reader.readline()
+            else:
+                data = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        except (IndexError, ValueError, asyncio.IncompleteReadError, ConnectionError):
+            await self.close()
+            raise ConnectionError(f"{method} {path}: connection dropped")
+        if headers.get("connection") == "close":
+            await self.close()
+        return status, headers, json.loads(data) if data else None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+class RouteStats:
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+        self.statuses = {}
+
+    def record(self, latency_ms: float, status: int, queries):
+        self.latencies.append(latency_ms)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status >= 400:
+            self.errors += 1
+        if queries is not None:
+            self.queries.append(int(queries))
+
+    def summary(self, duration: float):
+        latencies = sorted(self.latencies)
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+            "throughput_rps": round(len(latencies) / duration, 2),
+            "latency_ms": {
+                "mean": round(statistics.fmean(latencies), 3) if latencies else None,
+                "p50": round(cuts[49], 3) if cuts else None,
+                "p95": round(cuts[94], 3) if cuts else None,
+                "p99": round(cuts[98], 3) if cuts else None,
+                "max": round(latencies[-1], 3) if latencies else None,
+            },
+            "db_queries_per_request": {
+                "mean": round(statistics.fmean(self.queries), 2) if self.queries else None,
+                "max": max(self.queries) if self.queries else None,
+            },
+        }
+
+class VirtualUser:
+    """One simulated client: logs in, then picks weighted actions until the deadline"""
+
+    def __init__(self, client: HttpClient, username: str, stats, rng: random.Random):
+        self.client = client
+        self.username = username
+        self.stats = stats
+        self.rng = rng
+        self.token = None
+        self.user_id = None
+        self.candidates = []
+        self.match_ids = []
+
+    async def call(self, route: str, method: str, path: str, body=None):
+        start = time.perf_counter()
+        status, headers, data = await self.client.request(method, path, body, self.token)
+        self.stats[route].record((time.perf_counter() - start) * 1000, status, headers.get(QUERY_COUNT_HEADER))
+        return status, data
+
+    async def login(self):
+        status, data = await self.call("login", "POST", "/api/auth/login", {"username": self.username, "password": PASSWORD})
+        if status == 200:
+            self.token = data["session_token"]
+            _, _, me = await self.client.request("GET", "/api/auth/me", token=self.token)
+            self.user_id = me["data"]["id"]
+
+    async def discovery(self):
+        status, data = await self.call("discovery", "GET", "/api/discover/?limit=10")
+        if status == 200:
+            self.candidates = [user["id"] for user in data["data"]["users"]]
+
+    async def like(self):
+        if not self.candidates:
+            return await self.discovery()
+        target = self.candidates.pop()
+        like_type = self.rng.choices(["like", "nope", "super"], weights=[60, 35, 5])[0]
+        await self.call("like", "POST", "/api/matches/like", {"target_user_id": target, "like_type": like_type})
+
+    async def matches(self):
+        status, data = await self.call("matches", "GET", "/api/matches/?limit=20")
+        if status == 200:
+            self.match_ids = [match["id"] for match in data["data"]["items"]]
+
+    async def chat_history(self):
+        if not self.match_ids:
+            return await self.matches()
+        await self.call("chat_history", "GET", f"/api/chat/{self.rng.choice(self.match_ids)}/messages?limit=50")
+
+    async def settings(self):
+        await self.call("settings", "PUT", f"/api/settings/{self.user_id}", {"max_distance": self.rng.randint(40, 60)})
+
+    async def run(self, deadline: float):
+        await self.login()
+        actions = list(TRAFFIC_MIX)
+        weights = list(TRAFFIC_MIX.values())
+        while time.perf_counter() < deadline:
+            if self.token is None:
+                await self.login()
+                continue
+            await getattr(self, self.rng.choices(actions, weights=weights)[0])()
+
+async def wait_for_server(client: HttpClient, process, timeout: float = 30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit("API server exited during startup")
+        try:
+            status, _, _ = await client.request("GET", "/health")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit("API server did not become healthy")
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(results, previous=None):
+    print(f"\n{'route':<14} {'reqs':>7} {'rps':>8} {'err':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for route, r in results["routes"].items():
+        lat = r["latency_ms"]
+        if not r["requests"]:
+            continue
+        queries = r["db_queries_per_request"]["mean"]
+        line = (f"{route:<14} {r['requests']:>7} {r['throughput_rps']:>8.1f} {r['errors']:>5} "
+                f"{lat['p50']:>8.2f} {lat['p95']:>8.2f} {lat['p99']:>8.2f} {queries if queries is not None else '-':>8}")
+        before = previous and previous["routes"].get(route)
+        if before and before["requests"]:
+            line += (f"   p95 {lat['p95'] - before['latency_ms']['p95']:+.2f}ms"
+                     f", rps {r['throughput_rps'] - before['throughput_rps']:+.1f}")
+        print(line)
+    total = results["total"]
+    print(f"\n{total['requests']} requests in {results['duration_s']}s, "
+          f"{total['throughput_rps']} req/s, {total['errors']} errors")
+
+async def run_load(args):
+    rng = random.Random(args.seed)
+    if not args.no_seed:
+        conn = await asyncpg.connect(DATABASE_URL)
+        await _init_connection(conn)
+        try:
+            print(f"Seeding {args.users} users...", flush=True)
+            async with conn.transaction():
+                user_count, match_count = await seed(conn, args.users, args.matches_per_user, args.messages_per_match, rng)
+            print(f"Seeded {user_count} users, {match_count} matches", flush=True)
+        finally:
+            await conn.close()
+
+    process = None
+    if args.base_url:
+        host, _, port = args.base_url.removeprefix("http://").rstrip("/").partition(":")
+        port = int(port or 80)
+    else:
+        host, port = "127.0.0.1", args.port
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port)], cwd=BACKEND_DIR)
+    try:
+        probe = HttpClient(host, port)
+        await wait_for_server(probe, process)
+        await probe.close()
+
+        usernames = [f"{USERNAME_PREFIX}{i}" for i in range(args.users)]
+        stats = {route: RouteStats() for route in TRAFFIC_MIX}
+        clients = [HttpClient(host, port) for _ in range(args.concurrency)]
+        users = [VirtualUser(client, rng.choice(usernames), stats, random.Random(rng.random())) for client in clients]
+        print(f"Running {args.concurrency} virtual users for {args.duration}s against {host}:{port}...", flush=True)
+        started_at = datetime.now()
+        start = time.perf_counter()
+        await asyncio.gather(*(user.run(start + args.duration) for user in users))
+        duration = time.perf_counter() - start
+        for client in clients:
+            await client.close()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    routes = {route: s.summary(duration) for route, s in stats.items()}
+    total = RouteStats()
+    for s in stats.values():
+        total.latencies += s.latencies
+        total.queries += s.queries
+        total.errors += s.errors
+    results = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("serve", "compare", "output")},
+        "traffic_mix": TRAFFIC_MIX,
+        "duration_s": round(duration, 2),
+        "routes": routes,
+        "total": {k: v for k, v in total.summary(duration).items() if k != "statuses"},
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(results, previous)
+    output = args.output or os.path.join(RESULTS_DIR, f"loadtest-{started_at:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000, help="users to seed (and log in as)")
+    parser.add_argument("--matches-per-user", type=int, default=5)
+    parser.add_argument("--messages-per-match", type=int, default=20)
+    parser.add_argument("--no-seed", action="store_true", help="reuse the loadtest_* users from an earlier run")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of traffic")
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for data and traffic")
+    parser.add_argument("--port", type=int, default=8766, help="port for the app started by the load test")
+    parser.add_argument("--base-url", help="load an already running server instead (no query counts)")
+    parser.add_argument("--output", help="results file (default benchmarks/results/loadtest-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        asyncio.run(serve(args.port))
+    else:
+        asyncio.run(run_load(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+from typing import List, Optional, Tuple
+import logging
+import os
+import time
+
+from redis_pool import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Per-user discovery deck: a Redis sorted set of candidate ids scored by their
+# rank, a hash of their distances, and the filter signature it was built for.
+# Served candidates are remembered in a sorted set scored by when they were
+# served, so a rebuild doesn't deal cards the client is still showing; once
+# swiped they are excluded by swipe_exclusions, and unswiped ones come back
+# after DISCOVERY_SERVED_TTL_SECONDS. Paused users are kept in one set that
+# every pop skips, so pausing takes them out of decks already built.
+DISCOVERY_DECK_SIZE = int(os.getenv("DISCOVERY_DECK_SIZE", 200))
+DISCOVERY_DECK_REFILL_THRESHOLD = int(os.getenv("DISCOVERY_DECK_REFILL_THRESHOLD", 30))
+DISCOVERY_DECK_TTL_SECONDS = int(os.getenv("DISCOVERY_DECK_TTL_SECONDS", 3600))
+DISCOVERY_SERVED_TTL_SECONDS = int(os.getenv("DISCOVERY_SERVED_TTL_SECONDS", 1800))
+DISCOVERY_DECK_LOCK_SECONDS = 30
+
+# Pops up to ARGV[2] candidates if the deck was built for signature ARGV[1],
+# dropping paused ones (members of KEYS[5]) and popping more in their place,
+# recording them as served at time ARGV[3] (expiring after ARGV[4] seconds).
+# Returns nil for a missing/stale deck, otherwise {ids, distances, remaining}.
+POP_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return false
+end
+local count = tonumber(ARGV[2])
+local ids = {}
+local paused = {}
+while #ids < count do
+    local popped = redis.call('ZPOPMIN', KEYS[1], count - #ids)
+    if #popped == 0 then
+        break
+    end
+    for i = 1, #popped, 2 do
+        if redis.call('SISMEMBER', KEYS[5], popped[i]) == 1 then
+            paused[#paused + 1] = popped[i]
+        else
+            ids[#ids + 1] = popped[i]
+            redis.call('ZADD', KEYS[4], ARGV[3], popped[i])
+        end
+    end
+end
+if #paused > 0 then
+    redis.call('HDEL', KEYS[3], unpack(paused))
+end
+local distances = {}
+if #ids > 0 then
+    distances = redis.call('HMGET', KEYS[3], unpack(ids))
+    redis.call('HDEL', KEYS[3], unpack(ids))
+    redis.call('EXPIRE', KEYS[4], ARGV[4])
+end
+return {ids, distances, redis.call('ZCARD', KEYS[1])}
+"""
+
+# Replaces the deck with (id, rank, distance) triples from ARGV[4..], leaving
+# out candidates served since ARGV[3], and marks it built for signature
+# ARGV[1] with expiry ARGV[2]. Returns how many candidates were stored.
+STORE_SCRIPT = """
+redis.call('DEL', KEYS[1], KEYS[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', '(' .. ARGV[3])
+local stored = 0
+for i = 4, #ARGV, 3 do
+    if not redis.call('ZSCORE', KEYS[4], ARGV[i]) then
+        redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+        redis.call('HSET', KEYS[3], ARGV[i], ARGV[i + 2])
+        stored = stored + 1
+    end
+end
+if stored > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    redis.call('EXPIRE', KEYS[3], ARGV[2])
+end
+redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[2])
+return stored
+"""
+
+_pop_script = redis_client.register_script(POP_SCRIPT)
+_store_script = redis_client.register_script(STORE_SCRIPT)
+
+PAUSED_KEY = "discover:paused"
+
+def deck_key(user_id: int) -> str:
+    return f"discover:deck:{user_id}"
+
+def deck_signature_key(user_id: int) -> str:
+    return f"discover:deck:{user_id}:sig"
+
+def deck_distances_key(user_id: int) -> str:
+    return f"discover:deck:{user_id}:dist"
+
+def deck_served_key(user_id: int) -> str:
+    return f"discover:deck:{user_id}:served"
+
+def deck_lock_key(user_id: int) -> str:
+    return f"discover:deck:{user_id}:lock"
+
+def deck_signature(ranking: str, age_min: int, age_max: int, max_distance: int, lat: float, lon: float) -> str:
+    """Identify the ranking and filters a deck was built for; any change forces a rebuild"""
+    return f"{ranking}:{age_min}:{age_max}:{max_distance}:{lat:.4f}:{lon:.4f}"
+
+async def pop_candidates(user_id: int, signature: str, count: int) -> Tuple[Optional[List[Tuple[int, float]]], int]:
+    """Pop the best ``count`` candidates as (user_id, distance) pairs.
+
+    Paused candidates are dropped and replaced from further down the deck.
+    Returns ``(None, 0)`` when the deck is missing or was built for other filters.
+    """
+    keys = [deck_key(user_id), deck_signature_key(user_id), deck_distances_key(user_id), deck_served_key(user_id), PAUSED_KEY]
+    result = await _pop_script(keys=keys, args=[signature, count, time.time(), DISCOVERY_SERVED_TTL_SECONDS])
+    if result is None:
+        return None, 0
+    ids, distances, remaining = result
+    candidates = [(int(c), float(d)) for c, d in zip(ids, distances) if d is not None]
+    return candidates, int(remaining)
+
+async def store_deck(user_id: int, signature: str, candidates: List[Tuple[int, float]]):
+    """Replace the user's deck with freshly ranked candidates, best first.
+
+    Candidates served recently are left out, so a refill never deals a card
+    the client is still showing.
+    """
+    keys = [deck_key(user_id), deck_signature_key(user_id), deck_distances_key(user_id), deck_served_key(user_id)]
+    args = [signature, DISCOVERY_DECK_TTL_SECONDS, time.time() - DISCOVERY_SERVED_TTL_SECONDS]
+    for rank, (candidate_id, distance) in enumerate(candidates):
+        args += [candidate_id, rank, distance]
+    await _store_script(keys=keys, args=args)
+
+async def acquire_refill_lock(user_id: int) -> bool:
+    return bool(await redis_client.set(deck_lock_key(user_id), "1", nx=True, ex=DISCOVERY_DECK_LOCK_SECONDS))
+
+async def release_refill_lock(user_id: int):
+    await redis_client.delete(deck_lock_key(user_id))
+
+async def remove_from_deck(user_id: int, *candidate_ids: int):
+    """Drop candidates from a user's deck (after a like, match, ...)"""
+    try:
+        await redis_client.zrem(deck_key(user_id), *[str(c) for c in candidate_ids])
+    except Exception as e:
+        logger.warning(f"Failed to update discovery deck for user {user_id}: {e}")
+
+async def clear_deck(user_id: int):
+    """Forget a user's deck so the next discovery request rebuilds it"""
+    try:
+        await redis_client.delete(deck_key(user_id), deck_signature_key(user_id), deck_distances_key(user_id))
+    except Exception as e:
+        logger.warning(f"Failed to clear discovery deck for user {user_id}: {e}")
+
+async def set_paused(user_id: int, paused: bool):
+    """Mark a user paused (or not) for every deck they are in"""
+    try:
+        if paused:
+            await redis_client.sadd(PAUSED_KEY, user_id)
+        else:
+            await redis_client.srem(PAUSED_KEY, user_id)
+    except Exception as e:
+        logger.warning(f"Failed to update paused discovery users for user {user_id}: {e}")
@@ -0,0 +1,43 @@
+"""List responses rendered by Postgres.
+
+The list endpoints (discovery, matches, chat history) have Postgres render
+each row with json_build_object() and pass the text straight through, instead
+of building a Pydantic model per row and running it through FastAPI's
+jsonable_encoder. The SQL here must keep producing the same shape as
+``model_dump(mode="json")`` of the schema it mirrors; timestamps may differ
+only in trailing fractional zeros and floats in a trailing ".0".
+"""
+import json
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi import Response
+
+def user_json_sql(alias: str = "u", distance_sql: str = None) -> str:
+    """json_build_object() rendering a users row like schemas.user.User"""
+    u = alias
+    return f"""json_build_object(
+        'first_name', {u}.first_name, 'last_name', {u}.last_name, 'email', {u}.email,
+        'birthday', {u}.birthday::timestamp, 'gender', {u}.gender, 'bio', {u}.bio,
+        'interests', {u}.interests,
+        'location', CASE WHEN {u}.latitude <> 0 AND {u}.longitude <> 0 THEN json_build_object(
+            'latitude', {u}.latitude, 'longitude', {u}.longitude, 'city', {u}.city
+        ) END,
+        'id', {u}.id, 'username', {u}.username, 'age', {u}.age, 'photos', {u}.photos,
+        'photo_url', {u}.photo_url, 'distance', {distance_sql or f'{u}.distance'},
+        'is_active', {u}.is_active, 'last_seen', {u}.last_seen, 'created_at', {u}.created_at,
+        'updated_at', {u}.updated_at, 'is_verified', {u}.is_verified,
+        'report_count', {u}.report_count, 'is_premium', {u}.is_premium
+    )"""
+
+def json_array(fragments: Iterable[str]) -> str:
+    return "[" + ",".join(fragments) + "]"
+
+def json_page(items: str, next_cursor: Optional[str], has_more: bool, extra: Optional[Dict[str, Any]] = None) -> str:
+    """Cursor page object around an already-encoded JSON array, plus any
+    small ``extra`` fields (encoded here)"""
+    fields = "".join(f",{json.dumps(key)}:{json.dumps(value)}" for key, value in (extra or {}).items())
+    return f'{{"items":{items},"next_cursor":{json.dumps(next_cursor)},"has_more":{json.dumps(has_more)}{fields}}}'
+
+def json_success(data: str) -> Response:
+    """The usual {"success": true, "data": ...} envelope around encoded JSON"""
+    return Response(content=f'{{"success":true,"data":{data}}}', media_type="application/json")
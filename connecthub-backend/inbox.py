@@ -0,0 +1,92 @@
+"""Per-user conversation inbox.
+
+``inbox`` holds one row per (user, match) with the other participant, a
+snippet of the last message and the user's unread count, ordered by
+``last_activity_at`` (last message, or the match time for new matches). The
+match list is a range scan on (user_id, last_activity_at, match_id) instead of
+an OR over both sides of ``matches`` sorted on a joined column.
+
+Rows are created with the match and updated in the same statement that writes
+chat messages. They also carry the user's delivered/read cursors, which
+read_receipts.py advances.
+"""
+import asyncio
+from typing import List
+
+from database import get_db, init_db_pool, close_db_pool
+
+INBOX_SNIPPET_LENGTH = 120
+
+CREATE_INBOX_ROWS_SQL = """
+    INSERT INTO inbox (user_id, match_id, other_user_id, last_activity_at)
+    SELECT user_id, id, matched_user_id, matched_at FROM matches WHERE id = ANY($1::uuid[])
+    UNION ALL
+    SELECT matched_user_id, id, user_id, matched_at FROM matches WHERE id = ANY($1::uuid[])
+    ON CONFLICT (user_id, match_id) DO NOTHING
+"""
+
+def apply_messages_sql(messages: str) -> str:
+    """UPDATE folding new messages into both participants' inbox rows.
+
+    ``messages`` names a relation with (match_id, from_user_id, text, sent_at)
+    columns, usually a CTE over the rows just inserted, so the inbox is
+    updated in the same statement as the messages themselves.
+    """
+    return f"""
+        UPDATE inbox i SET
+            last_message_text = CASE WHEN i.last_message_at IS NULL OR l.sent_at >= i.last_message_at
+                                     THEN left(l.text, {INBOX_SNIPPET_LENGTH}) ELSE i.last_message_text END,
+            last_message_from_user_id = CASE WHEN i.last_message_at IS NULL OR l.sent_at >= i.last_message_at
+                                             THEN l.from_user_id ELSE i.last_message_from_user_id END,
+            last_message_at = greatest(i.last_message_at, l.sent_at),
+            last_activity_at = greatest(i.last_activity_at, l.sent_at),
+            unread_count = i.unread_count + (
+                SELECT count(*) FROM {messages} x
+                WHERE x.match_id = i.match_id AND x.from_user_id <> i.user_id
+            )
+        FROM (
+            SELECT DISTINCT ON (match_id) match_id, from_user_id, text, sent_at
+            FROM {messages}
+            ORDER BY match_id, sent_at DESC
+        ) l
+        WHERE i.match_id = l.match_id
+    """
+
+# Rebuild inbox rows from matches/messages, for every match or only those
+# whose user_id falls in [$1, $2]. Conversations start out read through their
+# last message.
+REBUILD_SQL = f"""
+    INSERT INTO inbox (user_id, match_id, other_user_id, last_message_text, last_message_from_user_id,
+                       last_message_at, last_activity_at, unread_count,
+                       delivered_through_at, delivered_through_id, read_through_at, read_through_id)
+    SELECT p.user_id, m.id, p.other_user_id, left(msg.text, {INBOX_SNIPPET_LENGTH}), msg.from_user_id,
+           msg.sent_at, coalesce(msg.sent_at, m.matched_at, now()::timestamp), 0,
+           msg.sent_at, msg.id, msg.sent_at, msg.id
+    FROM matches m
+    CROSS JOIN LATERAL (VALUES (m.user_id, m.matched_user_id), (m.matched_user_id, m.user_id)) AS p(user_id, other_user_id)
+    LEFT JOIN messages msg ON msg.match_id = m.id AND msg.id = m.last_message_id
+    WHERE p.user_id IS NOT NULL AND p.other_user_id IS NOT NULL
+          AND ($1::int IS NULL OR m.user_id BETWEEN $1 AND $2)
+    ON CONFLICT (user_id, match_id) DO NOTHING
+"""
+
+async def create_inbox_rows(conn, match_ids: List[str]):
+    """Add new matches to both participants' inboxes"""
+    await conn.execute(CREATE_INBOX_ROWS_SQL, match_ids)
+
+async def rebuild_inbox(conn=None):
+    """Recompute all inbox rows (everything starts out read)"""
+    async with get_db(conn) as conn:
+        await conn.execute("TRUNCATE inbox")
+        await conn.execute(REBUILD_SQL, None, None)
+
+async def _main():
+    await init_db_pool()
+    try:
+        await rebuild_inbox()
+    finally:
+        await close_db_pool()
+
+if __name__ == "__main__":
+    # Backfill existing matches: uv run python inbox.py
+    asyncio.run(_main())
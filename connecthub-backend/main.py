@@ -1,16 +1,32 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from api.routes import users, discovery, matches, chat, settings, auth
 import os
 
 # Load environment variables
 load_dotenv()
 
+from api.routes import users, discovery, matches, chat, settings, auth
+from database import init_db_pool, close_db_pool, get_pool_stats
+from redis_pool import close_redis
+from profile_cache import get_profile_cache_stats
+from auth.passwords import get_password_hashing_stats
+from metrics import render as render_metrics, MetricsMiddleware, PROMETHEUS_CONTENT_TYPE
+from sql_profiler import SQLProfilerMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db_pool()
+    yield
+    await close_db_pool()
+    await close_redis()
+
 app = FastAPI(
     title="ConnectHub Backend API",
     description="Backend API for ConnectHub dating app",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 allowed_origins_list = ["http://127.0.0.1:5173", "http://localhost:5173", "http://localhost:3000", "http://localhost:5174"]
@@ -25,6 +41,12 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+# Per-route latency and status, in-flight requests
+app.add_middleware(MetricsMiddleware)
+
+# Per-request statement log and N+1 detection, off unless switched on
+app.add_middleware(SQLProfilerMiddleware)
+
 
 # Include API routes
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
@@ -40,7 +62,17 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "database": get_pool_stats(),
+        "profile_cache": get_profile_cache_stats(),
+        "password_hashing": get_password_hashing_stats()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,69 @@
+"""Per-process cache of who is in each match, for the chat server.
+
+A match's two participants never change, so room joins and messages can be
+authorized from memory. Entries only expire so that deleted matches (account
+deletion cascades) stop being usable; MATCH_MEMBERS_TTL_SECONDS bounds how
+long that takes on a node. Unknown match ids are cached too, so a client
+replaying a forged id doesn't cost a query per event.
+"""
+import asyncio
+import os
+from typing import Dict, Tuple
+
+from database import get_db
+from metrics import Counter
+from profile_cache import LRUCache
+
+MATCH_MEMBERS_CACHE_SIZE = int(os.getenv("MATCH_MEMBERS_CACHE_SIZE", 100000))
+MATCH_MEMBERS_TTL_SECONDS = float(os.getenv("MATCH_MEMBERS_TTL_SECONDS", 300))
+
+_cache = LRUCache(MATCH_MEMBERS_CACHE_SIZE, MATCH_MEMBERS_TTL_SECONDS)
+# One query per match however many sockets ask at once
+_loading: Dict[str, asyncio.Future] = {}
+
+MATCH_MEMBERS_LOOKUPS = Counter("connecthub_match_members_lookups_total", "Match participant lookups", ["result"])
+
+async def _load(match_id: str, conn=None) -> Tuple[int, ...]:
+    async with get_db(conn) as conn:
+        row = await conn.fetchrow("SELECT user_id, matched_user_id FROM matches WHERE id = $1", match_id)
+    return (row["user_id"], row["matched_user_id"]) if row else ()
+
+async def get_match_participants(match_id: str) -> Tuple[int, ...]:
+    """The match's two user ids, or () if there is no such match.
+
+    ``match_id`` must already be a canonical UUID string.
+    """
+    participants = _cache.get(match_id)
+    if participants is not None:
+        MATCH_MEMBERS_LOOKUPS.labels("hit").inc()
+        return participants
+    MATCH_MEMBERS_LOOKUPS.labels("miss").inc()
+    pending = _loading.get(match_id)
+    if pending is not None:
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled() or asyncio.current_task().cancelling():
+                raise
+        # The loading task was cancelled, not this one: load it ourselves
+        return await get_match_participants(match_id)
+    pending = _loading[match_id] = asyncio.get_running_loop().create_future()
+    try:
+        participants = await _load(match_id)
+    except asyncio.CancelledError:
+        pending.cancel()
+        raise
+    except BaseException as e:
+        pending.set_exception(e)
+        # Waiters re-raise it; don't warn about an unretrieved exception
+        pending.exception()
+        raise
+    else:
+        _cache.set(match_id, participants)
+        pending.set_result(participants)
+        return participants
+    finally:
+        del _loading[match_id]
+
+async def is_participant(match_id: str, user_id: int) -> bool:
+    return user_id in await get_match_participants(match_id)
@@ -0,0 +1,260 @@
+"""Cold storage for conversations nobody has touched in a while.
+
+The retention job moves the messages of every conversation idle for more than
+MESSAGE_ARCHIVE_AFTER_DAYS into one gzip-compressed JSON-lines object per
+match, records it in ``message_archives`` and deletes the rows, so partitions
+and their indexes only hold live conversations. Inbox rows are untouched, so
+the conversation list still shows the last message.
+
+Opening an archived conversation puts its messages back first (see
+``rehydrate``). Archiving drops the match's cached recent page, so the latest
+page only checks ``message_archives`` (by primary key) when that cache misses
+or holds an empty page; other history reads always check. Callers never see
+the difference beyond one slower request. A restored
+conversation counts as active for another idle period, so reading an old chat
+doesn't send it straight back to the archive.
+
+Objects go through an ``ArchiveStore``. ``LocalArchiveStore`` keeps them as
+files under MESSAGE_ARCHIVE_DIR, which every API process must share (a volume
+in docker-compose); an object store client with the same four methods can
+take its place. Objects of deleted matches are removed by the next run.
+
+Run the job from cron or a scheduler::
+
+    uv run python message_archive.py --idle-days 180
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, List, Protocol, Tuple
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+
+from database import get_db, init_db_pool, close_db_pool
+from metrics import Counter
+from recent_messages import drop_recent
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR", "archive")
+MESSAGE_ARCHIVE_AFTER_DAYS = int(os.getenv("MESSAGE_ARCHIVE_AFTER_DAYS", 180))
+# Conversations archived per job run
+MESSAGE_ARCHIVE_BATCH = int(os.getenv("MESSAGE_ARCHIVE_BATCH", 1000))
+# Objects without a message_archives row are only removed once this old, so a
+# run never deletes the object of an archive transaction still committing
+ORPHAN_GRACE_SECONDS = 3600
+
+# Not archived, and not restored since $1
+ARCHIVABLE_SQL = """NOT EXISTS (
+    SELECT 1 FROM message_archives a
+    WHERE a.match_id = i.match_id AND (a.restored_at IS NULL OR a.restored_at >= $1)
+)"""
+
+# Conversations with messages whose participants have both been idle since $1
+IDLE_CONVERSATIONS_SQL = f"""
+    SELECT i.match_id
+    FROM inbox i
+    WHERE i.last_message_at IS NOT NULL AND {ARCHIVABLE_SQL}
+    GROUP BY i.match_id
+    HAVING max(i.last_activity_at) < $1
+    LIMIT $2
+"""
+
+# Locking the match holds off new messages for it (their foreign key check
+# needs a share lock on the row) until the archive or rehydration commits
+LOCK_MATCH_SQL = "SELECT 1 FROM matches WHERE id = $1 FOR UPDATE"
+
+REHYDRATE_SQL = """
+    INSERT INTO messages (id, match_id, from_user_id, text, sent_at, status)
+    SELECT id, $1, from_user_id, text, sent_at, status
+    FROM unnest($2::uuid[], $3::int[], $4::text[], $5::timestamp[], $6::text[])
+         AS a(id, from_user_id, text, sent_at, status)
+    ON CONFLICT DO NOTHING
+"""
+
+MESSAGE_REHYDRATIONS = Counter("connecthub_message_rehydrations_total", "Archived conversations restored on open, by outcome", ["result"])
+
+class ArchiveStore(Protocol):
+    def put(self, key: str, data: bytes): ...
+    def get(self, key: str) -> bytes: ...
+    def delete(self, key: str): ...
+    def list(self) -> Iterator[Tuple[str, float]]: ...
+
+class LocalArchiveStore:
+    """Archive objects as files under a directory.
+
+    Stands in for an object store: whole objects by key, listed with their
+    modification time. Writes go to a temporary file that is renamed into
+    place, so a reader never sees half an object.
+    """
+
+    def __init__(self, root: str = MESSAGE_ARCHIVE_DIR):
+        self.root = Path(root)
+
+    def put(self, key: str, data: bytes):
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(path.name + ".partial")
+        partial.write_bytes(data)
+        os.replace(partial, path)
+
+    def get(self, key: str) -> bytes:
+        return (self.root / key).read_bytes()
+
+    def delete(self, key: str):
+        (self.root / key).unlink(missing_ok=True)
+
+    def list(self) -> Iterator[Tuple[str, float]]:
+        for path in self.root.rglob("*.jsonl.gz"):
+            yield path.relative_to(self.root).as_posix(), path.stat().st_mtime
+
+_store: ArchiveStore = LocalArchiveStore()
+
+def set_archive_store(store: ArchiveStore):
+    global _store
+    _store = store
+
+def archive_key(match_id: str) -> str:
+    return f"messages/{match_id[:2]}/{match_id}.jsonl.gz"
+
+def encode_messages(rows) -> bytes:
+    lines = (json.dumps({
+        "id": row["id"], "from_user_id": row["from_user_id"], "text": row["text"],
+        "sent_at": row["sent_at"].isoformat(), "status": row["status"],
+    }) for row in rows)
+    return gzip.compress("\n".join(lines).encode("utf-8"))
+
+def decode_messages(data: bytes) -> List[dict]:
+    text = gzip.decompress(data).decode("utf-8")
+    return [json.loads(line) for line in text.splitlines() if line]
+
+async def archive_conversation(match_id: str, idle_since: datetime, conn=None) -> int:
+    """Move one conversation's messages to the archive store.
+
+    Returns how many were archived; 0 if it has since become active, is
+    already archived or has no messages.
+    """
+    async with get_db(conn) as conn:
+        if await conn.fetchval(LOCK_MATCH_SQL, match_id) is None:
+            return 0
+        still_idle = await conn.fetchval(f"""
+            SELECT bool_and({ARCHIVABLE_SQL}) AND max(i.last_activity_at) < $1
+            FROM inbox i WHERE i.match_id = $2
+        """, idle_since, match_id)
+        if not still_idle:
+            return 0
+        rows = await conn.fetch("""
+            SELECT id, from_user_id, text, sent_at, status FROM messages
+            WHERE match_id = $1 ORDER BY sent_at, id
+        """, match_id)
+        if not rows:
+            return 0
+        key = archive_key(match_id)
+        data = encode_messages(rows)
+        # Written before the rows go, so a failure here leaves them in place
+        await asyncio.to_thread(_store.put, key, data)
+        await conn.execute("""
+            INSERT INTO message_archives (match_id, object_key, message_count) VALUES ($1, $2, $3)
+            ON CONFLICT (match_id) DO UPDATE SET
+                object_key = excluded.object_key, message_count = excluded.message_count,
+                archived_at = excluded.archived_at, restored_at = NULL
+        """, match_id, key, len(rows))
+        await conn.execute("DELETE FROM messages WHERE match_id = $1", match_id)
+    await drop_recent(match_id)
+    logger.debug(f"Archived {len(rows)} messages of match {match_id} ({len(data)} bytes)")
+    return len(rows)
+
+async def archive_idle_conversations(idle_days: int = MESSAGE_ARCHIVE_AFTER_DAYS,
+                                     limit: int = MESSAGE_ARCHIVE_BATCH) -> Tuple[int, int]:
+    """Archive up to ``limit`` idle conversations; returns (conversations, messages)"""
+    idle_since = datetime.now() - timedelta(days=idle_days)
+    async with get_db() as conn:
+        match_ids = [row["match_id"] for row in await conn.fetch(IDLE_CONVERSATIONS_SQL, idle_since, limit)]
+    conversations = messages = 0
+    for match_id in match_ids:
+        try:
+            archived = await archive_conversation(match_id, idle_since)
+        except Exception as e:
+            logger.error(f"Archiving match {match_id} failed: {e}")
+            continue
+        if archived:
+            conversations += 1
+            messages += archived
+    return conversations, messages
+
+async def rehydrate(match_id: str, conn=None) -> int:
+    """Put an archived conversation's messages back; returns how many.
+
+    Costs one primary key lookup when the conversation isn't archived. A
+    failure is logged and the conversation stays archived, so history
+    requests still serve whatever is live and retry on the next open.
+    """
+    try:
+        async with get_db(conn) as conn:
+            if await conn.fetchval("""
+                SELECT 1 FROM message_archives WHERE match_id = $1 AND restored_at IS NULL
+            """, match_id) is None:
+                return 0
+            await conn.execute(LOCK_MATCH_SQL, match_id)
+            key = await conn.fetchval("""
+                UPDATE message_archives SET restored_at = now()
+                WHERE match_id = $1 AND restored_at IS NULL RETURNING object_key
+            """, match_id)
+            if key is None:
+                # Rehydrated by a concurrent request while we waited for the lock
+                return 0
+            archived = decode_messages(await asyncio.to_thread(_store.get, key))
+            await conn.execute(
+                REHYDRATE_SQL, match_id,
+                [m["id"] for m in archived], [m["from_user_id"] for m in archived],
+                [m["text"] for m in archived], [datetime.fromisoformat(m["sent_at"]) for m in archived],
+                [m["status"] for m in archived],
+            )
+    except Exception as e:
+        MESSAGE_REHYDRATIONS.labels("failed").inc()
+        logger.error(f"Rehydrating match {match_id} failed: {e}")
+        return 0
+    MESSAGE_REHYDRATIONS.labels("restored").inc()
+    await drop_recent(match_id)
+    try:
+        await asyncio.to_thread(_store.delete, key)
+    except Exception as e:
+        logger.warning(f"Could not delete archive object {key}: {e}")
+    logger.info(f"Rehydrated {len(archived)} messages of match {match_id}")
+    return len(archived)
+
+async def purge_orphans(conn=None) -> int:
+    """Delete objects of conversations no longer archived (restored or deleted)"""
+    cutoff = time.time() - ORPHAN_GRACE_SECONDS
+    objects = await asyncio.to_thread(lambda: [key for key, mtime in _store.list() if mtime < cutoff])
+    if not objects:
+        return 0
+    async with get_db(conn) as conn:
+        live = {row["object_key"] for row in await conn.fetch(
+            "SELECT object_key FROM message_archives WHERE object_key = ANY($1::text[]) AND restored_at IS NULL", objects
+        )}
+    orphans = [key for key in objects if key not in live]
+    for key in orphans:
+        await asyncio.to_thread(_store.delete, key)
+    return len(orphans)
+
+async def _main(idle_days: int, limit: int):
+    await init_db_pool()
+    try:
+        conversations, messages = await archive_idle_conversations(idle_days, limit)
+        orphans = await purge_orphans()
+    finally:
+        await close_db_pool()
+    logger.info(f"Archived {messages} messages from {conversations} conversations, removed {orphans} orphaned objects")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Archive idle conversations")
+    parser.add_argument("--idle-days", type=int, default=MESSAGE_ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--limit", type=int, default=MESSAGE_ARCHIVE_BATCH)
+    args = parser.parse_args()
+    asyncio.run(_main(args.idle_days, args.limit))
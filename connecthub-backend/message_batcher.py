@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import get_pool
+from inbox import apply_messages_sql
+from metrics import Counter, HistogramFamily
+from recent_messages import push_recent
+
+logger = logging.getLogger(__name__)
+
+CHAT_BATCH_MAX_SIZE = int(os.getenv("CHAT_BATCH_MAX_SIZE", 100))
+CHAT_BATCH_MAX_DELAY_MS = float(os.getenv("CHAT_BATCH_MAX_DELAY_MS", 5))
+
+# Upper bounds (inclusive) of the batch size / commit latency histograms
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+COMMIT_LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Insert the whole batch, point each match at its newest message and update
+# both participants' inbox rows in a single statement (one round trip, atomic).
+# sent_at comes from the database clock, like messages sent over REST, so
+# history cursors never compare timestamps from two clocks; clock_timestamp()
+# is read row by row, so the batch keeps its submission order.
+INSERT_BATCH_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO messages (id, match_id, from_user_id, text, sent_at)
+        SELECT b.id, b.match_id, b.from_user_id, b.text, clock_timestamp()::timestamp
+        FROM unnest($1::uuid[], $2::uuid[], $3::int[], $4::text[]) AS b(id, match_id, from_user_id, text)
+        RETURNING id, match_id, from_user_id, text, sent_at
+    ), last_messages AS (
+        UPDATE matches m SET last_message_id = l.message_id
+        FROM unnest($5::uuid[], $6::uuid[]) AS l(match_id, message_id)
+        WHERE m.id = l.match_id
+    ), inbox_rows AS (
+        {apply_messages_sql("inserted")}
+    )
+    SELECT id, sent_at FROM inserted
+"""
+
+BATCH_SIZE = HistogramFamily("connecthub_chat_batch_size", "Messages per group commit", buckets=BATCH_SIZE_BUCKETS)
+BATCH_COMMIT_DURATION = HistogramFamily(
+    "connecthub_chat_batch_commit_duration_milliseconds", "Group commit latency", buckets=COMMIT_LATENCY_BUCKETS_MS
+)
+BATCH_FAILURES = Counter("connecthub_chat_batch_failures_total", "Failed group commits")
+
+class MessageBatcher:
+    """Write-behind group commit for chat messages.
+
+    Messages are queued by ``submit`` and written by a single background task
+    once ``max_batch_size`` messages are waiting or ``max_delay_ms`` has passed
+    since the first one. ``submit`` resolves only after the batch commits, so
+    callers can broadcast knowing the message is durable.
+    """
+
+    def __init__(self, max_batch_size: int = CHAT_BATCH_MAX_SIZE, max_delay_ms: float = CHAT_BATCH_MAX_DELAY_MS):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batch_sizes = BATCH_SIZE.labels()
+        self.commit_latency_ms = BATCH_COMMIT_DURATION.labels()
+        self.failed_batches = 0
+
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush pending messages and stop the writer task"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, message: Dict[str, Any]) -> datetime:
+        """Queue a message and wait until it has been committed.
+
+        Returns the message's sent_at, as stored.
+        """
+        if self._task is None:
+            raise RuntimeError("Message batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((message, future))
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self._queue.qsize() if self._queue else 0,
+            "failed_batches": self.failed_batches,
+            "batch_size": self.batch_sizes.snapshot(),
+            "commit_latency_ms": self.commit_latency_ms.snapshot(),
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    item = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        messages = [message for message, _ in batch]
+        start = time.perf_counter()
+        try:
+            await self._write(messages)
+        except Exception as e:
+            self.failed_batches += 1
+            BATCH_FAILURES.inc()
+            logger.error(f"Batch write of {len(messages)} messages failed: {e}")
+            if len(batch) == 1:
+                self._resolve(batch, e)
+                return
+            # Retry one by one so a single bad message does not fail its neighbours
+            for entry in batch:
+                await self._flush([entry])
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.batch_sizes.observe(len(messages))
+        self.commit_latency_ms.observe(elapsed_ms)
+        logger.debug(f"Committed batch of {len(messages)} messages in {elapsed_ms:.2f}ms")
+        # Before resolving, so anyone told about a message can read it back
+        await push_recent(messages)
+        self._resolve(batch)
+
+    @staticmethod
+    def _resolve(batch, error: Optional[Exception] = None):
+        for message, future in batch:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(message["sent_at"])
+            else:
+                future.set_exception(error)
+
+    @staticmethod
+    async def _write(messages: List[Dict[str, Any]]):
+        last_by_match = {}
+        for message in messages:
+            last_by_match[message["match_id"]] = message["id"]
+        rows = await get_pool().fetch(
+            INSERT_BATCH_SQL,
+            [m["id"] for m in messages],
+            [m["match_id"] for m in messages],
+            [m["from_user_id"] for m in messages],
+            [m["text"] for m in messages],
+            list(last_by_match.keys()),
+            list(last_by_match.values()),
+        )
+        sent_at = {str(row["id"]): row["sent_at"] for row in rows}
+        for message in messages:
+            message["sent_at"] = sent_at[str(message["id"])]
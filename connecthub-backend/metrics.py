@@ -0,0 +1,239 @@
+"""In-process metrics with a Prometheus text exposition.
+
+Metric families register themselves on creation and ``render()`` writes all
+of them in the Prometheus text format for a ``/metrics`` endpoint. Updates
+are plain attribute arithmetic on the event loop thread, cheap enough to
+leave on in production.
+"""
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Request/query latency buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    """Fixed-bucket histogram with count/sum/max"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        # First bucket whose upper bound is >= value; the last slot is +Inf
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [str(b) for b in self.buckets] + ["+Inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "avg": round(self.sum / self.count, 3) if self.count else 0,
+            "max": round(self.max, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+class CounterValue:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def get(self) -> float:
+        return self.value
+
+class GaugeValue:
+    def __init__(self):
+        self.value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the value from ``function`` at scrape time instead"""
+        self._function = function
+
+    def get(self) -> float:
+        return self._function() if self._function is not None else self.value
+
+_registry: List["MetricFamily"] = []
+
+class MetricFamily:
+    """A named metric with one child per combination of label values"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        _registry.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Child for these label values (created on first use)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _label_text(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _samples(self, values, child) -> List[str]:
+        return [f"{self.name}{self._label_text(values)} {_format(child.get())}"]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for values, child in list(self._children.items()):
+            lines += self._samples(values, child)
+        return lines
+
+class Counter(MetricFamily):
+    type = "counter"
+
+    def _new_child(self):
+        return CounterValue()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+class Gauge(MetricFamily):
+    type = "gauge"
+
+    def _new_child(self):
+        return GaugeValue()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+class HistogramFamily(MetricFamily):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def _new_child(self):
+        return Histogram(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self, values, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(child.buckets) + ["+Inf"], child.counts):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(f"{self.name}_bucket{self._label_text(values, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {_format(child.sum)}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {child.count}")
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+def render() -> str:
+    """Every registered metric in the Prometheus text format"""
+    lines = []
+    for family in _registry:
+        lines += family.render()
+    return "\n".join(lines) + "\n"
+
+# HTTP instrumentation, shared by the API and the chat server
+
+HTTP_REQUESTS = Counter("connecthub_http_requests_total", "HTTP requests by route and status", ["method", "route", "status"])
+HTTP_REQUEST_DURATION = HistogramFamily("connecthub_http_request_duration_seconds", "HTTP request latency by route", ["method", "route"])
+HTTP_IN_FLIGHT = Gauge("connecthub_http_requests_in_flight", "HTTP requests being handled", ["method"])
+
+def route_template(scope) -> str:
+    """The matched route's path template, e.g. /api/chat/{match_id}/messages.
+
+    Unrouted requests share one label so stray paths can't explode the
+    number of series.
+    """
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    # FastAPI releases that include routers lazily leave the router-relative
+    # path on the route and keep the prefixed one on the effective route
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    return getattr(context, "path", None) or route.path
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        in_flight = HTTP_IN_FLIGHT.labels(method)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            # Routing has filled in scope["route"] and path_params by now
+            route = route_template(scope)
+            HTTP_REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+
+async def metrics_app(scope, receive, send):
+    """Bare ASGI app serving GET /metrics (for non-FastAPI servers)"""
+    if scope["type"] != "http" or scope["path"] != "/metrics":
+        await send({"type": "http.response.start", "status": 404, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"Not Found"})
+        return
+    body = render().encode()
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", PROMETHEUS_CONTENT_TYPE.encode())]})
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,22 @@
+from alembic import op
+from sqlalchemy import text
+
+def create_index_concurrently(name: str, definition: str, unique: bool = False):
+    """CREATE INDEX CONCURRENTLY without blocking writes to the table.
+
+    Runs in an autocommit block, as CONCURRENTLY can't run in a transaction.
+    A failed concurrent build leaves an INVALID index behind that IF NOT
+    EXISTS would skip, so an invalid leftover of the same name is dropped first.
+    """
+    with op.get_context().autocommit_block():
+        invalid = op.get_bind().execute(text("""
+            SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name AND NOT i.indisvalid
+        """), {"name": name}).scalar()
+        if invalid:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        op.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}")
+
+def drop_index_concurrently(name: str):
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,21 @@
+"""Baseline: the schema created by connecthub-infra/init.sql
+
+Databases created before migrations existed already have these tables, so
+this revision does nothing; it is the starting point the rest build on.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    pass
+
+
+def downgrade():
+    pass
@@ -0,0 +1,49 @@
+"""Swipe exclusion bitmaps and the conversation inbox
+
+Both tables are derived data. Backfill them after upgrading:
+
+    uv run python swipe_exclusions.py
+    uv run python inbox.py
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS swipe_exclusions (
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            chunk INTEGER NOT NULL,
+            bits BIT(1024) NOT NULL,
+            PRIMARY KEY (user_id, chunk)
+        )
+    """)
+    # New and empty, so its indexes can be built inline
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS inbox (
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            match_id UUID REFERENCES matches(id) ON DELETE CASCADE,
+            other_user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            last_message_text TEXT,
+            last_message_from_user_id INTEGER,
+            last_message_at TIMESTAMP,
+            last_activity_at TIMESTAMP NOT NULL,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, match_id)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_inbox_user_activity ON inbox (user_id, last_activity_at DESC, match_id DESC)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_inbox_match ON inbox (match_id)")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS inbox")
+    op.execute("DROP TABLE IF EXISTS swipe_exclusions")
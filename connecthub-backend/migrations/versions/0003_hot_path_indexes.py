@@ -0,0 +1,62 @@
+"""Indexes and unique constraints for the hot query paths
+
+Built CONCURRENTLY so a live database keeps taking writes. Duplicate likes
+and settings rows are removed first, since they would make the unique builds
+fail. Duplicate matches own messages, so they are reported instead of
+deleted.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+from sqlalchemy import text
+
+from migrations.helpers import create_index_concurrently, drop_index_concurrently
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    # (name, definition, unique)
+    ("uq_likes_from_to", "likes (from_user_id, to_user_id)", True),
+    ("idx_likes_to_user", "likes (to_user_id)", False),
+    ("uq_matches_pair", "matches (least(user_id, matched_user_id), greatest(user_id, matched_user_id))", True),
+    ("idx_matches_user", "matches (user_id)", False),
+    ("idx_matches_matched_user", "matches (matched_user_id)", False),
+    ("idx_messages_match_sent_at", "messages (match_id, sent_at, id)", False),
+    ("uq_user_settings_user", "user_settings (user_id)", True),
+    ("idx_users_lat_lon", "users (latitude, longitude)", False),
+]
+
+
+def upgrade():
+    op.execute("""
+        DELETE FROM likes a USING likes b
+        WHERE a.from_user_id = b.from_user_id AND a.to_user_id = b.to_user_id
+              AND a.ctid > b.ctid
+    """)
+    # Keep the most recently created settings row per user
+    op.execute("""
+        DELETE FROM user_settings a USING user_settings b
+        WHERE a.user_id = b.user_id AND a.id < b.id
+    """)
+    duplicate_pairs = op.get_bind().execute(text("""
+        SELECT count(*) FROM (
+            SELECT 1 FROM matches
+            GROUP BY least(user_id, matched_user_id), greatest(user_id, matched_user_id)
+            HAVING count(*) > 1
+        ) d
+    """)).scalar()
+    if duplicate_pairs:
+        raise RuntimeError(f"{duplicate_pairs} user pairs have more than one match; merge them before upgrading")
+
+    for name, definition, unique in INDEXES:
+        create_index_concurrently(name, definition, unique)
+
+
+def downgrade():
+    for name, _, _ in reversed(INDEXES):
+        drop_index_concurrently(name)
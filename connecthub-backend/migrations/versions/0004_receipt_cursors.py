@@ -0,0 +1,40 @@
+"""Delivered/read high-water marks on inbox rows
+
+Adding nullable columns only touches the catalog. Conversations with nothing
+unread are marked read through their last message; the rest keep NULL
+cursors until the user next reads them.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    ("delivered_through_at", "TIMESTAMP"),
+    ("delivered_through_id", "UUID"),
+    ("read_through_at", "TIMESTAMP"),
+    ("read_through_id", "UUID"),
+]
+
+
+def upgrade():
+    for name, type_ in COLUMNS:
+        op.execute(f"ALTER TABLE inbox ADD COLUMN IF NOT EXISTS {name} {type_}")
+    op.execute("""
+        UPDATE inbox i SET
+            delivered_through_at = msg.sent_at, delivered_through_id = msg.id,
+            read_through_at = msg.sent_at, read_through_id = msg.id
+        FROM matches m JOIN messages msg ON msg.id = m.last_message_id
+        WHERE m.id = i.match_id AND i.unread_count = 0 AND i.read_through_at IS NULL
+    """)
+
+
+def downgrade():
+    for name, _ in reversed(COLUMNS):
+        op.execute(f"ALTER TABLE inbox DROP COLUMN IF EXISTS {name}")
@@ -0,0 +1,109 @@
+"""Hash-partition messages by match_id, and track archived conversations
+
+Every route query on messages filters on match_id, so with hash partitions
+each one reads a single partition and its slice of idx_messages_match_sent_at,
+and vacuum and the ON DELETE CASCADE from matches work partition by partition.
+
+A partitioned table's unique constraints must include the partition key, so
+the primary key becomes (match_id, id) and matches.last_message_id loses its
+foreign key; the last message is always looked up together with its match.
+Existing rows are copied into the new table while messages is locked, so on a
+large database run this in a maintenance window. Databases created from
+init.sql are already partitioned and only get message_archives.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+MESSAGE_PARTITIONS = 16
+COLUMNS = "id, match_id, from_user_id, text, sent_at, status"
+
+
+def _is_partitioned() -> bool:
+    return op.get_bind().execute(text("""
+        SELECT c.relkind = 'p' FROM pg_class c WHERE c.oid = 'messages'::regclass
+    """)).scalar()
+
+
+def upgrade():
+    if not _is_partitioned():
+        orphans = op.get_bind().execute(text("SELECT count(*) FROM messages WHERE match_id IS NULL")).scalar()
+        if orphans:
+            raise RuntimeError(f"{orphans} messages have no match; delete them before upgrading")
+        op.execute("ALTER TABLE matches DROP CONSTRAINT IF EXISTS matches_last_message_id_fkey")
+        op.execute("LOCK TABLE messages IN ACCESS EXCLUSIVE MODE")
+        op.execute("ALTER TABLE messages RENAME TO messages_unpartitioned")
+        op.execute("ALTER TABLE messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey")
+        op.execute("ALTER INDEX IF EXISTS idx_messages_match_sent_at RENAME TO idx_messages_unpartitioned_match_sent_at")
+        op.execute("""
+            CREATE TABLE messages (
+                id UUID NOT NULL DEFAULT gen_random_uuid(),
+                match_id UUID NOT NULL REFERENCES matches(id) ON DELETE CASCADE,
+                from_user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                text TEXT NOT NULL,
+                sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                status VARCHAR(20) DEFAULT 'sent',
+                PRIMARY KEY (match_id, id)
+            ) PARTITION BY HASH (match_id)
+        """)
+        for remainder in range(MESSAGE_PARTITIONS):
+            op.execute(f"""
+                CREATE TABLE messages_p{remainder:02d} PARTITION OF messages
+                FOR VALUES WITH (MODULUS {MESSAGE_PARTITIONS}, REMAINDER {remainder})
+            """)
+        op.execute(f"INSERT INTO messages ({COLUMNS}) SELECT {COLUMNS} FROM messages_unpartitioned")
+        op.execute("DROP TABLE messages_unpartitioned")
+        # Built after the copy; the new table isn't visible to anyone yet
+        op.execute("CREATE INDEX idx_messages_match_sent_at ON messages (match_id, sent_at, id)")
+
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS message_archives (
+            match_id UUID PRIMARY KEY REFERENCES matches(id) ON DELETE CASCADE,
+            object_key TEXT NOT NULL,
+            message_count INTEGER NOT NULL,
+            archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            restored_at TIMESTAMP
+        )
+    """)
+
+
+def downgrade():
+    archived = op.get_bind().execute(text("SELECT count(*) FROM message_archives WHERE restored_at IS NULL")).scalar()
+    if archived:
+        raise RuntimeError(f"{archived} conversations are archived; rehydrate them before downgrading")
+    op.execute("DROP TABLE message_archives")
+    if not _is_partitioned():
+        return
+    op.execute("LOCK TABLE messages IN ACCESS EXCLUSIVE MODE")
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    op.execute("ALTER TABLE messages_partitioned RENAME CONSTRAINT messages_pkey TO messages_partitioned_pkey")
+    op.execute("ALTER INDEX idx_messages_match_sent_at RENAME TO idx_messages_partitioned_match_sent_at")
+    op.execute("""
+        CREATE TABLE messages (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            match_id UUID REFERENCES matches(id) ON DELETE CASCADE,
+            from_user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            text TEXT NOT NULL,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status VARCHAR(20) DEFAULT 'sent'
+        )
+    """)
+    op.execute(f"INSERT INTO messages ({COLUMNS}) SELECT {COLUMNS} FROM messages_partitioned")
+    op.execute("DROP TABLE messages_partitioned")
+    op.execute("CREATE INDEX idx_messages_match_sent_at ON messages (match_id, sent_at, id)")
+    op.execute("""
+        UPDATE matches m SET last_message_id = NULL
+        WHERE last_message_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM messages WHERE id = m.last_message_id)
+    """)
+    op.execute("""
+        ALTER TABLE matches ADD CONSTRAINT matches_last_message_id_fkey
+        FOREIGN KEY (last_message_id) REFERENCES messages(id) ON DELETE SET NULL
+    """)
@@ -0,0 +1,58 @@
+"""Record passes ("nope" swipes) in their own table
+
+Passes were only ever set as bits in swipe_exclusions, so rebuilding the
+bitmaps from likes and matches brought every passed profile back into
+discovery. They are now stored in ``passes`` as well, and the rebuild reads
+them.
+
+Existing passes are recovered from the bitmaps: every bit that isn't a like
+or a match of the same pair is a pass. Their swipe time is unknown, so they
+get the time of the upgrade.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+EXCLUSION_CHUNK_BITS = 10
+EXCLUSION_CHUNK_SIZE = 1 << EXCLUSION_CHUNK_BITS
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS passes (
+            from_user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            to_user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (from_user_id, to_user_id)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_passes_to_user ON passes (to_user_id)")
+    op.execute(f"""
+        INSERT INTO passes (from_user_id, to_user_id)
+        SELECT se.user_id, t.target_id
+        FROM swipe_exclusions se
+        CROSS JOIN LATERAL (
+            SELECT (se.chunk << {EXCLUSION_CHUNK_BITS}) | i AS target_id
+            FROM generate_series(0, {EXCLUSION_CHUNK_SIZE - 1}) i
+            WHERE get_bit(se.bits, i) = 1
+        ) t
+        JOIN users u ON u.id = t.target_id
+        WHERE NOT EXISTS (SELECT 1 FROM likes l WHERE l.from_user_id = se.user_id AND l.to_user_id = t.target_id)
+              AND NOT EXISTS (
+                  SELECT 1 FROM matches m
+                  WHERE least(m.user_id, m.matched_user_id) = least(se.user_id, t.target_id)
+                        AND greatest(m.user_id, m.matched_user_id) = greatest(se.user_id, t.target_id)
+              )
+        ON CONFLICT DO NOTHING
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS passes")
@@ -0,0 +1,21 @@
+"""Opaque keyset cursors.
+
+A cursor is the (timestamp, id) sort key of the last row a client has seen,
+base64-encoded so clients treat it as a token rather than something to build.
+"""
+import base64
+from datetime import datetime
+from typing import Tuple
+
+def encode_cursor(sort_value: datetime, row_id: str) -> str:
+    raw = f"{sort_value.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        sort_value, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(sort_value), row_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
@@ -0,0 +1,162 @@
+"""Who is online, and when users were last seen.
+
+Every chat connection has an entry in its user's ``presence:{user_id}`` sorted
+set, scored by when it lapses. The chat node owning the socket adds it on
+connect, removes it on disconnect and re-scores all of its connections every
+PRESENCE_HEARTBEAT_SECONDS (Engine.IO's ping/pong already disconnects dead
+sockets, so every local connection is live). A user is online while any entry
+is unlapsed, which covers several tabs, devices and chat nodes per user;
+entries of a crashed node lapse after PRESENCE_TTL_SECONDS.
+
+``users.last_seen`` is collected in memory on the chat node and written every
+PRESENCE_FLUSH_SECONDS in one statement for everyone seen since the last
+flush. Cached profiles (profile_cache.py) catch up when their entry expires.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set
+
+from database import get_db
+from metrics import Counter, Gauge
+from redis_pool import redis_client
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_TTL_SECONDS = int(os.getenv("PRESENCE_TTL_SECONDS", 90))
+PRESENCE_HEARTBEAT_SECONDS = float(os.getenv("PRESENCE_HEARTBEAT_SECONDS", 30))
+PRESENCE_FLUSH_SECONDS = float(os.getenv("PRESENCE_FLUSH_SECONDS", 60))
+
+FLUSH_LAST_SEEN_SQL = """
+    UPDATE users u SET last_seen = s.seen
+    FROM unnest($1::int[], $2::timestamp[]) AS s(id, seen)
+    WHERE u.id = s.id AND (u.last_seen IS NULL OR u.last_seen < s.seen)
+"""
+
+PRESENCE_CONNECTIONS = Gauge("connecthub_presence_connections", "Chat connections tracked by this node")
+LAST_SEEN_WRITES = Counter("connecthub_presence_last_seen_writes_total", "users.last_seen values flushed")
+
+def presence_key(user_id: int) -> str:
+    return f"presence:{user_id}"
+
+async def get_online_users(user_ids: Iterable[int]) -> Set[int]:
+    """The subset of user_ids with a live chat connection, in one round trip.
+
+    Presence only decorates responses, so a Redis failure reports everyone
+    as offline instead of failing the request.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return set()
+    now = time.time()
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zcount(presence_key(user_id), f"({now}", "+inf")
+            counts = await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Presence lookup failed: {e}")
+        return set()
+    return {user_id for user_id, count in zip(user_ids, counts) if count}
+
+class PresenceTracker:
+    """The chat node's side of presence: its connections and pending last_seen"""
+
+    def __init__(self):
+        self._connections: Dict[str, int] = {}
+        self._last_seen: Dict[int, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        PRESENCE_CONNECTIONS.set_function(lambda: len(self._connections))
+
+    async def start(self):
+        if self._task is None:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Take this node's connections offline and write pending last_seen"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for sid, user_id in self._connections.items():
+                    pipe.zrem(presence_key(user_id), sid)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not clear presence on shutdown: {e}")
+        self._connections.clear()
+        await self.flush_last_seen()
+
+    async def connected(self, sid: str, user_id: int):
+        self._connections[sid] = user_id
+        self._last_seen[user_id] = datetime.now()
+        await self._refresh({sid: user_id})
+
+    async def disconnected(self, sid: str):
+        user_id = self._connections.pop(sid, None)
+        if user_id is None:
+            return
+        self._last_seen[user_id] = datetime.now()
+        try:
+            await redis_client.zrem(presence_key(user_id), sid)
+        except Exception as e:
+            logger.warning(f"Could not clear presence for user {user_id}: {e}")
+
+    async def heartbeat(self):
+        """Keep every local connection online and mark its user seen"""
+        now = datetime.now()
+        for user_id in self._connections.values():
+            self._last_seen[user_id] = now
+        await self._refresh(self._connections)
+
+    async def _refresh(self, connections: Dict[str, int]):
+        if not connections:
+            return
+        now = time.time()
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for sid, user_id in connections.items():
+                    key = presence_key(user_id)
+                    pipe.zadd(key, {sid: now + PRESENCE_TTL_SECONDS})
+                    pipe.zremrangebyscore(key, "-inf", now)
+                    pipe.expire(key, PRESENCE_TTL_SECONDS)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Presence refresh of {len(connections)} connections failed: {e}")
+
+    async def flush_last_seen(self, conn=None):
+        if not self._last_seen:
+            return
+        pending, self._last_seen = self._last_seen, {}
+        user_ids = sorted(pending)
+        try:
+            async with get_db(conn) as conn:
+                await conn.execute(FLUSH_LAST_SEEN_SQL, user_ids, [pending[user_id] for user_id in user_ids])
+        except Exception as e:
+            logger.error(f"Flushing last_seen for {len(pending)} users failed: {e}")
+            # Retry with the next flush; anything seen since is newer
+            for user_id, seen in pending.items():
+                self._last_seen.setdefault(user_id, seen)
+            return
+        LAST_SEEN_WRITES.inc(len(user_ids))
+        logger.debug(f"Flushed last_seen for {len(user_ids)} users")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_flush = loop.time() + PRESENCE_FLUSH_SECONDS
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), PRESENCE_HEARTBEAT_SECONDS)
+                return
+            except asyncio.TimeoutError:
+                pass
+            await self.heartbeat()
+            if loop.time() >= next_flush:
+                next_flush = loop.time() + PRESENCE_FLUSH_SECONDS
+                await self.flush_last_seen()
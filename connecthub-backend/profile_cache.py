@@ -0,0 +1,140 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+import logging
+import os
+import time
+
+from redis_pool import redis_client
+from schemas.user import User
+
+logger = logging.getLogger(__name__)
+
+# The local tier is per process and can't see invalidations from other
+# workers, so its TTL bounds how stale a profile can be there
+PROFILE_CACHE_LOCAL_SIZE = int(os.getenv("PROFILE_CACHE_LOCAL_SIZE", 10000))
+PROFILE_CACHE_LOCAL_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_LOCAL_TTL_SECONDS", 10))
+PROFILE_CACHE_REDIS_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_REDIS_TTL_SECONDS", 300))
+# Outlives any read-through that could still be holding an older generation
+PROFILE_GENERATION_TTL_SECONDS = 24 * 3600
+
+# Every invalidation bumps the profile's generation counter. A reader notes
+# the generation before loading the row and only caches it if the counter
+# hasn't moved (a missing counter is generation 0), so a row read before an
+# update commits can't be cached after that update's invalidation.
+SET_IF_CURRENT_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+_set_if_current_script = redis_client.register_script(SET_IF_CURRENT_SCRIPT)
+
+class LRUCache:
+    """Bounded in-process LRU with a per-entry TTL"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+_local = LRUCache(PROFILE_CACHE_LOCAL_SIZE, PROFILE_CACHE_LOCAL_TTL_SECONDS)
+_stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "invalidations": 0}
+# The local tier's counterpart of the generation counters: bumped by every
+# invalidation in this process, so a lookup that overlapped one doesn't fill
+# the local tier
+_local_generation = 0
+
+def profile_key(user_id: int) -> str:
+    return f"profile:{user_id}"
+
+def profile_generation_key(user_id: int) -> str:
+    return f"profile:{user_id}:gen"
+
+async def get_profile(user_id: int, loader: Callable[[int], Awaitable[Optional[User]]]) -> Optional[User]:
+    """Read-through lookup: the local tier, then Redis, then ``loader``.
+
+    Returned models are shared between callers and must not be mutated.
+    """
+    user = _local.get(user_id)
+    if user is not None:
+        _stats["local_hits"] += 1
+        return user
+    local_generation = _local_generation
+    try:
+        data, generation = await redis_client.mget(profile_key(user_id), profile_generation_key(user_id))
+        redis_available = True
+    except Exception as e:
+        logger.warning(f"Profile cache read failed for user {user_id}: {e}")
+        data, generation, redis_available = None, None, False
+    if data is not None:
+        _stats["redis_hits"] += 1
+        user = User.model_validate_json(data)
+    else:
+        _stats["misses"] += 1
+        user = await loader(user_id)
+        if user is None:
+            return None
+        if redis_available:
+            try:
+                await _set_if_current_script(
+                    keys=[profile_key(user_id), profile_generation_key(user_id)],
+                    args=[generation or "0", user.model_dump_json(), PROFILE_CACHE_REDIS_TTL_SECONDS],
+                )
+            except Exception as e:
+                logger.warning(f"Profile cache write failed for user {user_id}: {e}")
+    if _local_generation == local_generation:
+        _local.set(user_id, user)
+    return user
+
+async def invalidate_profile(user_id: int):
+    """Drop a profile from both tiers (after it changed or was deleted).
+
+    Call it after the change commits; lookups already under way won't cache
+    the old row.
+    """
+    global _local_generation
+    _stats["invalidations"] += 1
+    _local_generation += 1
+    _local.pop(user_id)
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(profile_generation_key(user_id))
+            pipe.expire(profile_generation_key(user_id), PROFILE_GENERATION_TTL_SECONDS)
+            pipe.delete(profile_key(user_id))
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Profile cache invalidation failed for user {user_id}: {e}")
+
+def get_profile_cache_stats() -> Dict[str, Any]:
+    lookups = _stats["local_hits"] + _stats["redis_hits"] + _stats["misses"]
+    hits = _stats["local_hits"] + _stats["redis_hits"]
+    return {
+        **_stats,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0,
+        "local_size": len(_local),
+    }
@@ -0,0 +1,179 @@
+"""Delivered/read receipts as per-(user, match) high-water marks.
+
+Each participant's inbox row records the (sent_at, id) of the newest message
+they have received and read in the conversation. A message is delivered or
+read once its recipient's cursor is at or past it, so marking a whole
+conversation read is one row update however many messages it covers, and
+``messages.status`` is never rewritten.
+
+When the read cursor moves, the unread count is recounted from it: the
+messages after the cursor, a range scan on idx_messages_match_sent_at over
+just the unread tail.
+
+Socket.IO receipts arrive far more often than they need writing (every
+message a client scrolls past), so ``ReceiptBatcher`` collects them and moves
+each cursor once per flush interval, to the newest position received.
+
+Committed advances are written through to the cursors cached with each
+match's recent page (recent_messages.py), which renders cached messages.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from database import get_db
+from metrics import Counter
+from recent_messages import push_cursors
+
+logger = logging.getLogger(__name__)
+
+CHAT_RECEIPT_FLUSH_MS = float(os.getenv("CHAT_RECEIPT_FLUSH_MS", 250))
+
+# (match_id, user_id, message_id, read); read=False only marks delivery
+Receipt = Tuple[str, int, str, bool]
+
+# Lock the inbox rows first (in key order, so concurrent flushes can't
+# deadlock). The advance below then starts with a snapshot that includes every
+# message whose unread increment has already landed on the row, and message
+# writes that come later wait and increment after the recount.
+LOCK_ROWS_SQL = """
+    SELECT 1 FROM inbox
+    WHERE (user_id, match_id) IN (SELECT * FROM unnest($1::int[], $2::uuid[]))
+    ORDER BY user_id, match_id
+    FOR UPDATE
+"""
+
+# Move each cursor to the newest requested message, never backwards. A read
+# implies delivery, so every receipt is a delivered candidate. Messages that
+# are not in the named match are ignored.
+ADVANCE_SQL = """
+    WITH requested AS (
+        SELECT r.user_id, r.match_id, r.is_read, m.id AS message_id, m.sent_at
+        FROM unnest($1::int[], $2::uuid[], $3::uuid[], $4::bool[]) AS r(user_id, match_id, message_id, is_read)
+        JOIN messages m ON m.id = r.message_id AND m.match_id = r.match_id
+    ), delivered AS (
+        SELECT DISTINCT ON (q.user_id, q.match_id) q.user_id, q.match_id, q.message_id, q.sent_at
+        FROM requested q JOIN inbox i USING (user_id, match_id)
+        WHERE i.delivered_through_at IS NULL
+              OR (q.sent_at, q.message_id) > (i.delivered_through_at, i.delivered_through_id)
+        ORDER BY q.user_id, q.match_id, q.sent_at DESC, q.message_id DESC
+    ), read AS (
+        SELECT DISTINCT ON (q.user_id, q.match_id) q.user_id, q.match_id, q.message_id, q.sent_at
+        FROM requested q JOIN inbox i USING (user_id, match_id)
+        WHERE q.is_read AND (i.read_through_at IS NULL
+              OR (q.sent_at, q.message_id) > (i.read_through_at, i.read_through_id))
+        ORDER BY q.user_id, q.match_id, q.sent_at DESC, q.message_id DESC
+    )
+    UPDATE inbox i SET
+        delivered_through_at = coalesce(d.sent_at, i.delivered_through_at),
+        delivered_through_id = coalesce(d.message_id, i.delivered_through_id),
+        read_through_at = coalesce(r.sent_at, i.read_through_at),
+        read_through_id = coalesce(r.message_id, i.read_through_id),
+        unread_count = CASE WHEN r.message_id IS NULL THEN i.unread_count ELSE (
+            SELECT count(*) FROM messages x
+            WHERE x.match_id = i.match_id AND x.from_user_id <> i.user_id
+                  AND (x.sent_at, x.id) > (r.sent_at, r.message_id)
+        ) END
+    FROM delivered d FULL JOIN read r USING (user_id, match_id)
+    WHERE i.user_id = coalesce(d.user_id, r.user_id) AND i.match_id = coalesce(d.match_id, r.match_id)
+    RETURNING i.match_id, i.user_id, i.delivered_through_at, i.delivered_through_id,
+              i.read_through_at, i.read_through_id, i.unread_count
+"""
+
+CURSOR_SQL = """
+    SELECT match_id, user_id, delivered_through_at, delivered_through_id,
+           read_through_at, read_through_id, unread_count
+    FROM inbox WHERE user_id = $1 AND match_id = $2
+"""
+
+RECEIPTS_SUBMITTED = Counter("connecthub_chat_receipts_total", "Receipt events received, before coalescing")
+RECEIPT_CURSOR_WRITES = Counter("connecthub_chat_receipt_cursor_writes_total", "Inbox cursors advanced by receipts")
+RECEIPT_FLUSH_FAILURES = Counter("connecthub_chat_receipt_flush_failures_total", "Failed receipt flushes")
+
+async def advance_cursors(receipts: List[Receipt], conn=None):
+    """Apply receipts; returns the inbox rows whose cursors moved.
+
+    The moves are written through to the cache once committed, which with a
+    caller's ``conn`` is left to the caller.
+    """
+    user_ids = [user_id for _, user_id, _, _ in receipts]
+    match_ids = [match_id for match_id, _, _, _ in receipts]
+    owns_transaction = conn is None
+    async with get_db(conn) as conn:
+        await conn.execute(LOCK_ROWS_SQL, user_ids, match_ids)
+        rows = await conn.fetch(
+            ADVANCE_SQL, user_ids, match_ids,
+            [message_id for _, _, message_id, _ in receipts],
+            [read for _, _, _, read in receipts],
+        )
+    if owns_transaction:
+        await push_cursors(rows)
+    return rows
+
+async def get_cursor(user_id: int, match_id: str, conn=None):
+    async with get_db(conn) as conn:
+        return await conn.fetchrow(CURSOR_SQL, user_id, match_id)
+
+class ReceiptBatcher:
+    """Coalesces receipt events into one cursor write per flush interval.
+
+    ``submit`` only records the receipt; the background task writes whatever
+    has accumulated every ``flush_ms`` and hands the moved cursors to
+    ``on_commit`` (to tell the other participant). Receipts are advisory, so a
+    failed flush is logged and dropped: the next receipt for the same
+    conversation carries a position at least as new.
+    """
+
+    def __init__(self, flush_ms: float = CHAT_RECEIPT_FLUSH_MS,
+                 on_commit: Optional[Callable[[list], Awaitable[None]]] = None):
+        self.interval = flush_ms / 1000
+        self.on_commit = on_commit
+        self._pending: Set[Receipt] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    async def start(self):
+        if self._task is None:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write pending receipts and stop the flush task"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    def submit(self, match_id: str, user_id: int, message_id: str, read: bool = True):
+        """Queue a receipt; raises ValueError for malformed ids"""
+        self._pending.add((str(uuid.UUID(match_id)), int(user_id), str(uuid.UUID(message_id)), read))
+        RECEIPTS_SUBMITTED.inc()
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        receipts, self._pending = list(self._pending), set()
+        try:
+            rows = await advance_cursors(receipts)
+        except Exception as e:
+            RECEIPT_FLUSH_FAILURES.inc()
+            logger.error(f"Writing {len(receipts)} receipts failed: {e}")
+            return
+        RECEIPT_CURSOR_WRITES.inc(len(rows))
+        logger.debug(f"Applied {len(receipts)} receipts, {len(rows)} cursors moved")
+        if rows and self.on_commit is not None:
+            try:
+                await self.on_commit(rows)
+            except Exception as e:
+                logger.error(f"Receipt broadcast failed: {e}")
@@ -0,0 +1,299 @@
+"""Hot cache of each match's newest messages, for opening a conversation.
+
+``chat:recent:{match_id}`` is a Redis sorted set of the match's newest
+CHAT_RECENT_SIZE messages, scored by sent_at (in microseconds) so it orders
+like idx_messages_match_sent_at; messages sent in the same microsecond tie-
+break on the member, which starts with the message id. Committed messages are
+written through to it, so the first page of history comes straight from Redis
+and only older pages reach Postgres.
+
+A zero-scored marker member says what the set holds: ``~loading`` while a
+reader fills it from the database, ``~complete`` when it is the whole
+conversation and ``~partial`` once older messages have been trimmed away.
+Messages committed during a load are merged in rather than lost, and nobody
+reads the set until the load finishes. Sets of matches with no new messages
+for CHAT_RECENT_TTL_SECONDS expire.
+
+Rendering a page also needs the participants' receipt cursors
+(read_receipts.py), so ``chat:recent:{match_id}:cursors`` caches those as a
+hash of ``{user_id}:delivered`` / ``{user_id}:read`` positions. Cursors only
+move forward, so every write keeps the newer of the stored and written
+position: a load racing a receipt can't move a cursor back, and receipts
+committed before a load are already in what it read. Advances write through
+as they commit; the hash is only trusted once a load has marked it
+``~loaded``.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import os
+
+from database import get_db
+from metrics import Counter
+from redis_pool import redis_client
+
+logger = logging.getLogger(__name__)
+
+CHAT_RECENT_SIZE = int(os.getenv("CHAT_RECENT_SIZE", 50))
+CHAT_RECENT_TTL_SECONDS = int(os.getenv("CHAT_RECENT_TTL_SECONDS", 3600))
+# How long an abandoned load keeps the set out of use
+CHAT_RECENT_LOAD_SECONDS = 10
+
+LOADING, PARTIAL, COMPLETE = "~loading", "~partial", "~complete"
+
+# (id, from_user_id, sent_at, text, status), as stored in messages
+RecentMessage = Tuple[str, int, datetime, str, str]
+# Rows like inbox's user_id, delivered_through_at/_id, read_through_at/_id
+ReceiptCursors = List[Dict[str, Any]]
+
+CURSORS_LOADED = "~loaded"
+
+# Marks an absent set as loading; returns 1 if this caller should fill it
+BEGIN_LOAD_SCRIPT = f"""
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('ZADD', KEYS[1], 0, '{LOADING}')
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Adds score/member pairs ARGV[4..] and keeps the newest ARGV[1] messages.
+# With a marker in ARGV[3] this finishes a load (and does nothing unless one
+# is under way); without one it is a write-through, skipped while the set is
+# absent because then it would look like the whole conversation.
+STORE_SCRIPT = f"""
+local key = KEYS[1]
+if ARGV[3] ~= '' then
+    if not redis.call('ZSCORE', key, '{LOADING}') then
+        return 0
+    end
+    redis.call('ZREM', key, '{LOADING}')
+    redis.call('ZADD', key, 0, ARGV[3])
+elseif redis.call('EXISTS', key) == 0 then
+    return 0
+end
+for i = 4, #ARGV, 2 do
+    redis.call('ZADD', key, ARGV[i], ARGV[i + 1])
+end
+local excess = redis.call('ZCARD', key) - 1 - tonumber(ARGV[1])
+if excess > 0 then
+    redis.call('ZREMRANGEBYRANK', key, 1, excess)
+    if redis.call('ZREM', key, '{COMPLETE}') == 1 then
+        redis.call('ZADD', key, 0, '{PARTIAL}')
+    end
+end
+if not redis.call('ZSCORE', key, '{LOADING}') then
+    redis.call('EXPIRE', key, ARGV[2])
+end
+return 1
+"""
+
+# Moves cursor fields to the (score, id) positions in ARGV[3..] triples of
+# field, score, id, unless already further on; ARGV[2] non-empty marks the
+# hash loaded. Refreshes the expiry to ARGV[1].
+MERGE_CURSORS_SCRIPT = f"""
+local key = KEYS[1]
+for i = 3, #ARGV, 3 do
+    local score, id = tonumber(ARGV[i + 1]), ARGV[i + 2]
+    local current = redis.call('HGET', key, ARGV[i])
+    local newer = not current
+    if current then
+        local sep = string.find(current, ':', 1, true)
+        local current_score = tonumber(string.sub(current, 1, sep - 1))
+        newer = score > current_score or (score == current_score and id > string.sub(current, sep + 1))
+    end
+    if newer then
+        redis.call('HSET', key, ARGV[i], ARGV[i + 1] .. ':' .. id)
+    end
+end
+if ARGV[2] ~= '' then
+    redis.call('HSET', key, '{CURSORS_LOADED}', 1)
+end
+redis.call('EXPIRE', key, ARGV[1])
+return 1
+"""
+
+_begin_load_script = redis_client.register_script(BEGIN_LOAD_SCRIPT)
+_store_script = redis_client.register_script(STORE_SCRIPT)
+_merge_cursors_script = redis_client.register_script(MERGE_CURSORS_SCRIPT)
+
+RECENT_LOOKUPS = Counter("connecthub_chat_recent_cache_lookups_total", "Latest-page history reads, by whether Redis served them", ["result"])
+RECENT_WRITE_FAILURES = Counter("connecthub_chat_recent_cache_write_failures_total", "Failed write-throughs to the recent message cache")
+RECENT_CURSOR_LOOKUPS = Counter("connecthub_chat_recent_cursor_lookups_total", "Receipt cursor reads for cached pages, by whether Redis served them", ["result"])
+
+_EPOCH = datetime(1970, 1, 1)
+
+def recent_key(match_id: str) -> str:
+    return f"chat:recent:{match_id}"
+
+def cursors_key(match_id: str) -> str:
+    return f"chat:recent:{match_id}:cursors"
+
+def _score(sent_at: datetime) -> int:
+    return (sent_at - _EPOCH) // timedelta(microseconds=1)
+
+def _member(message: RecentMessage) -> str:
+    message_id, from_user_id, sent_at, text, status = message
+    return json.dumps([message_id, from_user_id, sent_at.isoformat(), text, status], separators=(",", ":"))
+
+def _parse(member: str) -> RecentMessage:
+    message_id, from_user_id, sent_at, text, status = json.loads(member)
+    return message_id, from_user_id, datetime.fromisoformat(sent_at), text, status
+
+def _pairs(messages: Iterable[RecentMessage]) -> List[Any]:
+    args = []
+    for message in messages:
+        args += [_score(message[2]), _member(message)]
+    return args
+
+def _cursor_args(rows: ReceiptCursors) -> List[Any]:
+    args = []
+    for row in rows:
+        for kind in ("delivered", "read"):
+            if row[f"{kind}_through_at"] is not None:
+                args += [f"{row['user_id']}:{kind}", _score(row[f"{kind}_through_at"]), str(row[f"{kind}_through_id"])]
+    return args
+
+def _parse_cursors(fields: Dict[str, str]) -> Optional[ReceiptCursors]:
+    if CURSORS_LOADED not in fields:
+        return None
+    by_user: Dict[int, Dict[str, Any]] = {}
+    for field, position in fields.items():
+        if field == CURSORS_LOADED:
+            continue
+        user_id, kind = field.split(":")
+        score, message_id = position.split(":")
+        row = by_user.setdefault(int(user_id), {
+            "user_id": int(user_id), "delivered_through_at": None, "delivered_through_id": None,
+            "read_through_at": None, "read_through_id": None,
+        })
+        row[f"{kind}_through_at"] = _EPOCH + timedelta(microseconds=int(score))
+        row[f"{kind}_through_id"] = message_id
+    return list(by_user.values())
+
+async def read_recent(match_id: str, limit: int) -> Optional[Tuple[List[RecentMessage], bool, Optional[ReceiptCursors]]]:
+    """The newest ``limit`` messages, newest first, whether older ones exist,
+    and the receipt cursors (None if they aren't cached).
+
+    Returns None when the cache can't answer: nothing cached, a load in
+    progress, fewer messages cached than asked for, or Redis unavailable.
+    """
+    key = recent_key(match_id)
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.zrange(key, 0, 0)
+            pipe.zcard(key)
+            pipe.zrevrangebyscore(key, "+inf", "(0", start=0, num=limit)
+            pipe.hgetall(cursors_key(match_id))
+            marker, size, members, cursor_fields = await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Recent message cache read failed for match {match_id}: {e}")
+        marker = None
+    if not marker or marker[0] == LOADING:
+        RECENT_LOOKUPS.labels("miss").inc()
+        return None
+    count = size - 1
+    partial = marker[0] == PARTIAL
+    if len(members) < limit and partial:
+        RECENT_LOOKUPS.labels("miss").inc()
+        return None
+    RECENT_LOOKUPS.labels("hit").inc()
+    cursors = _parse_cursors(cursor_fields)
+    RECENT_CURSOR_LOOKUPS.labels("miss" if cursors is None else "hit").inc()
+    return [_parse(member) for member in members], count > limit or partial, cursors
+
+async def load_recent(match_id: str, conn=None) -> Tuple[List[RecentMessage], bool]:
+    """Read the newest messages from the database and cache them if nobody is.
+
+    Returns them newest first, and whether older ones exist.
+    """
+    key = recent_key(match_id)
+    try:
+        loading = await _begin_load_script(keys=[key], args=[CHAT_RECENT_LOAD_SECONDS])
+    except Exception as e:
+        logger.warning(f"Recent message cache unavailable for match {match_id}: {e}")
+        loading = False
+    async with get_db(conn) as conn:
+        rows = await conn.fetch("""
+            SELECT id, from_user_id, sent_at, text, status FROM messages
+            WHERE match_id = $1 ORDER BY sent_at DESC, id DESC LIMIT $2
+        """, match_id, CHAT_RECENT_SIZE + 1)
+    messages = [tuple(row) for row in rows[:CHAT_RECENT_SIZE]]
+    has_more = len(rows) > CHAT_RECENT_SIZE
+    if loading:
+        try:
+            await _store_script(
+                keys=[key],
+                args=[CHAT_RECENT_SIZE, CHAT_RECENT_TTL_SECONDS, PARTIAL if has_more else COMPLETE, *_pairs(messages)],
+            )
+        except Exception as e:
+            logger.warning(f"Could not cache recent messages for match {match_id}: {e}")
+    return messages, has_more
+
+async def cache_cursors(match_id: str, rows: ReceiptCursors):
+    """Cache a match's receipt cursors as read from the database"""
+    try:
+        await _merge_cursors_script(
+            keys=[cursors_key(match_id)], args=[CHAT_RECENT_TTL_SECONDS, CURSORS_LOADED, *_cursor_args(rows)]
+        )
+    except Exception as e:
+        logger.warning(f"Could not cache receipt cursors for match {match_id}: {e}")
+
+async def push_cursors(rows: ReceiptCursors):
+    """Write committed cursor advances (rows with match_id) through to the cache"""
+    by_match: Dict[str, ReceiptCursors] = {}
+    for row in rows:
+        by_match.setdefault(str(row["match_id"]), []).append(row)
+    if not by_match:
+        return
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for match_id, moved in by_match.items():
+                await _merge_cursors_script(
+                    keys=[cursors_key(match_id)],
+                    args=[CHAT_RECENT_TTL_SECONDS, "", *_cursor_args(moved)],
+                    client=pipe,
+                )
+            await pipe.execute()
+    except Exception as e:
+        RECENT_WRITE_FAILURES.inc()
+        logger.error(f"Receipt cursor write-through failed for {len(by_match)} matches: {e}")
+        # Cursors behind the database would show read messages as unread
+        try:
+            await redis_client.delete(*[cursors_key(match_id) for match_id in by_match])
+        except Exception:
+            pass
+
+async def drop_recent(match_id: str):
+    """Forget a match's cached page, after its messages changed under it"""
+    try:
+        await redis_client.delete(recent_key(match_id), cursors_key(match_id))
+    except Exception as e:
+        logger.warning(f"Could not drop cached messages of match {match_id}: {e}")
+
+async def push_recent(messages: List[Dict[str, Any]]):
+    """Write committed messages through to their matches' cached pages"""
+    by_match: Dict[str, List[RecentMessage]] = {}
+    for m in messages:
+        by_match.setdefault(str(m["match_id"]), []).append(
+            (str(m["id"]), m["from_user_id"], m["sent_at"], m["text"], m.get("status") or "sent")
+        )
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for match_id, recent in by_match.items():
+                await _store_script(
+                    keys=[recent_key(match_id)],
+                    args=[CHAT_RECENT_SIZE, CHAT_RECENT_TTL_SECONDS, "", *_pairs(recent)],
+                    client=pipe,
+                )
+            await pipe.execute()
+    except Exception as e:
+        RECENT_WRITE_FAILURES.inc()
+        logger.error(f"Recent message write-through failed for {len(by_match)} matches: {e}")
+        # A cached page missing these messages must not be served
+        try:
+            await redis_client.delete(*[recent_key(match_id) for match_id in by_match])
+        except Exception:
+            pass
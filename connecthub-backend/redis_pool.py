@@ -0,0 +1,44 @@
+import redis.asyncio as redis
+import os
+import time
+from metrics import HistogramFamily
+
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+
+# Shared async connection pool for everything except the Socket.IO manager
+redis_connection_pool = redis.ConnectionPool(
+    host=os.getenv("REDIS_HOST", "localhost"),
+    port=int(os.getenv("REDIS_PORT", 6379)),
+    db=0,
+    decode_responses=True,
+    max_connections=REDIS_MAX_CONNECTIONS
+)
+
+REDIS_COMMAND_DURATION = HistogramFamily("connecthub_redis_command_duration_seconds", "Redis round-trip latency by command", ["command"])
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_DURATION.labels("PIPELINE").observe(time.perf_counter() - start)
+
+class InstrumentedRedis(redis.Redis):
+    """Records the latency of every command; a pipeline counts as one"""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_DURATION.labels(str(args[0]).upper()).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+redis_client = InstrumentedRedis(connection_pool=redis_connection_pool)
+
+async def close_redis():
+    """Close pooled Redis connections (called from the app lifespan)"""
+    await redis_connection_pool.disconnect()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Literal, Optional
 from datetime import datetime
 
 class ChatMessageBase(BaseModel):
@@ -17,4 +17,8 @@ class ChatMessage(ChatMessageBase):
     status: Optional[str] = "sent"
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ReadReceipt(BaseModel):
+    message_id: str
+    status: Literal["delivered", "read"] = "read"
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 from datetime import datetime
 from .match import Match
 
@@ -24,4 +24,13 @@ class LikeResponse(BaseModel):
     is_match: bool
     match: Optional[Match] = None
     likes_remaining: Optional[int] = None
-    super_likes_remaining: Optional[int] = None
\ No newline at end of file
+    super_likes_remaining: Optional[int] = None
+
+SWIPE_BATCH_MAX_SIZE = 100
+
+class SwipeDecision(BaseModel):
+    target_user_id: int
+    like_type: Literal["like", "super", "nope"] = "like"
+
+class SwipeBatch(BaseModel):
+    decisions: List[SwipeDecision] = Field(..., min_length=1, max_length=SWIPE_BATCH_MAX_SIZE)
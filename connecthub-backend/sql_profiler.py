@@ -0,0 +1,157 @@
+"""Opt-in per-request SQL profiling.
+
+While enabled, every statement run through an ``InstrumentedConnection`` is
+recorded against the current request: normalized text, duration and row
+count. When the request finishes it gets an ``X-SQL-Profile`` summary header
+and one log line listing its statements, with repeated statements (likely
+N+1 loops) and slow ones flagged.
+
+Profiling starts from ``SQL_PROFILE`` and can be flipped on a running fleet
+through Redis, without a restart::
+
+    redis-cli SET debug:sql_profile 1    # on
+    redis-cli SET debug:sql_profile 0    # off
+    redis-cli DEL debug:sql_profile      # back to SQL_PROFILE
+"""
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+import logging
+import os
+import re
+import time
+
+from redis_pool import redis_client
+
+logger = logging.getLogger(__name__)
+
+SQL_PROFILE = os.getenv("SQL_PROFILE", "false").lower() == "true"
+SQL_PROFILE_KEY = os.getenv("SQL_PROFILE_KEY", "debug:sql_profile")
+# How often each process re-reads the Redis toggle
+SQL_PROFILE_REFRESH_SECONDS = float(os.getenv("SQL_PROFILE_REFRESH_SECONDS", 5))
+SQL_PROFILE_SLOW_MS = float(os.getenv("SQL_PROFILE_SLOW_MS", 50))
+# Same statement this many times in one request is reported as N+1
+SQL_PROFILE_REPEAT_THRESHOLD = int(os.getenv("SQL_PROFILE_REPEAT_THRESHOLD", 3))
+
+# asyncpg's Transaction issues these through the connection; they aren't
+# interesting statements
+TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+# ...as does the pool when a connection is released
+POOL_RESET = "SELECT pg_advisory_unlock_all()"
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$.])\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_sql(query: str) -> str:
+    """Statement text with literals replaced by ? and whitespace collapsed"""
+    query = _STRING_LITERAL.sub("?", query)
+    query = _NUMBER_LITERAL.sub("?", query)
+    query = _IN_LIST.sub("(?)", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+class RequestProfile:
+    """Statements run while handling one request"""
+
+    def __init__(self):
+        # (normalized text, duration in ms, rows or None)
+        self.queries: List[Tuple[str, float, Optional[int]]] = []
+
+    def record(self, query: str, duration_ms: float, rows: Optional[int]):
+        self.queries.append((normalize_sql(query), duration_ms, rows))
+
+    def summarize(self) -> List[Dict]:
+        """One entry per distinct statement, in first-seen order"""
+        grouped: Dict[str, Dict] = {}
+        for text, duration_ms, rows in self.queries:
+            entry = grouped.get(text)
+            if entry is None:
+                entry = grouped[text] = {"sql": text, "count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": None}
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            if rows is not None:
+                entry["rows"] = (entry["rows"] or 0) + rows
+        for entry in grouped.values():
+            entry["repeated"] = entry["count"] >= SQL_PROFILE_REPEAT_THRESHOLD
+            entry["slow"] = entry["max_ms"] >= SQL_PROFILE_SLOW_MS
+        return list(grouped.values())
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("sql_profile", default=None)
+
+def is_bookkeeping(query: str) -> bool:
+    """Transaction control or the pool's reset, which no route asked for"""
+    statement = query.lstrip()
+    return statement[:9].upper().startswith(TRANSACTION_CONTROL) or statement.startswith(POOL_RESET)
+
+def record_query(query: str, duration_seconds: float, rows: Optional[int]):
+    """Attach a statement to the request being profiled, if any"""
+    profile = _current.get()
+    if profile is None:
+        return
+    if is_bookkeeping(query):
+        return
+    profile.record(query, duration_seconds * 1000, rows)
+
+_state = {"enabled": SQL_PROFILE, "checked_at": 0.0}
+
+async def profiling_enabled() -> bool:
+    now = time.monotonic()
+    if now - _state["checked_at"] >= SQL_PROFILE_REFRESH_SECONDS:
+        _state["checked_at"] = now
+        try:
+            value = await redis_client.get(SQL_PROFILE_KEY)
+        except Exception as e:
+            logger.warning(f"Could not read SQL profiling toggle: {e}")
+        else:
+            enabled = SQL_PROFILE if value is None else value.lower() in ("1", "true", "on")
+            if enabled != _state["enabled"]:
+                logger.info(f"SQL profiling {'enabled' if enabled else 'disabled'}")
+            _state["enabled"] = enabled
+    return _state["enabled"]
+
+def _header(profile: RequestProfile, entries: List[Dict]) -> str:
+    db_ms = sum(duration for _, duration, _ in profile.queries)
+    repeated = sum(1 for e in entries if e["repeated"])
+    slow = sum(1 for e in entries if e["slow"])
+    return f"queries={len(profile.queries)}; distinct={len(entries)}; db_ms={db_ms:.1f}; repeated={repeated}; slow={slow}"
+
+def _log_report(method: str, path: str, status: int, elapsed_ms: float, profile: RequestProfile):
+    entries = profile.summarize()
+    flagged = any(e["repeated"] or e["slow"] for e in entries)
+    lines = [f"SQL profile {method} {path} {status} in {elapsed_ms:.1f}ms: {_header(profile, entries)}"]
+    for e in entries:
+        flags = " ".join(flag for flag, on in (("[N+1]", e["repeated"]), ("[SLOW]", e["slow"])) if on)
+        rows = "-" if e["rows"] is None else e["rows"]
+        lines.append(f"  {e['count']:>3}x {e['total_ms']:8.2f}ms max {e['max_ms']:7.2f}ms rows {rows:>5}  {e['sql'][:300]} {flags}".rstrip())
+    logger.log(logging.WARNING if flagged else logging.INFO, "\n".join(lines))
+
+class SQLProfilerMiddleware:
+    """ASGI middleware reporting each request's statements while profiling is on"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not await profiling_enabled():
+            return await self.app(scope, receive, send)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_profile(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # Statements still running after the headers go out (streamed
+                # bodies, background tasks) only make it into the log line
+                header = _header(profile, profile.summarize())
+                message["headers"] = list(message.get("headers", [])) + [(b"x-sql-profile", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _current.reset(token)
+            _log_report(scope["method"], scope["path"], status, (time.perf_counter() - start) * 1000, profile)
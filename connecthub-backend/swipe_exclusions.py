@@ -0,0 +1,95 @@
+"""Per-user "already swiped" bitmaps.
+
+Swiped user ids are stored Roaring-style in ``swipe_exclusions``: the high
+bits of a target id pick a row (chunk), the low EXCLUSION_CHUNK_BITS bits
+pick a bit inside that row's fixed-size bitmap. Discovery joins the bitmap
+rows by chunk and tests one bit per candidate, so the exclusion set never
+leaves Postgres.
+"""
+import asyncio
+from typing import Iterable, Tuple
+
+from database import get_db, init_db_pool, close_db_pool
+
+EXCLUSION_CHUNK_BITS = 10
+EXCLUSION_CHUNK_SIZE = 1 << EXCLUSION_CHUNK_BITS  # must match BIT(n) in init.sql
+EXCLUSION_OFFSET_MASK = EXCLUSION_CHUNK_SIZE - 1
+
+# Set-based: offsets landing in the same chunk are OR-ed together first, as
+# ON CONFLICT DO UPDATE can't touch the same row twice in one statement
+ADD_EXCLUSIONS_SQL = f"""
+    INSERT INTO swipe_exclusions (user_id, chunk, bits)
+    SELECT p.user_id, p.target_id >> {EXCLUSION_CHUNK_BITS},
+           bit_or(set_bit(0::bit({EXCLUSION_CHUNK_SIZE}), p.target_id & {EXCLUSION_OFFSET_MASK}, 1))
+    FROM unnest($1::int[], $2::int[]) AS p(user_id, target_id)
+    GROUP BY 1, 2
+    ON CONFLICT (user_id, chunk)
+    DO UPDATE SET bits = swipe_exclusions.bits | EXCLUDED.bits
+"""
+
+# Filter for candidate queries that alias candidates as ``u`` and join
+# exclusion_join() for the swiping user
+EXCLUSION_FILTER_SQL = f"coalesce(get_bit(se.bits, u.id & {EXCLUSION_OFFSET_MASK}), 0) <> 1"
+
+def exclusion_join(user_param: str) -> str:
+    """LEFT JOIN of the swiping user's bitmap row for each candidate's chunk"""
+    return f"""
+        LEFT JOIN swipe_exclusions se
+               ON se.user_id = {user_param} AND se.chunk = u.id >> {EXCLUSION_CHUNK_BITS}
+    """
+
+# Rebuild bitmaps from likes, passes and matches (for both participants)
+REBUILD_SQL = f"""
+    WITH swipes AS (
+        SELECT from_user_id AS user_id, to_user_id AS target_id FROM likes
+        UNION
+        SELECT from_user_id, to_user_id FROM passes
+        UNION
+        SELECT user_id, matched_user_id FROM matches
+        UNION
+        SELECT matched_user_id, user_id FROM matches
+    ), chunks AS (
+        SELECT user_id, target_id >> {EXCLUSION_CHUNK_BITS} AS chunk,
+               array_agg(target_id & {EXCLUSION_OFFSET_MASK}) AS offsets
+        FROM swipes
+        WHERE user_id IS NOT NULL AND target_id IS NOT NULL
+              AND ($1::int IS NULL OR user_id = $1)
+        GROUP BY 1, 2
+    )
+    INSERT INTO swipe_exclusions (user_id, chunk, bits)
+    SELECT c.user_id, c.chunk,
+           (SELECT string_agg(CASE WHEN i = ANY(c.offsets) THEN '1' ELSE '0' END, '' ORDER BY i)
+            FROM generate_series(0, {EXCLUSION_CHUNK_SIZE - 1}) i)::bit({EXCLUSION_CHUNK_SIZE})
+    FROM chunks c
+    ON CONFLICT (user_id, chunk) DO UPDATE SET bits = EXCLUDED.bits
+"""
+
+async def add_exclusions(conn, user_id: int, target_ids: Iterable[int]):
+    """Mark targets as swiped by user_id"""
+    await add_exclusion_pairs(conn, [(user_id, target_id) for target_id in target_ids])
+
+async def add_exclusion_pairs(conn, pairs: Iterable[Tuple[int, int]]):
+    """Mark each (user_id, target_id) pair as swiped, in one statement"""
+    pairs = list(pairs)
+    if pairs:
+        await conn.execute(ADD_EXCLUSIONS_SQL, [p[0] for p in pairs], [p[1] for p in pairs])
+
+async def rebuild_exclusions(user_id: int = None, conn=None):
+    """Recompute bitmaps from likes/passes/matches for one user, or everyone"""
+    async with get_db(conn) as conn:
+        if user_id is None:
+            await conn.execute("TRUNCATE swipe_exclusions")
+        else:
+            await conn.execute("DELETE FROM swipe_exclusions WHERE user_id = $1", user_id)
+        await conn.execute(REBUILD_SQL, user_id)
+
+async def _main():
+    await init_db_pool()
+    try:
+        await rebuild_exclusions()
+    finally:
+        await close_db_pool()
+
+if __name__ == "__main__":
+    # Backfill existing swipes: uv run python swipe_exclusions.py
+    asyncio.run(_main())
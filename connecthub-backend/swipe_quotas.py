@@ -0,0 +1,123 @@
+"""Daily like / super like quotas, enforced in Redis.
+
+Each user has a ``quota:{user_id}:{day}`` hash of likes and super likes used
+that day. One Lua call checks the remaining allowance, takes what is granted
+and reports what is left, so the swipe path costs one Redis round trip and no
+query. Passes ("nope") are never limited.
+
+The hash is only missing on a user's first swipe of the day or after Redis
+lost it; either way it is seeded from today's rows in ``likes`` before the
+grant, so a flushed Redis can't hand out a fresh allowance.
+
+Days are UTC days, the same on every node whatever its local timezone; the
+key and the seed count use the same one. Limits depend on ``users.is_premium``. Quotas fail open: if Redis is
+unavailable swipes go through unmetered rather than failing.
+"""
+from datetime import date, datetime, time, timezone
+from typing import NamedTuple, Optional
+import logging
+import os
+
+from database import get_db
+from redis_pool import redis_client
+
+logger = logging.getLogger(__name__)
+
+SWIPE_QUOTA_FREE_LIKES = int(os.getenv("SWIPE_QUOTA_FREE_LIKES", 100))
+SWIPE_QUOTA_FREE_SUPER_LIKES = int(os.getenv("SWIPE_QUOTA_FREE_SUPER_LIKES", 1))
+SWIPE_QUOTA_PREMIUM_LIKES = int(os.getenv("SWIPE_QUOTA_PREMIUM_LIKES", 1000))
+SWIPE_QUOTA_PREMIUM_SUPER_LIKES = int(os.getenv("SWIPE_QUOTA_PREMIUM_SUPER_LIKES", 5))
+# Outlives the day it counts, with room for clock skew between nodes
+SWIPE_QUOTA_KEY_TTL_SECONDS = 2 * 24 * 3600
+
+# Grants up to ARGV[1] likes and ARGV[2] super likes against limits ARGV[3]
+# and ARGV[4]; negative requests hand allowance back. A missing hash is seeded
+# with used counts ARGV[5]/ARGV[6] (and expiry ARGV[7]) when given, otherwise
+# the script returns false so the caller can count them.
+# Returns {likes granted, super likes granted, likes left, super likes left}.
+CONSUME_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if ARGV[5] == nil then
+        return false
+    end
+    redis.call('HSET', KEYS[1], 'like', ARGV[5], 'super', ARGV[6])
+    redis.call('EXPIRE', KEYS[1], ARGV[7])
+end
+local result = {}
+for i, field in ipairs({'like', 'super'}) do
+    local wanted = tonumber(ARGV[i])
+    local limit = tonumber(ARGV[i + 2])
+    local used = tonumber(redis.call('HGET', KEYS[1], field) or '0')
+    local granted = math.min(wanted, math.max(limit - used, 0))
+    if granted ~= 0 then
+        used = redis.call('HINCRBY', KEYS[1], field, granted)
+    end
+    result[i] = granted
+    result[i + 2] = math.max(limit - used, 0)
+end
+return result
+"""
+
+_consume_script = redis_client.register_script(CONSUME_SCRIPT)
+
+class QuotaGrant(NamedTuple):
+    day: date
+    likes: int
+    super_likes: int
+    likes_remaining: int
+    super_likes_remaining: int
+
+def quota_day() -> date:
+    """Today in UTC"""
+    return datetime.now(timezone.utc).date()
+
+def quota_key(user_id: int, day: date) -> str:
+    return f"quota:{user_id}:{day.isoformat()}"
+
+def quota_limits(is_premium: bool):
+    if is_premium:
+        return SWIPE_QUOTA_PREMIUM_LIKES, SWIPE_QUOTA_PREMIUM_SUPER_LIKES
+    return SWIPE_QUOTA_FREE_LIKES, SWIPE_QUOTA_FREE_SUPER_LIKES
+
+async def count_likes_since(user_id: int, since: datetime, conn=None):
+    """(likes, super likes) the user has sent since ``since`` (timezone-aware)"""
+    async with get_db(conn) as conn:
+        # created_at is a local timestamp in the session's timezone; convert
+        # the bound to it rather than every row to timestamptz
+        row = await conn.fetchrow("""
+            SELECT count(*) FILTER (WHERE type = 'super') AS super_likes,
+                   count(*) FILTER (WHERE type <> 'super') AS likes
+            FROM likes WHERE from_user_id = $1 AND created_at >= $2::timestamptz::timestamp
+        """, user_id, since)
+    return row["likes"], row["super_likes"]
+
+async def consume_swipes(user_id: int, is_premium: bool, likes: int = 0, super_likes: int = 0) -> Optional[QuotaGrant]:
+    """Take up to ``likes``/``super_likes`` from today's allowance.
+
+    Zero requests just report what is left. Returns None when Redis is
+    unavailable, meaning "don't limit".
+    """
+    day = quota_day()
+    key = quota_key(user_id, day)
+    args = [likes, super_likes, *quota_limits(is_premium)]
+    try:
+        result = await _consume_script(keys=[key], args=args)
+        if result is None:
+            used = await count_likes_since(user_id, datetime.combine(day, time.min, timezone.utc))
+            result = await _consume_script(keys=[key], args=args + [*used, SWIPE_QUOTA_KEY_TTL_SECONDS])
+    except Exception as e:
+        logger.warning(f"Swipe quota unavailable for user {user_id}, not limiting: {e}")
+        return None
+    return QuotaGrant(day, *(int(value) for value in result))
+
+async def refund_swipes(user_id: int, grant: QuotaGrant, likes: int = 0, super_likes: int = 0):
+    """Hand back allowance granted for swipes that weren't recorded.
+
+    Never seeds a missing hash: a recount would already leave them out.
+    """
+    if not likes and not super_likes:
+        return
+    try:
+        await _consume_script(keys=[quota_key(user_id, grant.day)], args=[-likes, -super_likes, 0, 0])
+    except Exception as e:
+        logger.warning(f"Swipe quota refund failed for user {user_id}: {e}")
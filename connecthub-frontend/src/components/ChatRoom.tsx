@@ -41,6 +41,11 @@ export default function ChatRoom({ match, onBack, onProfileClick }: ChatRoomProp
         const history = await ChatService.getChatHistory(match.id)
         console.log('ChatRoom: Chat history loaded:', history.length, 'messages')
         setMessages(history)
+        if (history.length > 0) {
+          ChatService.markRead(match.id, history[history.length - 1].id).catch(error =>
+            console.error('ChatRoom: Error marking chat read:', error)
+          )
+        }
       } catch (error) {
         console.error('ChatRoom: Error loading chat history:', error)
       } finally {
@@ -25,8 +25,10 @@ export const useSocketIO = ({ matchId, userId, onMessage }: UseSocketIOProps) =>
     
     const socketUrl = import.meta.env.VITE_CHAT_URL || (typeof window !== 'undefined' ? `wss://${window.location.hostname}/socket.io` : 'wss://your-domain.com/socket.io')
     
+    // The chat server authenticates the handshake with the session_token cookie
     socket.current = io(socketUrl, {
       forceNew: true,
+      withCredentials: true,
       transports: ['websocket', 'polling']
     })
     
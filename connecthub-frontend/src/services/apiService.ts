@@ -99,12 +99,20 @@ class ApiService {
   async getChatHistory(params: ChatHistoryRequest): Promise<ApiResponse<PaginatedResponse<ChatMessage>>> {
     const queryParams = new URLSearchParams({
       ...(params.limit && { limit: params.limit.toString() }),
-      ...(params.before && { before: params.before })
+      ...(params.cursor && { cursor: params.cursor }),
+      ...(params.direction && { direction: params.direction })
     })
     
     return this.request<PaginatedResponse<ChatMessage>>(`/chat/${params.match_id}/messages?${queryParams}`)
   }
 
+  async markChatRead(matchId: string, messageId: string): Promise<ApiResponse<void>> {
+    return this.request<void>(`/chat/${matchId}/read`, {
+      method: 'POST',
+      body: JSON.stringify({ message_id: messageId, status: 'read' })
+    })
+  }
+
   // Settings
   async getSettings(userId: number): Promise<ApiResponse<UserSettings>> {
     return this.request<UserSettings>(`/settings/${userId}`)
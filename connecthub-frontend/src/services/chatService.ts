@@ -16,4 +16,10 @@ export class ChatService {
     }
   }
 
+  // Loading history doesn't mark it read; report the newest message shown
+  static async markRead(match_id: string, message_id: string): Promise<void> {
+    const { apiService } = await import('./apiService')
+    await apiService.markChatRead(match_id, message_id)
+  }
+
 }
\ No newline at end of file
@@ -81,7 +81,8 @@ export interface SendMessageRequest {
 export interface ChatHistoryRequest {
   match_id: string
   limit?: number
-  before?: string
+  cursor?: string
+  direction?: 'older' | 'newer'
 }
 
 // Settings
@@ -12,6 +12,7 @@ export interface Match {
     is_from_current_user: boolean
   }
   is_new_match: boolean
+  unread_count?: number
 }
 
 export interface MatchStatus {
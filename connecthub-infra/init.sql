@@ -1,4 +1,8 @@
 -- Create tables for ConnectHub app
+--
+-- Bootstraps a fresh database with the full current schema. Existing databases
+-- are brought up to date with the Alembic migrations in connecthub-backend
+-- (uv run alembic upgrade head); keep the two in sync.
 
 CREATE TABLE users (
     id SERIAL PRIMARY KEY,
@@ -53,6 +57,14 @@ CREATE TABLE likes (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Passes ("nope" swipes); likes only holds likes and super likes
+CREATE TABLE passes (
+    from_user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    to_user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (from_user_id, to_user_id)
+);
+
 CREATE TABLE matches (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
@@ -61,15 +73,94 @@ CREATE TABLE matches (
     is_new_match BOOLEAN DEFAULT TRUE
 );
 
+-- Hash-partitioned by match, which every chat query filters on. Unique
+-- constraints must include the partition key, so matches.last_message_id
+-- can't be a foreign key.
 CREATE TABLE messages (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-    match_id UUID REFERENCES matches(id) ON DELETE CASCADE,
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    match_id UUID NOT NULL REFERENCES matches(id) ON DELETE CASCADE,
     from_user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
     text TEXT NOT NULL,
     sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    status VARCHAR(20) DEFAULT 'sent'
+    status VARCHAR(20) DEFAULT 'sent',
+    PRIMARY KEY (match_id, id)
+) PARTITION BY HASH (match_id);
+
+DO $$
+BEGIN
+    FOR remainder IN 0..15 LOOP
+        EXECUTE format(
+            'CREATE TABLE messages_p%s PARTITION OF messages FOR VALUES WITH (MODULUS 16, REMAINDER %s)',
+            lpad(remainder::text, 2, '0'), remainder
+        );
+    END LOOP;
+END $$;
+
+ALTER TABLE matches ADD COLUMN last_message_id UUID;
+
+-- Conversations whose messages were moved to archive storage (see
+-- message_archive.py)
+CREATE TABLE message_archives (
+    match_id UUID PRIMARY KEY REFERENCES matches(id) ON DELETE CASCADE,
+    object_key TEXT NOT NULL,
+    message_count INTEGER NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- Set when the messages are put back; the row then only delays re-archiving
+    restored_at TIMESTAMP
+);
+
+-- One like per direction and one match per pair, so swipes can be recorded
+-- idempotently with ON CONFLICT
+CREATE UNIQUE INDEX uq_likes_from_to ON likes (from_user_id, to_user_id);
+CREATE UNIQUE INDEX uq_matches_pair ON matches (least(user_id, matched_user_id), greatest(user_id, matched_user_id));
+CREATE UNIQUE INDEX uq_user_settings_user ON user_settings (user_id);
+
+-- Reverse lookups and ON DELETE CASCADE from users
+CREATE INDEX idx_likes_to_user ON likes (to_user_id);
+CREATE INDEX idx_passes_to_user ON passes (to_user_id);
+CREATE INDEX idx_matches_user ON matches (user_id);
+CREATE INDEX idx_matches_matched_user ON matches (matched_user_id);
+
+-- Keyset pagination of chat history on (sent_at, id) within a match
+CREATE INDEX idx_messages_match_sent_at ON messages (match_id, sent_at, id);
+
+-- Denormalized conversation list: one row per (user, match), kept up to date
+-- by message writes (see inbox.py)
+CREATE TABLE inbox (
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    match_id UUID REFERENCES matches(id) ON DELETE CASCADE,
+    other_user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    last_message_text TEXT,
+    last_message_from_user_id INTEGER,
+    last_message_at TIMESTAMP,
+    last_activity_at TIMESTAMP NOT NULL,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    -- Receipt high-water marks: the (sent_at, id) of the newest message this
+    -- user has received / read in the match (see read_receipts.py)
+    delivered_through_at TIMESTAMP,
+    delivered_through_id UUID,
+    read_through_at TIMESTAMP,
+    read_through_id UUID,
+    PRIMARY KEY (user_id, match_id)
 );
 
--- Add foreign key after both tables exist
-ALTER TABLE matches ADD COLUMN last_message_id UUID REFERENCES messages(id) ON DELETE SET NULL;
+CREATE INDEX idx_inbox_user_activity ON inbox (user_id, last_activity_at DESC, match_id DESC);
+CREATE INDEX idx_inbox_match ON inbox (match_id);
 
+
+-- Discovery bounding-box prefilter (DISCOVERY_GEO_MODE=bbox)
+CREATE INDEX idx_users_lat_lon ON users (latitude, longitude);
+
+-- For DISCOVERY_GEO_MODE=earthdistance use a GiST index instead:
+-- CREATE EXTENSION IF NOT EXISTS cube;
+-- CREATE EXTENSION IF NOT EXISTS earthdistance;
+-- CREATE INDEX idx_users_earth ON users USING gist (ll_to_earth(latitude, longitude));
+
+-- Already-swiped bitmaps for discovery: bit (target_id & 1023) of row
+-- (user_id, target_id >> 10) is set once user_id has liked/passed/matched target_id
+CREATE TABLE swipe_exclusions (
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    chunk INTEGER NOT NULL,
+    bits BIT(1024) NOT NULL,
+    PRIMARY KEY (user_id, chunk)
+);